@@ -15,6 +15,7 @@ If you click away from Railroader:
   → Input automatically PAUSES
   → Console shows: "Railroader NOT focused - Keys PAUSED"
   → Click back to Railroader to resume
+  → Any key still held down is released at once
 
 This prevents keys from interfering with other programs!
 
@@ -65,11 +66,17 @@ Check your exact window title:
 ✓ WHAT HAPPENS WHEN SCRIPT STOPS
 ────────────────────────────────────────────────────────────────────────
 When you press Ctrl+C:
-  ✓ Whistle key ('v') is released (no stuck blowing!)
+  ✓ Every held key is released (no stuck blowing!)
   ✓ Serial connection closes gracefully
   ✓ Console shows "Program stopped safely"
   ✓ All resources cleaned up
 
+Keys are also released automatically when:
+  ✓ A control handler hits an error
+  ✓ The control loop freezes for more than 1 second (watchdog)
+  The dashboard counts the keys that were really stuck - released by the
+  watchdog or found past their release time ("Stuck-key recoveries").
+
 
 ✓ BEST PRACTICES
 ────────────────────────────────────────────────────────────────────────
@@ -95,7 +102,7 @@ Issue: "Can't stop with Ctrl+C"
   → Or close the console window entirely
 
 Issue: "Whistle stuck on after stopping"
-  → Manually press 'v' key to unstick
+  → Manually press the whistle key to unstick ('h', or 'v' in railroader_controller.py)
   → Script should auto-release, but manual backup works
 
 Issue: "Lost control entirely"
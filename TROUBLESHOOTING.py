@@ -34,7 +34,7 @@ STEP 2: Check if it's a Railroader key binding issue
 
 In Railroader game settings, verify these key bindings exist:
 
-   v         = WHISTLE
+   h         = WHISTLE (v for railroader_controller.py)
    b         = BELL
    j         = HEADLIGHT UP
    shift+j   = HEADLIGHT DOWN
@@ -1,15 +1,27 @@
 /***
  * Arduino Sketch Example for Railroader Train Control Panel
- * 
+ *
  * This sketch reads analog and digital inputs and sends formatted data
  * to the Python controller via serial communication.
- * 
+ *
  * Hardware connections:
  * - Analog inputs: A0-A6 for potentiometers (WHISTLE, HEADLIGHT, REVERSER, THROTTLE, BRAKE, IND_BRAKE, etc.)
  * - Digital inputs: D2-D4 for buttons/switches (BELL, CYLINDER)
- * 
- * Serial format sent to Python:
+ *
+ * Raw mode (default) - serial format sent to Python:
  * WHISTLE:512;BELL:1;HEADLIGHT:300;CYLINDER:0;REVERSER:800;THROTTLE:200;TRAINBRAKE:100;INDBRAKE:50
+ *
+ * Step mode (SERIAL_MODE = "steps" in the controller): the controller pushes
+ * its notch tables at connect time and the sketch only sends a line when a
+ * lever changes notch or a switch changes state:
+ * @THROTTLE:7
+ * @BELL:1
+ *
+ * Commands from Python (each answered with OK or ERR ...):
+ * T <CHANNEL> <first index> <threshold> ...   Notch boundaries (ADC value where each notch starts)
+ * H <CHANNEL> <count> <hysteresis>            Number of boundaries, hysteresis in ADC counts
+ * M STEPS / M RAW                              Switch mode
+ * ?                                            Send every channel again
  */
 
 // Pin definitions
@@ -23,23 +35,65 @@ const int CYLINDER_PIN = 2;  // Digital input for toggle switch
 const int BELL_PIN = 3;      // Digital input for button
 
 // Serial communication
-const int BAUD_RATE = 9600;
-const int UPDATE_INTERVAL = 50;  // milliseconds
+const long BAUD_RATE = 9600;
+const unsigned long UPDATE_INTERVAL = 50;  // milliseconds between raw frames
+const unsigned long STEP_INTERVAL = 10;    // milliseconds between samples in step mode (only changes are sent)
+
+// Step mode tables (must match MAX_THRESHOLDS in step_mode.py)
+const int ANALOG_COUNT = 6;
+const int MAX_THRESHOLDS = 48;
+const char* ANALOG_NAMES[ANALOG_COUNT] = {"WHISTLE", "HEADLIGHT", "REVERSER", "THROTTLE", "TRAINBRAKE", "INDBRAKE"};
+const int ANALOG_PINS[ANALOG_COUNT] = {WHISTLE_PIN, HEADLIGHT_PIN, REVERSER_PIN, THROTTLE_PIN, TRAINBRAKE_PIN, INDBRAKE_PIN};
+
+int thresholds[ANALOG_COUNT][MAX_THRESHOLDS];
+byte thresholdCount[ANALOG_COUNT];
+int hysteresis[ANALOG_COUNT];
+int currentStep[ANALOG_COUNT];  // -1 = not sent yet
+int lastBell = -1;
+int lastCylinder = -1;
+bool stepMode = false;
+
+char command[64];
+byte commandLength = 0;
+unsigned long lastSample = 0;
 
 void setup() {
   // Initialize serial communication
   Serial.begin(BAUD_RATE);
-  
+
   // Set pin modes
   pinMode(CYLINDER_PIN, INPUT);
   pinMode(BELL_PIN, INPUT);
-  
+
+  resetSteps();
+
   // Wait for serial monitor to open (optional)
   delay(1000);
   Serial.println("Railroader Controller Ready");
 }
 
 void loop() {
+  // Commands are read every pass, so a table upload never waits on a frame
+  readCommands();
+
+  unsigned long now = millis();
+  if (now - lastSample < (stepMode ? STEP_INTERVAL : UPDATE_INTERVAL)) {
+    return;
+  }
+  lastSample = now;
+
+  if (stepMode) {
+    sendSteps();
+  } else {
+    sendFrame();
+  }
+}
+
+// ============================================================================
+// RAW MODE
+// ============================================================================
+
+void sendFrame() {
   // Read all analog inputs (0-1023)
   int whistle = analogRead(WHISTLE_PIN);
   int headlight = analogRead(HEADLIGHT_PIN);
@@ -47,11 +101,11 @@ void loop() {
   int throttle = analogRead(THROTTLE_PIN);
   int trainBrake = analogRead(TRAINBRAKE_PIN);
   int indBrake = analogRead(INDBRAKE_PIN);
-  
+
   // Read digital inputs (0 or 1)
   int cylinder = digitalRead(CYLINDER_PIN);
   int bell = digitalRead(BELL_PIN);
-  
+
   // Build and send formatted string
   Serial.print("WHISTLE:");
   Serial.print(whistle);
@@ -69,7 +123,152 @@ void loop() {
   Serial.print(trainBrake);
   Serial.print(";INDBRAKE:");
   Serial.println(indBrake);
-  
-  // Wait before next transmission
-  delay(UPDATE_INTERVAL);
+}
+
+// ============================================================================
+// STEP MODE
+// ============================================================================
+
+void sendSteps() {
+  for (int ch = 0; ch < ANALOG_COUNT; ch++) {
+    int step = quantize(ch, analogRead(ANALOG_PINS[ch]));
+    if (step != currentStep[ch]) {
+      currentStep[ch] = step;
+      sendStep(ANALOG_NAMES[ch], step);
+    }
+  }
+
+  // Switches are sent on every change; the controller debounces them
+  int bell = digitalRead(BELL_PIN);
+  if (bell != lastBell) {
+    lastBell = bell;
+    sendStep("BELL", bell);
+  }
+  int cylinder = digitalRead(CYLINDER_PIN);
+  if (cylinder != lastCylinder) {
+    lastCylinder = cylinder;
+    sendStep("CYLINDER", cylinder);
+  }
+}
+
+void sendStep(const char* name, int step) {
+  Serial.print('@');
+  Serial.print(name);
+  Serial.print(':');
+  Serial.println(step);
+}
+
+// Number of notch boundaries at or below value = notch index
+int countBelow(int ch, int value) {
+  int n = 0;
+  while (n < thresholdCount[ch] && thresholds[ch][n] <= value) {
+    n++;
+  }
+  return n;
+}
+
+// Notch for a reading; the lever must pass a boundary by `hysteresis` counts
+// before the notch changes, so a reading sitting on a boundary doesn't flicker
+int quantize(int ch, int value) {
+  int step = currentStep[ch];
+  if (step < 0) {
+    return countBelow(ch, value);
+  }
+  int up = countBelow(ch, value - hysteresis[ch]);
+  if (up > step) {
+    return up;
+  }
+  int down = countBelow(ch, value + hysteresis[ch]);
+  if (down < step) {
+    return down;
+  }
+  return step;
+}
+
+void resetSteps() {
+  for (int ch = 0; ch < ANALOG_COUNT; ch++) {
+    currentStep[ch] = -1;
+  }
+  lastBell = -1;
+  lastCylinder = -1;
+}
+
+// ============================================================================
+// COMMANDS
+// ============================================================================
+
+void readCommands() {
+  while (Serial.available()) {
+    char c = Serial.read();
+    if (c == '\n') {
+      command[commandLength] = '\0';
+      handleCommand(command);
+      commandLength = 0;
+    } else if (c != '\r' && commandLength < sizeof(command) - 1) {
+      command[commandLength++] = c;
+    }
+  }
+}
+
+int channelIndex(const char* name) {
+  for (int ch = 0; ch < ANALOG_COUNT; ch++) {
+    if (name != NULL && strcmp(name, ANALOG_NAMES[ch]) == 0) {
+      return ch;
+    }
+  }
+  return -1;
+}
+
+void handleCommand(char* line) {
+  char* op = strtok(line, " ");
+  if (op == NULL) {
+    return;
+  }
+
+  if (strcmp(op, "T") == 0) {
+    int ch = channelIndex(strtok(NULL, " "));
+    char* start = strtok(NULL, " ");
+    if (ch < 0 || start == NULL) {
+      Serial.println("ERR bad T command");
+      return;
+    }
+    int index = atoi(start);
+    for (char* value = strtok(NULL, " "); value != NULL; value = strtok(NULL, " ")) {
+      if (index < 0 || index >= MAX_THRESHOLDS) {
+        Serial.println("ERR too many thresholds");
+        return;
+      }
+      thresholds[ch][index++] = atoi(value);
+    }
+    Serial.println("OK");
+  } else if (strcmp(op, "H") == 0) {
+    int ch = channelIndex(strtok(NULL, " "));
+    char* count = strtok(NULL, " ");
+    char* hyst = strtok(NULL, " ");
+    if (ch < 0 || count == NULL || hyst == NULL || atoi(count) < 0 || atoi(count) > MAX_THRESHOLDS) {
+      Serial.println("ERR bad H command");
+      return;
+    }
+    thresholdCount[ch] = atoi(count);
+    hysteresis[ch] = atoi(hyst);
+    currentStep[ch] = -1;  // Send it again with the new table
+    Serial.println("OK");
+  } else if (strcmp(op, "M") == 0) {
+    char* mode = strtok(NULL, " ");
+    if (mode != NULL && strcmp(mode, "STEPS") == 0) {
+      stepMode = true;
+      resetSteps();
+    } else if (mode != NULL && strcmp(mode, "RAW") == 0) {
+      stepMode = false;
+    } else {
+      Serial.println("ERR bad mode");
+      return;
+    }
+    Serial.println("OK");
+  } else if (strcmp(op, "?") == 0) {
+    resetSteps();
+    Serial.println("OK");
+  } else {
+    Serial.println("ERR unknown command");
+  }
 }
@@ -0,0 +1,492 @@
+"""
+Benchmark Suite for the Railroader Controller
+Measures the full frame → key pipeline on a plain Linux box (no Arduino, no game)
+
+Input comes from a pseudo-terminal pair (or pyserial's loop://) so the real
+serial code path is exercised; output goes to a RecordingKeyboard. With
+--transport emulator the frames come from firmware_emulator.py, which opens
+its own pty like a plugged-in Arduino.
+
+Usage:
+    python benchmark.py                                  # run, save benchmark_results.json
+    python benchmark.py --output baseline.json           # save a baseline
+    python benchmark.py --compare baseline.json          # run and flag regressions
+    python benchmark.py --compare baseline.json --against results.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+import serial
+
+import metrics
+import realtime
+import railroader_controller_pynput as controller
+from input_sources import SerialSource, SimulationSource
+from key_backends import RecordingKeyboard
+from digital_inputs import DigitalInputs
+from held_keys import REPRESS_GAP
+from simulator import SCENARIOS, ScenarioSimulator, format_frame
+from firmware_emulator import FirmwareEmulator
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+DEFAULT_OUTPUT = "benchmark_results.json"
+INPUT_RATES_HZ = [20, 100, 500]  # End-to-end input rates to test
+E2E_DURATION = 3.0  # Seconds of input per rate
+NOTCH_INTERVAL = 0.25  # Seconds per throttle notch in the end-to-end sweep
+REGRESSION_THRESHOLD = 0.25  # 25% worse than baseline = regression
+JITTER_DURATION = 8.0  # Seconds of control loop per jitter run
+JITTER_HEAP = 300000  # Long-lived objects standing in for a big startup heap (pynput, GUI toolkits, tables)
+JITTER_CHURN = 5000  # Cyclic objects kept alive by the background churn thread (event log, dashboard, metrics)
+
+SAMPLE_FRAME = "WHISTLE:512;BELL:0;HEADLIGHT:512;CYLINDER:0;REVERSER:512;THROTTLE:200;TRAINBRAKE:100;INDBRAKE:50"
+
+HANDLERS = [
+    ('WHISTLE', 'handle_whistle', 512, 900),
+    ('BELL', 'handle_bell', 0, 1),
+    ('HEADLIGHT', 'handle_headlight', 512, 900),
+    ('CYLINDER', 'handle_cylinder_cocks', 0, 1),
+    ('REVERSER', 'handle_reverser', 512, 900),
+    ('THROTTLE', 'handle_throttle', 200, 900),
+    ('TRAINBRAKE', 'handle_train_brake', 100, 900),
+    ('INDBRAKE', 'handle_independent_brake', 50, 900),
+]
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def metric(value, unit, better="lower"):
+    """Build one result entry"""
+    return {"value": value, "unit": unit, "better": better}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def time_calls(func, arg, iterations):
+    """Average seconds per call of func(arg)"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations
+
+
+def wait_keys_up():
+    """
+    Wait until the scheduler released every timed hold and the key can be
+    pressed again (an open-ended hold, like the whistle, is released by its
+    handler)
+    """
+    while any(release_at is not None for _, release_at, _ in list(controller.held_keys.held.values())):
+        time.sleep(0.001)
+    time.sleep(REPRESS_GAP)
+
+
+def reset_state():
+    """Fresh ControlState, digital inputs and recording keyboard"""
+    controller.whistle.stop()
+    controller.held_keys.release_all('reset')
+    controller.held_keys.recoveries.value = 0
+    controller.state = controller.ControlState()
+    # No debounce: the micro benchmarks toggle buttons microseconds apart
+    controller.digital_inputs = DigitalInputs(controller.clock.now)
+    controller.configure_digital_inputs(controller.active_config)
+    for digital in controller.digital_inputs.inputs.values():
+        digital.debounce = 0.0
+    keyboard = RecordingKeyboard()
+    controller.set_keyboard_backend(keyboard)
+    return keyboard
+
+
+# ============================================================================
+# MICRO BENCHMARKS
+# ============================================================================
+
+def bench_parse(iterations=50000):
+    """parse_serial_data throughput"""
+    per_call = time_calls(controller.parse_serial_data, SAMPLE_FRAME, iterations)
+    return {"parse_serial_data.throughput": metric(1.0 / per_call, "frames/s", better="higher")}
+
+
+def bench_handlers(iterations=20000, emit_iterations=6):
+    """
+    Cost of each handler
+    - steady: value unchanged, no key emitted
+    - emit: value alternates so every call emits a key (the hold is released
+      by the scheduler, so it is not part of the call)
+    """
+    results = {}
+    for channel, name, idle_value, active_value in HANDLERS:
+        handler = getattr(controller, name)
+
+        reset_state()
+        for _ in range(2 * controller.MAX_STEPS + 1):
+            handler(idle_value)  # Settle state on the idle value (stepped controls move one notch per call)
+        steady = time_calls(handler, idle_value, iterations)
+        results[f"handler.{channel}.steady"] = metric(steady * 1e6, "us/call")
+
+        reset_state()
+        handler(idle_value)
+        emit = 0.0
+        for i in range(emit_iterations):
+            wait_keys_up()
+            start = time.perf_counter()
+            handler(active_value if i % 2 == 0 else idle_value)
+            emit += time.perf_counter() - start
+        results[f"handler.{channel}.emit"] = metric(emit / emit_iterations * 1e3, "ms/call")
+    return results
+
+
+def bench_handle_controls(iterations=20000):
+    """handle_controls cost for a steady frame (no key emitted)"""
+    reset_state()
+    frame = controller.parse_serial_data(SAMPLE_FRAME)
+    controller.handle_controls(frame)
+    per_frame = time_calls(controller.handle_controls, frame, iterations)
+    return {"handle_controls.steady": metric(per_frame * 1e6, "us/frame")}
+
+
+def bench_instrumentation(iterations=100000):
+    """
+    Cost of one stage timer (perf_counter pair + histogram observe) and the
+    resulting overhead per loop iteration as a share of UPDATE_INTERVAL
+    """
+    hist = metrics.Histogram('bench')
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for _ in range(iterations):
+        t0 = perf_counter()
+        hist.observe(perf_counter() - t0)
+    per_timer = (perf_counter() - start) / iterations
+    timers_per_tick = len(controller.CONTROL_HANDLERS) + 5  # handlers + focus, read, parse, handlers, tick
+    overhead = per_timer * timers_per_tick / controller.UPDATE_INTERVAL
+    return {
+        "metrics.timer_cost": metric(per_timer * 1e9, "ns/timer"),
+        "metrics.loop_overhead": metric(overhead * 100, "% of loop"),
+    }
+
+
+# ============================================================================
+# LOOP JITTER
+# ============================================================================
+
+def bench_loop_jitter(use_realtime, duration=JITTER_DURATION):
+    """
+    Tick-to-tick jitter of control_loop with and without real-time mode
+    A big long-lived heap plus a thread churning cyclic garbage makes full
+    collections slow and frequent, as they are in the real process
+    """
+    reset_state()
+    heap = [{'index': i} for i in range(JITTER_HEAP)]
+    report = realtime.enable(gc_mode='scheduled') if use_realtime else None
+    stop = threading.Event()
+
+    def churn():
+        window = []
+        while not stop.is_set():
+            for _ in range(500):
+                node = {}
+                node['self'] = node  # Only the garbage collector can free it
+                window.append(node)
+            del window[:-JITTER_CHURN]
+            time.sleep(0.005)
+
+    ticks = []
+
+    def focus_check():
+        ticks.append(time.perf_counter())
+        return True
+
+    source = SimulationSource(ScenarioSimulator('mixed', seed=1).frame_now, controller.UPDATE_INTERVAL)
+    churner = threading.Thread(target=churn, daemon=True)
+    loop = threading.Thread(target=controller.control_loop, args=(source, stop, focus_check), daemon=True)
+    try:
+        churner.start()
+        loop.start()
+        time.sleep(duration)
+    finally:
+        stop.set()
+        loop.join(timeout=5)
+        churner.join(timeout=5)
+        realtime.disable()
+        del heap
+        gc.collect()
+
+    periods = sorted(b - a for a, b in zip(ticks, ticks[1:]))
+    median = percentile(periods, 0.5)
+    jitter = sorted(abs(p - median) * 1e3 for p in periods)
+    prefix = f"loop.jitter.{'realtime' if use_realtime else 'default'}"
+    results = {
+        f"{prefix}.p50": metric(percentile(jitter, 0.50), "ms"),
+        f"{prefix}.p99": metric(percentile(jitter, 0.99), "ms"),
+        f"{prefix}.max": metric(jitter[-1], "ms"),
+    }
+    if report is not None:
+        print(f"  (real-time: process {report['process_priority']}, "
+              f"control thread {report['control_thread'].get('priority')})")
+    return results
+
+
+# ============================================================================
+# END-TO-END BENCHMARK
+# ============================================================================
+
+def open_transport(transport):
+    """
+    Open a (writer, serial) pair
+
+    Returns:
+        (write_function, close_function, ser)
+    """
+    if transport == "loop":
+        ser = serial.serial_for_url("loop://", timeout=1)
+        return ser.write, ser.close, ser
+
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    os.set_blocking(master, False)  # A full pty buffer drops frames instead of stalling the writer
+    ser = controller.open_serial_connection(os.ttyname(slave), controller.SERIAL_BAUD)
+
+    def close():
+        ser.close()
+        os.close(slave)
+        os.close(master)
+
+    return (lambda data: os.write(master, data)), close, ser
+
+
+def throttle_value(t):
+    """Throttle sweep 0 → max → 0, one notch per NOTCH_INTERVAL"""
+    steps = controller.MAX_STEPS
+    notch = int(t / NOTCH_INTERVAL) % (2 * steps)
+    if notch > steps:
+        notch = 2 * steps - notch
+    return min(1023, int((notch + 0.5) * 1023 / steps))
+
+
+def bench_end_to_end(rate_hz, duration=E2E_DURATION, transport="pty", scenario=None, seed=1):
+    """
+    Frame → key latency at a given input rate
+    Each frame carries a SEQ channel (ignored by handle_controls) so recorded
+    key events can be matched back to the frame that caused them
+
+    Input is the throttle sweep, or a simulator.py scenario (seeded, so runs
+    stay comparable) when `scenario` is given
+    """
+    keyboard = reset_state()
+    sent_at = {}
+    dropped = []
+    emulator = None
+    if transport == "emulator":
+        def on_drop(seq):
+            sent_at.pop(seq, None)
+            dropped.append(seq)
+        emulator = FirmwareEmulator(rate_hz, scenario or 'mixed', seed, baud=None, boot_delay=0, duration=duration,
+                                    tag=True, on_frame=lambda seq: sent_at.__setitem__(seq, time.perf_counter()),
+                                    on_drop=on_drop)
+        ser = controller.open_serial_connection(emulator.start(), controller.SERIAL_BAUD)
+
+        def close():
+            ser.close()
+            emulator.stop()
+    else:
+        write, close, ser = open_transport(transport)
+    stop = threading.Event()
+    handled = []
+
+    original_handle_controls = controller.handle_controls
+
+    def tagged_handle_controls(data):
+        keyboard.tag = data.get('SEQ')
+        handled.append(keyboard.tag)
+        original_handle_controls(data)
+
+    def writer():
+        if emulator is not None:
+            time.sleep(duration)  # The emulator sends on its own thread
+            return
+        interval = 1.0 / rate_hz
+        sim = ScenarioSimulator(scenario, seed=seed, rate=rate_hz) if scenario else None
+        start = time.perf_counter()
+        seq = 0
+        while not stop.is_set():
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            if sim is not None:
+                line = f"SEQ:{seq};{format_frame(sim.next_frame())}\n"
+            else:
+                line = (f"SEQ:{seq};WHISTLE:512;BELL:0;HEADLIGHT:512;CYLINDER:0;REVERSER:512;"
+                        f"THROTTLE:{throttle_value(now - start)};TRAINBRAKE:0;INDBRAKE:0\n")
+            sent_at[seq] = time.perf_counter()
+            try:
+                write(line.encode('ascii'))
+            except BlockingIOError:
+                del sent_at[seq]
+                dropped.append(seq)
+            seq += 1
+            next_time = start + seq * interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    controller.handle_controls = tagged_handle_controls
+    source = SerialSource(None, None, None, controller.parse_serial_data, ser=ser)
+    loop = threading.Thread(target=controller.control_loop, args=(source, stop, lambda: True), daemon=True)
+    try:
+        loop.start()
+        writer()
+        time.sleep(0.5)  # Let the loop drain what it can
+        stop.set()
+        loop.join(timeout=5)
+    finally:
+        controller.handle_controls = original_handle_controls
+        close()
+
+    latencies = sorted(
+        (t - sent_at[tag]) * 1e3
+        for t, action, key, tag in keyboard.events
+        if action == 'press' and tag in sent_at
+    )
+    prefix = f"e2e.{rate_hz}hz"
+    results = {
+        f"{prefix}.frames_sent": metric(len(sent_at), "frames", better="info"),
+        f"{prefix}.frames_dropped": metric(len(dropped), "frames", better="info"),
+        f"{prefix}.frames_handled": metric(len(handled), "frames", better="higher"),
+        f"{prefix}.keys": metric(len(latencies), "keys", better="info"),
+    }
+    if latencies:
+        results[f"{prefix}.latency_p50"] = metric(percentile(latencies, 0.50), "ms")
+        results[f"{prefix}.latency_p95"] = metric(percentile(latencies, 0.95), "ms")
+        results[f"{prefix}.latency_max"] = metric(latencies[-1], "ms")
+    return results
+
+
+# ============================================================================
+# RESULTS
+# ============================================================================
+
+def run_all(transport="pty", duration=E2E_DURATION, rates=INPUT_RATES_HZ, scenario=None, seed=1):
+    """Run every benchmark and return the results document"""
+    controller.LOG_KEYS = False
+    controller.DEBUG_MODE = False
+
+    results = {}
+    print("Benchmarking parse_serial_data...")
+    results.update(bench_parse())
+    print("Benchmarking handlers...")
+    results.update(bench_handlers())
+    print("Benchmarking handle_controls...")
+    results.update(bench_handle_controls())
+    print("Benchmarking instrumentation overhead...")
+    results.update(bench_instrumentation())
+    for use_realtime in (False, True):
+        print(f"Benchmarking loop jitter ({'real-time mode' if use_realtime else 'default'})...")
+        results.update(bench_loop_jitter(use_realtime))
+    for rate in rates:
+        print(f"Benchmarking end-to-end at {rate} Hz ({transport}, {scenario or 'sweep'})...")
+        results.update(bench_end_to_end(rate, duration, transport, scenario, seed))
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": f"{platform.system()} {platform.release()}",
+            "transport": transport,
+            "scenario": scenario or "sweep",
+            "seed": seed,
+            "update_interval": controller.UPDATE_INTERVAL,
+        },
+        "metrics": results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare two results documents
+
+    Returns:
+        List of (name, baseline_value, current_value, change) regressions
+    """
+    regressions = []
+    for name, entry in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if base is None or entry["better"] not in ("lower", "higher"):
+            continue
+        old, new = base["value"], entry["value"]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = change > threshold if entry["better"] == "lower" else change < -threshold
+        if worse:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def print_results(results):
+    """Print a results document as a table"""
+    print()
+    print("=" * 70)
+    print("BENCHMARK RESULTS")
+    print("=" * 70)
+    for name, entry in results["metrics"].items():
+        print(f"  {name:40} {entry['value']:>14.3f} {entry['unit']}")
+    print("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Railroader controller benchmark suite")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to save results (JSON)")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline JSON to compare against")
+    parser.add_argument("--against", metavar="RESULTS", help="Compare this saved results file instead of running")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Allowed relative slowdown")
+    parser.add_argument("--transport", choices=["pty", "loop", "emulator"], default="pty" if os.name == "posix" else "loop")
+    parser.add_argument("--duration", type=float, default=E2E_DURATION, help="Seconds of input per rate")
+    parser.add_argument("--rates", type=int, nargs="+", default=INPUT_RATES_HZ, help="End-to-end input rates (Hz)")
+    parser.add_argument("--scenario", choices=SCENARIOS, help="Drive end-to-end runs with a simulator scenario")
+    parser.add_argument("--seed", type=int, default=1, help="Simulator seed")
+    args = parser.parse_args()
+
+    if args.against:
+        with open(args.against) as f:
+            results = json.load(f)
+    else:
+        results = run_all(args.transport, args.duration, args.rates, args.scenario, args.seed)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print_results(results)
+        print(f"✓ Results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        print()
+        if regressions:
+            print(f"✗ {len(regressions)} regression(s) against {args.compare}:")
+            for name, old, new, change in regressions:
+                print(f"  {name:40} {old:>12.3f} → {new:>12.3f} ({change:+.0%})")
+            sys.exit(1)
+        print(f"✓ No regressions against {args.compare} (threshold {args.threshold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
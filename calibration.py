@@ -0,0 +1,433 @@
+"""
+Per-channel lever calibration
+Real pots never reach exactly 0 or 1023, a centered lever doesn't rest at
+exactly 512 and every pot jitters by its own amount. The calibration keeps,
+per analog channel, the range the pot really covers (min / max), where a
+centered lever rests (center: whistle and reverser) and its noise floor
+(how far the reading moves from one frame to the next while the lever
+stands still). config.py compiles it into the lookup tables:
+
+- each table is stretched over min … max, inset by the noise, so every notch
+  is reachable with the lever against its stop
+- whistle and reverser deadzones are NOISE_MARGIN × the noise (at least
+  MIN_DEADZONE) around the calibrated center, instead of a fixed width
+- a notch only changes once the reading is more than the noise past its
+  boundary, so jitter on a boundary sends no keys
+
+Two ways to fill it in:
+
+- online: with CALIBRATE_ONLINE the control loop hands every frame to a
+  Calibrator (allocation-free, test_allocations.py runs with it on); a
+  CalibrationCompiler rebuilds the tables in the background when it learns
+  something new, the loop swaps them in between ticks, and the result is
+  saved to CALIBRATION_FILE on exit
+- guided: leave the levers at rest, sweep them, center them again
+
+    python calibration.py                   # INPUT_SOURCE / SERIAL_PORT from the controller
+    python calibration.py --port COM4
+
+CALIBRATION_FILE is TOML, one table per channel (keys may be missing):
+
+    [THROTTLE]
+    min = 14
+    max = 1009
+    noise = 3
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import tomllib
+from collections import namedtuple
+
+from config import ADC_MAX, CompiledConfig
+
+CHANNELS = ('WHISTLE', 'HEADLIGHT', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE')
+CENTERED_CHANNELS = ('WHISTLE', 'REVERSER')
+REST_BAND = 24  # A lever whose reading stays within this many counts is at rest
+REST_FRAMES = 40  # Frames a lever must rest before its jitter counts as noise (at most 256: cached ints)
+CENTER_LOW, CENTER_HIGH = 312, 712  # A centered lever resting in here sets its center
+MIN_SPAN = 512  # Counts a lever must have covered before its range is used
+# Online, an end further than this from 0 / 1023 is more likely a lever not yet
+# pushed to its stop than a pot that stops short (the guided run trusts any end)
+END_GAP = 64
+
+# Guided run: (prompt, seconds)
+PHASES = (
+    ("Leave every lever where it is (whistle and reverser centered)", 5.0),
+    ("Move every lever slowly from one stop to the other and back, twice", 15.0),
+    ("Return the whistle and reverser to center and let go", 5.0),
+)
+
+# min / max: range covered, center: rest position (centered levers), noise: jitter at rest;
+# None = not known yet
+ChannelRange = namedtuple('ChannelRange', 'min max center noise')
+
+
+class Calibrator:
+    """
+    Learns every channel's range, center and noise from the frames it sees
+    observe() runs in the control loop; `changed` tells the loop when
+    ranges() has something new.
+    """
+    def __init__(self, saved=None, end_gap=END_GAP):
+        """
+        Args:
+            saved: Channel → ChannelRange to start from (a loaded CALIBRATION_FILE;
+                its ends are trusted wherever they are)
+            end_gap: Counts from 0 / 1023 within which a learned end is used
+        """
+        saved = saved or {}
+        self.end_gap = end_gap
+        self.saved = dict(saved)
+        self.enabled = True
+        self.changed = False
+        self.low, self.high, self.noise = {}, {}, {}
+        self.rest_low, self.rest_high = {}, {}  # Last centered rest window (its middle is the center)
+        # Current rest window: lowest / highest reading, largest frame-to-frame step, frames
+        self.window_low, self.window_high, self.window_step, self.window_frames = {}, {}, {}, {}
+        self.last = {}
+        for channel in CHANNELS:
+            entry = saved.get(channel, ChannelRange(None, None, None, None))
+            self.low[channel] = ADC_MAX if entry.min is None else entry.min
+            self.high[channel] = 0 if entry.max is None else entry.max
+            self.noise[channel] = entry.noise
+            self.rest_low[channel] = entry.center
+            self.rest_high[channel] = entry.center
+            self.window_low[channel] = ADC_MAX
+            self.window_high[channel] = 0
+            self.window_step[channel] = 0
+            self.window_frames[channel] = 0
+            self.last[channel] = None
+
+    def observe(self, channel, value):
+        """
+        Learn from one reading (every frame, every channel; allocates nothing
+        while the lever stands still)
+        """
+        if not self.enabled or channel not in self.low:
+            return
+        last = self.last[channel]
+        self.last[channel] = value
+        if last is None:
+            return
+        # A new extreme counts once two frames in a row reach past the old one
+        # (a single-frame spike would leave the end notch out of reach again)
+        low = self.low[channel]
+        if value < low and last < low:
+            self.low[channel] = value if value > last else last
+            self.changed = True
+        high = self.high[channel]
+        if value > high and last > high:
+            self.high[channel] = value if value < last else last
+            self.changed = True
+
+        step = value - last if value > last else last - value
+        low = self.window_low[channel]
+        high = self.window_high[channel]
+        if value < low:
+            low = value
+        if value > high:
+            high = value
+        if high - low > REST_BAND:
+            # Moving: start a new rest window here
+            self.window_low[channel] = value
+            self.window_high[channel] = value
+            self.window_step[channel] = 0
+            self.window_frames[channel] = 0
+            return
+        self.window_low[channel] = low
+        self.window_high[channel] = high
+        if step > self.window_step[channel]:
+            self.window_step[channel] = step
+        frames = self.window_frames[channel] + 1
+        if frames < REST_FRAMES:
+            self.window_frames[channel] = frames
+            return
+        self._rested(channel, low, high)
+
+    def _rested(self, channel, low, high):
+        """A full rest window: its largest step is a noise sample, its middle a center"""
+        # Frame-to-frame steps rather than the window's spread: a lever eased
+        # slowly towards a notch spreads the window without jittering. The noise
+        # follows the samples one count per window (up when above, down when two
+        # below), which settles on their median: a window that caught the end
+        # of a movement moves it by one count, not to its own value
+        step = self.window_step[channel]
+        noise = self.noise[channel]
+        if noise is None:
+            self.noise[channel] = step
+            self.changed = True
+        elif step > noise:
+            self.noise[channel] = noise + 1
+            self.changed = True
+        elif step < noise - 1:
+            self.noise[channel] = noise - 1
+            self.changed = True
+        if channel in CENTERED_CHANNELS and CENTER_LOW <= low and high <= CENTER_HIGH:
+            rest_low = self.rest_low[channel]
+            # Follows drift, but a window overlapping the last one is the same rest position
+            # (compared, not averaged: the middle of two ADC values is a new int every time)
+            if rest_low is None or low > self.rest_high[channel] or high < rest_low:
+                self.rest_low[channel] = low
+                self.rest_high[channel] = high
+                self.changed = True
+        self.window_low[channel] = ADC_MAX
+        self.window_high[channel] = 0
+        self.window_step[channel] = 0
+        self.window_frames[channel] = 0
+
+    def ranges(self):
+        """
+        What is known so far
+
+        Returns:
+            Channel → ChannelRange, for channels with anything known
+        """
+        ranges = {}
+        for channel in CHANNELS:
+            low, high = self.low[channel], self.high[channel]
+            saved = self.saved.get(channel)
+            # Saved ends are used as they are (and widened when the lever goes further);
+            # learned ones once the lever covered MIN_SPAN and reached near the end
+            spanned = high - low >= MIN_SPAN
+            if not ((saved is not None and saved.min is not None) or (spanned and low <= self.end_gap)):
+                low = None
+            if not ((saved is not None and saved.max is not None) or (spanned and high >= ADC_MAX - self.end_gap)):
+                high = None
+            rest_low = self.rest_low[channel]
+            entry = ChannelRange(low, high,
+                                 None if rest_low is None else (rest_low + self.rest_high[channel]) // 2,
+                                 self.noise[channel])
+            if entry != (None, None, None, None):
+                ranges[channel] = entry
+        return ranges
+
+
+class CalibrationCompiler:
+    """
+    Rebuilds the tables from what a Calibrator learned, on a background thread
+    (a compile takes longer than a tick). A new config is parked in `pending`
+    until the control loop calls take(), like ConfigWatcher's.
+    """
+    def __init__(self, calibrator, current, interval=2.0):
+        """
+        Args:
+            calibrator: Calibrator the control loop feeds
+            current: Callable returning the CompiledConfig in use
+            interval: Seconds between rebuilds while the calibrator learns
+        """
+        self.calibrator = calibrator
+        self.current = current
+        self.interval = interval
+        self.pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name="calibration", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def take(self):
+        """Return the pending config (or None) and clear it"""
+        with self._lock:
+            compiled, self.pending = self.pending, None
+        return compiled
+
+    def check(self):
+        """
+        Compile the config in use with the calibrator's ranges if it learned
+        something (the thread calls this every `interval`)
+
+        Returns:
+            True if a new config is pending
+        """
+        if not self.calibrator.changed:
+            return False
+        self.calibrator.changed = False
+        current = self.current()
+        ranges = self.calibrator.ranges()
+        if ranges == current.calibration:
+            return False
+        compiled = CompiledConfig(current.settings, ranges)
+        with self._lock:
+            self.pending = compiled
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+
+# ============================================================================
+# CALIBRATION FILE
+# ============================================================================
+
+def load(path):
+    """
+    Read a calibration file
+
+    Returns:
+        Channel → ChannelRange
+
+    Raises:
+        OSError: File cannot be read
+        ValueError: Invalid TOML or entry
+    """
+    with open(path, 'rb') as f:
+        try:
+            data = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(f"invalid TOML: {e}")
+    ranges = {}
+    for channel, values in data.items():
+        if channel not in CHANNELS:
+            raise ValueError(f"unknown channel [{channel}]")
+        if not isinstance(values, dict):
+            raise ValueError(f"[{channel}] must be a table")
+        for key, value in values.items():
+            if key not in ChannelRange._fields:
+                raise ValueError(f"unknown setting {channel}.{key}")
+            if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= ADC_MAX:
+                raise ValueError(f"{channel}.{key} must be an integer between 0 and {ADC_MAX}, got {value!r}")
+        entry = ChannelRange(*(values.get(field) for field in ChannelRange._fields))
+        if entry.min is not None and entry.max is not None and entry.max - entry.min < 1:
+            raise ValueError(f"{channel}: max must be above min")
+        ranges[channel] = entry
+    return ranges
+
+
+def save(path, ranges):
+    """
+    Write a calibration file (replaced in one step, so a crash never leaves half a file)
+
+    Args:
+        path: File path
+        ranges: Channel → ChannelRange
+    """
+    lines = ["# Lever calibration - written by the controller (python calibration.py to redo it)", ""]
+    for channel in CHANNELS:
+        entry = ranges.get(channel)
+        if entry is None:
+            continue
+        lines.append(f"[{channel}]")
+        lines.extend(f"{field} = {value}" for field, value in zip(ChannelRange._fields, entry) if value is not None)
+        lines.append("")
+    temp = f"{path}.tmp"
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines))
+    os.replace(temp, path)
+
+
+def merge(old, new):
+    """`new`, with the fields it doesn't know taken from `old` (either may be None)"""
+    if old is None or new is None:
+        return new or old
+    return ChannelRange(*(b if b is not None else a for a, b in zip(old, new)))
+
+
+def describe(entry):
+    """One line for reports"""
+    parts = [f"range {entry.min} … {entry.max}" if entry.min is not None else "range not covered"]
+    if entry.center is not None:
+        parts.append(f"center {entry.center}")
+    parts.append(f"noise ±{entry.noise}" if entry.noise is not None else "noise unknown (never at rest)")
+    return ", ".join(parts)
+
+
+# ============================================================================
+# GUIDED CALIBRATION
+# ============================================================================
+
+def run_guided(source, poll_interval, phases=PHASES):
+    """
+    Prompt through the calibration phases, learning from every frame
+
+    Args:
+        source: Opened InputSource delivering raw ADC values
+        poll_interval: Seconds between polls
+        phases: (prompt, seconds) pairs
+
+    Returns:
+        Channel → ChannelRange learned
+    """
+    calibrator = Calibrator(end_gap=ADC_MAX)
+    for number, (prompt, seconds) in enumerate(phases, 1):
+        print(f"\n[{number}/{len(phases)}] {prompt}")
+        end = time.monotonic() + seconds
+        while (left := end - time.monotonic()) > 0:
+            frame = source.poll()
+            if frame:
+                for channel in CHANNELS:
+                    if channel in frame:
+                        calibrator.observe(channel, frame[channel])
+            print(f"  {left:4.1f}s  " + "  ".join(f"{channel}={calibrator.last[channel]}" for channel in CHANNELS
+                                                   if calibrator.last[channel] is not None) + "   ", end='\r')
+            time.sleep(poll_interval)
+        print()
+    return calibrator.ranges()
+
+
+def main():
+    import railroader_controller_pynput as controller
+
+    parser = argparse.ArgumentParser(description="Guided lever calibration")
+    parser.add_argument('--source', default=controller.INPUT_SOURCE, help="Input source (default: INPUT_SOURCE)")
+    parser.add_argument('--port', help="Serial port (default: SERIAL_PORT)")
+    parser.add_argument('--output', default=controller.CALIBRATION_FILE, help="Calibration file to write")
+    args = parser.parse_args()
+
+    if args.port:
+        controller.SERIAL_PORT = args.port
+    controller.SERIAL_MODE = "raw"  # Step mode only sends notch numbers, not readings
+    print("=" * 70)
+    print("LEVER CALIBRATION")
+    print("=" * 70)
+    try:
+        source = controller.create_input_source(args.source)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+    if not source.open():
+        print(f"✗ Failed to open input source '{args.source}'")
+        return 1
+    try:
+        learned = run_guided(source, controller.UPDATE_INTERVAL)
+    except KeyboardInterrupt:
+        print("\n✗ Calibration cancelled - nothing saved")
+        return 1
+    finally:
+        source.close()
+
+    try:
+        ranges = load(args.output)
+    except FileNotFoundError:
+        ranges = {}
+    except (OSError, ValueError) as e:
+        print(f"⚠ {args.output}: {e} - replacing it")
+        ranges = {}
+    print()
+    complete = True
+    for channel in CHANNELS:
+        entry = learned.get(channel)
+        if entry is None:
+            print(f"  ✗ {channel:<11} no readings" + (" - keeping the saved values" if channel in ranges else ""))
+            complete = False
+            continue
+        ok = entry.min is not None and entry.noise is not None
+        complete = complete and ok
+        print(f"  {'✓' if ok else '⚠'} {channel:<11} {describe(entry)}")
+        ranges[channel] = merge(ranges.get(channel), entry)
+    save(args.output, ranges)
+    print(f"\n✓ Saved to {args.output} (the controller picks it up on its next start)")
+    if not complete:
+        print("⚠ Some levers were not fully calibrated - run again and sweep them from stop to stop")
+    return 0 if complete else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Clocks for timed code in the Railroader controller
+
+RealClock     Wall time from time.perf_counter(), with precise sleeps
+VirtualClock  Simulated time that jumps forward instead of sleeping, so a
+              ten-minute schedule runs in milliseconds (tests, validation)
+
+Both have the same methods:
+
+    now()                 Current time in seconds (only differences are meaningful)
+    sleep(seconds)        Return `seconds` later
+    sleep_until(deadline) Return once now() >= deadline
+
+Code that only reads the time takes a `clock` callable (clock.now);
+code that waits takes the clock object.
+
+A VirtualClock can drive TimerSchedulers too (attach()): sleeping runs every
+timer that falls due on the way, at its exact time, on the sleeping thread.
+The controller's loop, key timing and scheduler then run as fast as the CPU
+allows and produce the same key timeline as in real time (see set_clock()
+in railroader_controller_pynput.py and test_control_timeline.py).
+"""
+
+import math
+import time
+
+SPIN_MARGIN = 0.002  # Seconds before a deadline to stop sleeping and busy-wait (OS sleep is coarse)
+
+
+class RealClock:
+    """Wall clock; sleeps most of the way, then spins for sub-millisecond accuracy"""
+    def __init__(self, spin_margin=SPIN_MARGIN):
+        self.spin_margin = spin_margin
+
+    def now(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        self.sleep_until(time.perf_counter() + seconds)
+
+    def sleep_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin_margin:
+            time.sleep(remaining - self.spin_margin)
+        while time.perf_counter() < deadline:
+            pass
+
+
+class VirtualClock:
+    """Simulated clock: sleeping advances time instantly (single-threaded use)"""
+    def __init__(self, start=0.0):
+        self.time = start
+        self.schedulers = []
+
+    def attach(self, scheduler):
+        """
+        Run a scheduler's timers whenever this clock moves forward
+
+        Args:
+            scheduler: TimerScheduler using this clock's now(), with threaded=False
+        """
+        self.schedulers.append(scheduler)
+
+    def now(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.sleep_until(self.time + max(0.0, seconds))
+
+    def sleep_until(self, deadline):
+        self._run_timers(deadline)
+        if deadline > self.time:
+            self.time = deadline
+        self._run_timers(self.time)
+
+    def advance(self, seconds):
+        """Move time forward (for tests driving code that only reads now())"""
+        self.sleep(seconds)
+
+    def _run_timers(self, deadline):
+        """Step from timer to timer up to `deadline`, running each at its own time"""
+        while self.schedulers:
+            waits = [wait for wait in (s.run_pending(self.time) for s in self.schedulers) if wait is not None]
+            if not waits or self.time + min(waits) > deadline:
+                return
+            # Never stand still: a wait below float resolution still moves time on
+            self.time = max(self.time + min(waits), math.nextafter(self.time, math.inf))
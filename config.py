@@ -0,0 +1,404 @@
+"""
+External configuration for the Railroader controller
+
+Settings can be overridden in a TOML file (railroader_config.toml). The file
+is validated and compiled into lookup tables (ADC value → step/zone for
+every control) plus key bindings. ConfigWatcher reloads it in the
+background when it changes. The control loop picks the new config up
+between ticks, so a reload never interrupts a tick and never resets the
+positions we assume the game is in.
+
+Anything not in the file keeps the value from the controller's
+CONFIGURATION section. Per-channel lever calibration (calibration.py) is
+compiled in as well: it stretches each table over the range the pot really
+covers and sizes deadzones and notch hysteresis from its noise.
+"""
+
+import functools
+import math
+import os
+import threading
+import tomllib
+
+from held_keys import WATCHDOG_TIMEOUT
+from whistle import WHISTLE_MODES
+
+ADC_MAX = 1023
+INPUT_SOURCES = ('simulation', 'serial', 'panels', 'udp', 'replay', 'pty')
+SERIAL_MODES = ('raw', 'steps')
+# The loop's heartbeat comes once per tick: keep a tick well inside the watchdog's
+# timeout, or a slow interval would have it release held keys while all is well
+MAX_UPDATE_INTERVAL = WATCHDOG_TIMEOUT / 4
+
+# section → key → (type, minimum, maximum) ; for str, minimum is a tuple of allowed values or None
+SCHEMA = {
+    'loop': {
+        'update_interval': (float, 0.001, MAX_UPDATE_INTERVAL),
+    },
+    'input': {
+        'source': (str, INPUT_SOURCES, None),
+        'serial_port': (str, None, None),
+        'serial_baud': (int, 300, 2000000),
+        'serial_mode': (str, SERIAL_MODES, None),
+        'step_hysteresis': (int, 0, 100),
+        'serial_process': (bool, None, None),
+    },
+    'controls': {
+        'max_steps': (int, 1, 100),
+        'notch_hold': (float, 0.0, 1.0),
+        'whistle_center': (int, 0, ADC_MAX),
+        'whistle_deadzone': (int, 0, 511),
+        'whistle_mode': (str, WHISTLE_MODES, None),
+        'whistle_pulse_rate': (float, 1.0, 20.0),
+        'whistle_min_duty': (float, 0.0, 1.0),
+        'reverser_center': (int, 0, ADC_MAX),
+        'reverser_deadzone': (int, 0, 511),
+        'headlight_positions': (int, 2, 9),
+    },
+    'digital': {
+        'debounce': (float, 0.0, 0.5),
+        'bell_repeat_delay': (float, 0.0, 5.0),
+        'bell_repeat_rate': (float, 0.0, 50.0),
+    },
+    'keys': {
+        'whistle': (str, None, None),
+        'bell': (str, None, None),
+        'headlight': (str, None, None),
+        'cylinder': (str, None, None),
+        'reverser_forward': (str, None, None),
+        'reverser_backward': (str, None, None),
+        'throttle_up': (str, None, None),
+        'throttle_down': (str, None, None),
+        'train_brake_up': (str, None, None),
+        'train_brake_down': (str, None, None),
+        'ind_brake_up': (str, None, None),
+        'ind_brake_down': (str, None, None),
+    },
+    'calibration': {
+        'online': (bool, None, None),
+        'noise_margin': (float, 1.0, 10.0),
+        'min_deadzone': (int, 0, 511),
+    },
+    'prediction': {
+        'throttle_lead': (float, 0.0, 1.0),
+        'train_brake_lead': (float, 0.0, 1.0),
+        'ind_brake_lead': (float, 0.0, 1.0),
+        'reverser_lead': (float, 0.0, 1.0),
+        'max_ahead': (int, 1, 20),
+        'min_speed': (float, 0.0, 10000.0),
+    },
+    'logging': {
+        'log_keys': (bool, None, None),
+        'debug': (bool, None, None),
+    },
+}
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def merge_settings(base, overrides):
+    """
+    Validate `overrides` (parsed file) and lay it over `base`
+
+    Args:
+        base: Complete settings dict, section → key → value
+        overrides: Partial settings dict from the file
+
+    Returns:
+        New complete settings dict
+
+    Raises:
+        ValueError: Naming the first invalid setting
+    """
+    merged = {section: dict(values) for section, values in base.items()}
+    for section, values in overrides.items():
+        if section not in SCHEMA:
+            raise ValueError(f"unknown section [{section}]")
+        if not isinstance(values, dict):
+            raise ValueError(f"[{section}] must be a table")
+        for key, value in values.items():
+            if key not in SCHEMA[section]:
+                raise ValueError(f"unknown setting {section}.{key}")
+            merged[section][key] = _check(f"{section}.{key}", value, *SCHEMA[section][key])
+    _check_keys(merged['keys'])
+    return merged
+
+
+def _check_keys(keys):
+    """Every binding is one key the game can tell apart from the others (diagnostics.py reports the same)"""
+    bound = {}
+    for binding, key in keys.items():
+        if len(key) != 1:
+            raise ValueError(f"keys.{binding} must be a single key, got {key!r}")
+        other = bound.setdefault(key.lower(), binding)
+        if other != binding:
+            raise ValueError(f"keys.{binding} = {key!r} is already bound to keys.{other}")
+
+
+def _check(name, value, kind, minimum, maximum):
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ValueError(f"{name} must be {kind.__name__}, got {value!r}")
+    if kind is str:
+        if not value:
+            raise ValueError(f"{name} must not be empty")
+        if minimum is not None and value not in minimum:
+            raise ValueError(f"{name} must be one of {minimum}, got {value!r}")
+    elif kind is not bool and not minimum <= value <= maximum:
+        raise ValueError(f"{name} must be between {minimum} and {maximum}, got {value!r}")
+    return value
+
+
+# ============================================================================
+# COMPILATION
+# ============================================================================
+
+class CompiledConfig:
+    """
+    Validated settings plus precompiled tables
+    Treat as read-only: a reload builds a new object and swaps it in whole
+    """
+    def __init__(self, settings, calibration=None):
+        """
+        Args:
+            settings: Complete settings dict
+            calibration: Channel → calibration.ChannelRange (None = every lever uncalibrated)
+        """
+        self.settings = settings
+        self.calibration = dict(calibration or {})
+        loop, controls = settings['loop'], settings['controls']
+        self.update_interval = loop['update_interval']
+        self.max_steps = controls['max_steps']
+        self.notch_hold = controls['notch_hold']
+        self.keys = dict(settings['keys'])
+        self.controls = dict(controls)
+        self.digital = dict(settings['digital'])
+        prediction = settings['prediction']
+        self.prediction = dict(prediction)
+        # Seconds ahead each notched handler presses towards (0.0 = no prediction)
+        self.leads = {'THROTTLE': prediction['throttle_lead'], 'TRAINBRAKE': prediction['train_brake_lead'],
+                      'INDBRAKE': prediction['ind_brake_lead'], 'REVERSER': prediction['reverser_lead']}
+
+        steps = self.max_steps
+        positions = controls['headlight_positions']
+        whistle_center, whistle_dead = self._center('WHISTLE', controls['whistle_center'], controls['whistle_deadzone'])
+        reverser_center, reverser_dead = self._center('REVERSER', controls['reverser_center'], controls['reverser_deadzone'])
+        whistle_span = self._span('WHISTLE')
+        # The builders are memoized, so a recompile only computes the tables whose
+        # calibration changed; the rest are the same tuples as before
+        self.tables = {
+            'THROTTLE': _linear_table(*self._span('THROTTLE'), steps),
+            'TRAINBRAKE': _linear_table(*self._span('TRAINBRAKE'), steps),
+            'INDBRAKE': _linear_table(*self._span('INDBRAKE'), steps),
+            'REVERSER': _reverser_table(reverser_center, reverser_dead, steps, *self._span('REVERSER')),
+            'HEADLIGHT': _headlight_table(*self._span('HEADLIGHT'), positions),
+            # Whistle: -1 low, 0 off, 1 high
+            'WHISTLE': _direction_table(whistle_center, whistle_dead),
+            # Whistle: how far past the deadzone, 0.0 … 1.0
+            'WHISTLE_INTENSITY': _intensity_table(whistle_center, whistle_dead, *whistle_span),
+            # Filtered values for the dashboard: taken from tables too, so a handler
+            # computes (and allocates) nothing while a lever stands still
+            'ADC': _identity_table(),
+            'WHISTLE_OFFSET': _offset_table(whistle_center, whistle_dead),
+            'REVERSER_OFFSET': _offset_table(reverser_center, reverser_dead),
+        }
+        # Notch hysteresis: the steps `noise` counts below and above each value.
+        # A handler keeps its current step while it lies between the two, so a
+        # reading jittering on a notch boundary doesn't send keys
+        self.bands = {}
+        self.noise = {}
+        for channel in ('HEADLIGHT', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE'):
+            table = self.tables[channel]
+            noise = self.noise[channel] = self._noise(channel)
+            self.bands[channel] = (_shifted_table(table, -noise), _shifted_table(table, noise)) if noise else (table, table)
+
+    def _noise(self, channel):
+        entry = self.calibration.get(channel)
+        return entry.noise if entry is not None and entry.noise is not None else 0
+
+    def _span(self, channel):
+        """
+        ADC values a channel's table is stretched over: the calibrated range,
+        inset by the noise so the end notches are reached with the lever on its stop
+        """
+        entry = self.calibration.get(channel)
+        if entry is None:
+            return 0, ADC_MAX
+        noise = self._noise(channel)
+        low = 0 if entry.min is None else entry.min + noise
+        high = ADC_MAX if entry.max is None else entry.max - noise
+        return (low, high) if high > low else (0, ADC_MAX)
+
+    def _center(self, channel, center, dead):
+        """(center, deadzone) of a centered lever: calibrated where known, configured otherwise"""
+        entry = self.calibration.get(channel)
+        if entry is None:
+            return center, dead
+        if entry.center is not None:
+            center = entry.center
+        if entry.noise is not None:
+            calibration = self.settings['calibration']
+            dead = max(calibration['min_deadzone'], math.ceil(entry.noise * calibration['noise_margin']))
+        return center, dead
+
+
+@functools.lru_cache(maxsize=64)
+def _identity_table():
+    return tuple(range(ADC_MAX + 1))
+
+
+@functools.lru_cache(maxsize=64)
+def _linear_table(low, high, steps):
+    """0 … steps over low … high, clamped outside it"""
+    return tuple(int(min(1.0, max(0.0, (v - low) / (high - low))) * steps) for v in range(ADC_MAX + 1))
+
+
+@functools.lru_cache(maxsize=64)
+def _headlight_table(low, high, positions):
+    return tuple(min(int(min(1.0, max(0.0, (v - low) / (high - low))) * positions), positions - 1)
+                 for v in range(ADC_MAX + 1))
+
+
+@functools.lru_cache(maxsize=64)
+def _direction_table(center, dead):
+    return tuple(0 if abs(v - center) < dead else (1 if v > center else -1) for v in range(ADC_MAX + 1))
+
+
+@functools.lru_cache(maxsize=64)
+def _offset_table(center, dead):
+    """Distance from center, 0 inside the deadzone"""
+    return tuple(0 if abs(v - center) < dead else v - center for v in range(ADC_MAX + 1))
+
+
+@functools.lru_cache(maxsize=64)
+def _intensity_table(center, dead, low=0, high=ADC_MAX):
+    table = []
+    for v in range(ADC_MAX + 1):
+        reach = (high - center if v > center else center - low) - dead
+        table.append(max(0.0, min(1.0, (abs(v - center) - dead) / reach)) if reach > 0 else 1.0)
+    return tuple(table)
+
+
+@functools.lru_cache(maxsize=64)
+def _reverser_table(center, dead, steps, low=0, high=ADC_MAX):
+    """Signed steps: forward above the deadzone, backward below it"""
+    forward_min, backward_max = center + dead, center - dead - 1
+    table = []
+    for v in range(ADC_MAX + 1):
+        if abs(v - center) < dead:
+            table.append(0)
+        elif v > center:
+            span = max(1, high - forward_min)
+            table.append(int(min(1.0, max(0, v - forward_min) / span) * steps))
+        else:
+            span = max(1, backward_max - low)
+            table.append(-int(min(1.0, (backward_max - min(v, backward_max)) / span) * steps))
+    return tuple(table)
+
+
+@functools.lru_cache(maxsize=64)
+def _shifted_table(table, offset):
+    """table[v + offset] for every v, clamped to the ADC range"""
+    return tuple(table[min(ADC_MAX, max(0, v + offset))] for v in range(ADC_MAX + 1))
+
+
+def lookup(table, value):
+    """Table entry for an ADC value, clamping out-of-range values"""
+    if 0 <= value <= ADC_MAX:
+        return table[value]
+    return table[0] if value < 0 else table[ADC_MAX]
+
+
+def load_config(path, base, calibration=None):
+    """
+    Read, validate and compile a config file
+
+    Args:
+        path: Config file path
+        base: Settings dict the file is laid over
+        calibration: Channel → ChannelRange to compile with (None = uncalibrated)
+
+    Raises:
+        OSError: File cannot be read
+        ValueError: Invalid TOML or setting
+    """
+    with open(path, 'rb') as f:
+        try:
+            overrides = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(f"invalid TOML: {e}")
+    return CompiledConfig(merge_settings(base, overrides), calibration)
+
+
+# ============================================================================
+# HOT RELOAD
+# ============================================================================
+
+class ConfigWatcher:
+    """
+    Polls the config file's modification time from a background thread
+    A valid new config is parked in `pending` until the control loop calls
+    take(); an invalid one is reported and the running config is kept.
+    """
+    def __init__(self, path, base, interval=1.0, calibration=None):
+        """
+        Args:
+            path: Config file path
+            base: Settings dict the file is laid over
+            interval: Seconds between checks
+            calibration: Callable returning the lever calibration to compile with
+                (so the loop can use the config as it is), or None
+        """
+        self.path = path
+        self.base = base
+        self.interval = interval
+        self.calibration = calibration
+        self.pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._mtime = self._current_mtime()
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def start(self):
+        threading.Thread(target=self._run, name="config-watcher", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def take(self):
+        """Return the pending config (or None) and clear it"""
+        with self._lock:
+            compiled, self.pending = self.pending, None
+        return compiled
+
+    def check(self):
+        """
+        Load the file if it changed since the last check (the thread calls this every `interval`)
+
+        Returns:
+            True if a new valid config is pending
+        """
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            compiled = load_config(self.path, self.base, self.calibration() if self.calibration else None)
+        except (OSError, ValueError) as e:
+            print(f"✗ {self.path}: {e} - keeping the previous settings")
+            return False
+        with self._lock:
+            self.pending = compiled
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
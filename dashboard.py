@@ -0,0 +1,138 @@
+"""
+Live cab dashboard for the Railroader controller
+Redraws the terminal at a fixed low rate from a snapshot of ControlState,
+instead of printing one line per key event
+
+The dashboard runs in its own thread and only ever reads snapshots, so
+rendering never blocks input handling.
+"""
+
+import os
+import sys
+import threading
+import time
+
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+
+CHANNEL_ORDER = ['WHISTLE', 'BELL', 'HEADLIGHT', 'CYLINDER', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE']
+
+
+def enable_ansi():
+    """Turn on ANSI escape handling in the Windows console (no-op elsewhere)"""
+    if os.name == 'nt':
+        os.system("")
+
+
+def render(snapshot, stats, title="RAILROADER CAB"):
+    """
+    Build the dashboard text
+
+    Args:
+        snapshot: Dict from ControlState.snapshot()
+        stats: Dict with frames, keys, drops, parse_errors, frame_rate, tick_p50, tick_p99,
+               held_keys, recoveries
+
+    Returns:
+        The full screen as a string
+    """
+    lines = []
+    lines.append("=" * 70)
+    focus = "FOCUSED - sending keys" if snapshot['focused'] else "PAUSED - Railroader not focused"
+    lines.append(f"{title:30} {focus:>39}")
+    lines.append(f"Input: {stats.get('source', '-')}")
+    if not snapshot['focused'] and snapshot['active_window']:
+        lines.append(f"{'':30} {'(current: ' + snapshot['active_window'][:40] + ')':>39}")
+    lines.append("=" * 70)
+    lines.append(f"{'CHANNEL':12} {'RAW':>6} {'FILTERED':>9} {'TARGET':>8} {'IN-GAME':>8} {'PENDING':>8}")
+    lines.append("-" * 70)
+
+    channels = [c for c in CHANNEL_ORDER if c in snapshot['raw']]
+    channels += [c for c in snapshot['raw'] if c not in CHANNEL_ORDER]
+    for channel in channels:
+        pending = snapshot['pending'].get(channel)
+        lines.append(
+            f"{channel:12} "
+            f"{_cell(snapshot['raw'].get(channel)):>6} "
+            f"{_cell(snapshot['filtered'].get(channel)):>9} "
+            f"{_cell(snapshot['targets'].get(channel)):>8} "
+            f"{_cell(snapshot['assumed'].get(channel)):>8} "
+            f"{(f'{pending:+d}' if pending else ''):>8}"
+        )
+    if not channels:
+        lines.append("  (waiting for input...)")
+
+    lines.append("-" * 70)
+    pending_keys = sum(abs(p) for p in snapshot['pending'].values())
+    held = stats.get('held_keys', [])
+    lines.append(f"Pending key presses: {pending_keys}   Held: {' '.join(held) if held else '-'}   "
+                 f"Stuck-key recoveries: {stats.get('recoveries', 0)}")
+    lines.append(
+        f"Frames: {stats.get('frames', 0)} ({stats.get('frame_rate', 0):.1f}/s)   "
+        f"Keys: {stats.get('keys', 0)}   Drops: {stats.get('drops', 0)}   "
+        f"Parse errors: {stats.get('parse_errors', 0)}"
+    )
+    lines.append(f"Loop tick: p50 < {stats.get('tick_p50', '-')}   p99 < {stats.get('tick_p99', '-')}")
+    for name, port, healthy, frames, errors in stats.get('panels', []):
+        status = "✓ OK  " if healthy else "✗ DOWN"
+        lines.append(f"Panel {name:12} {status} {port:10} frames={frames} errors={errors}")
+    udp = stats.get('udp')
+    if udp:
+        lines.append(f"UDP: packets={udp['packets']} lost={udp['lost']} ({udp['loss']:.1%}) "
+                     f"stale={udp['stale']} jitter={udp['jitter_ms']:.1f}ms")
+    lines.append("=" * 70)
+    lines.append("Ctrl+C in this window to stop")
+    return "\n".join(lines)
+
+
+def _cell(value):
+    """Format a table cell"""
+    if value is None:
+        return ""
+    return str(value)
+
+
+class Dashboard:
+    """Background thread redrawing the dashboard at a fixed rate"""
+    def __init__(self, get_snapshot, get_stats, rate=5, out=None):
+        """
+        Args:
+            get_snapshot: Callable returning ControlState.snapshot()
+            get_stats: Callable returning the loop stats dict (see render)
+            rate: Redraws per second
+            out: Stream to draw on (defaults to sys.stdout)
+        """
+        self.get_snapshot = get_snapshot
+        self.get_stats = get_stats
+        self.interval = 1.0 / rate
+        self.out = out or sys.stdout
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        enable_ansi()
+        self._thread = threading.Thread(target=self._run, name="dashboard", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        next_draw = time.monotonic()
+        last_time, last_frames = next_draw, None
+        while not self._stop.is_set():
+            try:
+                stats = self.get_stats()
+                now = time.monotonic()
+                if last_frames is not None and now > last_time:
+                    stats['frame_rate'] = (stats.get('frames', 0) - last_frames) / (now - last_time)
+                last_time, last_frames = now, stats.get('frames', 0)
+                screen = render(self.get_snapshot(), stats)
+                self.out.write(CLEAR_SCREEN + screen + "\n")
+                self.out.flush()
+            except Exception as e:
+                self.out.write(f"✗ Dashboard error: {e}\n")
+            next_draw += self.interval
+            self._stop.wait(max(0.0, next_draw - time.monotonic()))
@@ -1,122 +1,400 @@
 """
 System Diagnostics for Railroader Controller
-Tests Python environment, pyautogui, and input detection
+Checks the Python environment and measures what matters for a responsive
+cab: timer resolution and sleep overshoot, loop jitter, key injection cost
+per backend, focus-check cost and the panel's frame rate and error rate.
+Also checks the key bindings against the controller's live control registry.
+
+Usage:
+    python diagnostics.py                       # print the report
+    python diagnostics.py --json report.json    # also save it (attach to bug reports)
+    python diagnostics.py --inject              # also time real key injection (presses Shift)
+    python diagnostics.py --port COM3           # read this port instead of probing for the panel
 """
 
-import sys
+import argparse
+import json
 import platform
+import sys
+import time
+
+LOOP_SECONDS = 2.0  # Length of the loop jitter test
+SERIAL_SECONDS = 3.0  # How long to read the panel
+SLEEP_REQUESTS = (0.001, 0.005, 0.05)  # Sleep lengths to check for overshoot
+SLEEP_SAMPLES = 20  # Sleeps per length
+INJECT_SAMPLES = 50  # Key presses per backend
+FOCUS_SAMPLES = 200  # Focus checks
+
+
+def summarize(samples, scale=1e3):
+    """p50/p99/max/mean of a list of seconds, in ms (scale=1e3) or µs (scale=1e6)"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        'count': len(ordered),
+        'p50': round(pick(0.50) * scale, 3),
+        'p99': round(pick(0.99) * scale, 3),
+        'max': round(ordered[-1] * scale, 3),
+        'mean': round(sum(ordered) / len(ordered) * scale, 3),
+    }
+
 
-print()
-print("=" * 70)
-print("RAILROADER CONTROLLER - SYSTEM DIAGNOSTICS")
-print("=" * 70)
-print()
-
-# Check Python version
-print(f"Python version: {sys.version}")
-print(f"Platform: {platform.system()} {platform.release()}")
-print()
-
-# Check pyautogui
-print("Checking pyautogui...")
-pyautogui = None
-try:
-    import pyautogui
-    print(f"  ✓ pyautogui imported successfully")
-    print(f"  ✓ FAILSAFE: {pyautogui.FAILSAFE}")
-    print(f"  ✓ PAUSE: {pyautogui.PAUSE}")
-except Exception as e:
-    print(f"  ✗ Error importing pyautogui: {e}")
-    print("  Install with: pip install pyautogui")
-
-# Check pyserial
-print()
-print("Checking pyserial...")
-try:
-    import serial
-    print(f"  ✓ pyserial imported successfully")
-    
-    # List available ports
-    import serial.tools.list_ports
-    ports = list(serial.tools.list_ports.comports())
-    if ports:
-        print(f"  ✓ Found {len(ports)} COM port(s):")
-        for port in ports:
-            print(f"    - {port.device}: {port.description}")
+def show(label, stats, unit):
+    if stats is None:
+        print(f"  ⚠ {label}: no samples")
     else:
-        print(f"  ⚠ No COM ports found (Arduino not connected?)")
-except Exception as e:
-    print(f"  ✗ Error with pyserial: {e}")
-    print("  Install with: pip install pyserial")
-
-# Test screen size
-print()
-print("Checking screen...")
-if pyautogui is not None:
+        print(f"  {label:28} p50 {stats['p50']:>9.3f} {unit}   p99 {stats['p99']:>9.3f} {unit}   "
+              f"max {stats['max']:>9.3f} {unit}")
+
+
+# ============================================================================
+# ENVIRONMENT
+# ============================================================================
+
+def check_environment():
+    """Python, platform and the optional packages"""
+    print(f"Python version: {sys.version}")
+    print(f"Platform: {platform.system()} {platform.release()}")
+    print()
+    report = {'python': sys.version.split()[0], 'platform': f"{platform.system()} {platform.release()}",
+              'packages': {}}
+
+    for name, install in (('pynput', 'pynput'), ('pyautogui', 'pyautogui'), ('serial', 'pyserial')):
+        try:
+            module = __import__(name)
+            version = getattr(module, '__version__', getattr(module, 'VERSION', 'unknown'))
+            print(f"  ✓ {install} imported successfully ({version})")
+            report['packages'][install] = str(version)
+        except Exception as e:
+            print(f"  ✗ Error importing {install}: {str(e).splitlines()[0]}")
+            print(f"    Install with: pip install {install}")
+            report['packages'][install] = None
+
     try:
-        size = pyautogui.size()
-        print(f"  ✓ Screen size: {size[0]} x {size[1]}")
-        pos = pyautogui.position()
-        print(f"  ✓ Mouse position: {pos}")
+        import serial.tools.list_ports
+        ports = list(serial.tools.list_ports.comports())
+        report['ports'] = [{'device': port.device, 'description': port.description} for port in ports]
+        if ports:
+            print(f"  ✓ Found {len(ports)} COM port(s):")
+            for port in ports:
+                print(f"    - {port.device}: {port.description}")
+        else:
+            print("  ⚠ No COM ports found (Arduino not connected?)")
     except Exception as e:
-        print(f"  ✗ Error getting screen info: {e}")
-else:
-    print(f"  ✗ pyautogui not available, skipping screen checks")
-
-# Test key sending (visual only, no actual keys)
-print()
-print("Testing key name conversion...")
-if pyautogui is not None:
+        report['ports'] = []
+        print(f"  ✗ Error listing COM ports: {e}")
+    return report
+
+
+# ============================================================================
+# TIMING
+# ============================================================================
+
+def check_timers():
+    """Clock resolution and how far sleeps overshoot"""
+    report = {'clocks': {}, 'sleep_overshoot_ms': {}}
+    for name in ('perf_counter', 'monotonic'):
+        info = time.get_clock_info(name)
+        clock = getattr(time, name)
+        # Smallest step actually observed between two readings
+        steps = []
+        last = clock()
+        while len(steps) < 1000:
+            now = clock()
+            if now != last:
+                steps.append(now - last)
+                last = now
+        report['clocks'][name] = {'implementation': info.implementation,
+                                  'resolution_us': info.resolution * 1e6,
+                                  'observed_step_us': round(min(steps) * 1e6, 3)}
+        print(f"  {name:14} resolution {info.resolution * 1e6:8.3f} µs   observed step "
+              f"{min(steps) * 1e6:8.3f} µs   ({info.implementation})")
+
+    for requested in SLEEP_REQUESTS:
+        overshoot = []
+        for _ in range(SLEEP_SAMPLES):
+            start = time.perf_counter()
+            time.sleep(requested)
+            overshoot.append(time.perf_counter() - start - requested)
+        stats = summarize(overshoot)
+        report['sleep_overshoot_ms'][f"{requested * 1e3:g}ms"] = stats
+        show(f"sleep({requested * 1e3:g} ms) overshoot", stats, "ms")
+    return report
+
+
+def check_loop_jitter(interval, seconds=LOOP_SECONDS):
+    """
+    Period error of a loop that sleeps `interval` per tick (like control_loop),
+    and of one that sleeps to absolute deadlines (clock.RealClock)
+    """
+    from clock import RealClock
+
+    report = {'interval_ms': interval * 1e3}
+    ticks = max(2, int(seconds / interval))
+
+    errors = []
+    last = time.perf_counter()
+    for _ in range(ticks):
+        time.sleep(interval)
+        now = time.perf_counter()
+        errors.append(abs(now - last - interval))
+        last = now
+    report['sleep_loop_ms'] = summarize(errors)
+    show("sleep(interval) loop jitter", report['sleep_loop_ms'], "ms")
+
+    clock = RealClock()
+    errors = []
+    deadline = clock.now()
+    for _ in range(ticks):
+        deadline += interval
+        clock.sleep_until(deadline)
+        errors.append(clock.now() - deadline)
+    report['deadline_loop_ms'] = summarize(errors)
+    show("deadline loop lateness", report['deadline_loop_ms'], "ms")
+    return report
+
+
+# ============================================================================
+# CONTROLLER
+# ============================================================================
+
+def check_key_injection(controller, inject):
+    """Cost of one press + release per backend (real backends only with --inject)"""
+    from key_backends import RecordingKeyboard
+
+    backends = [('recording', lambda: RecordingKeyboard(), 'shift')]
+    if inject:
+        if controller.PYNPUT_ERROR is None:
+            from pynput.keyboard import Controller, Key
+            backends.append(('pynput', Controller, Key.shift))
+        try:
+            import pyautogui
+            pyautogui.PAUSE = 0  # Its default 0.1 s pause after every call would swamp the measurement
+
+            class PyAutoGuiKeyboard:
+                press = staticmethod(pyautogui.keyDown)
+                release = staticmethod(pyautogui.keyUp)
+            backends.append(('pyautogui', PyAutoGuiKeyboard, 'shift'))
+        except Exception as e:
+            print(f"  ⚠ pyautogui skipped: {e}")
+    else:
+        print("  (real backends skipped - run with --inject to press Shift through pynput / pyautogui)")
+
+    report = {}
+    for name, create, key in backends:
+        try:
+            keyboard = create()
+            samples = []
+            for _ in range(INJECT_SAMPLES):
+                start = time.perf_counter()
+                keyboard.press(key)
+                keyboard.release(key)
+                samples.append(time.perf_counter() - start)
+            report[name] = summarize(samples, 1e6)
+            show(f"{name} press+release", report[name], "µs")
+        except Exception as e:
+            report[name] = {'error': str(e)}
+            print(f"  ✗ {name}: {e}")
+    return report
+
+
+def check_focus(controller):
+    """Cost of the window focus check the loop runs every tick"""
+    samples = []
+    focused = None
+    for _ in range(FOCUS_SAMPLES):
+        start = time.perf_counter()
+        focused = controller.is_railroader_focused()
+        samples.append(time.perf_counter() - start)
+    report = summarize(samples, 1e6)
+    report['railroader_focused'] = focused
+    show("is_railroader_focused()", report, "µs")
+    return report
+
+
+def check_serial(controller, port=None, seconds=SERIAL_SECONDS):
+    """Frame rate and error rate from the panel (probed for if no port is given)"""
+    from find_arduino_port import find_panel
+
+    baud = controller.SERIAL_BAUD
+    if port is None:
+        port = find_panel(baud=baud)
+        if port is None:
+            print("  ⚠ No panel found - skipping serial checks")
+            return {'port': None}
     try:
-        test_keys = ['v', 'b', 'j', 'k', '[', ']', '-', '=', "'", ";", ".", ","]
-        pyautogui.FAILSAFE = False
-        print(f"  ✓ Key names recognized: {', '.join(test_keys)}")
+        import serial
+        ser = serial.Serial(port, baud, timeout=0.5)
     except Exception as e:
-        print(f"  ✗ Error with key names: {e}")
-else:
-    print(f"  ✗ pyautogui not available, skipping key tests")
-
-# Summary
-print()
-print("=" * 70)
-print("DIAGNOSTIC SUMMARY")
-print("=" * 70)
-print()
-
-print("If all items above show ✓, then:")
-print()
-print("1. Run: python test_keys.py")
-print("   - This will test if keys can actually reach Railroader")
-print()
-print("2. If test_keys.py fails but shows 'sent', then:")
-print("   - Railroader is not accepting pyautogui input")
-print("   - Solution: Try fullscreen windowed mode OR run as Admin")
-print()
-print("3. If you see ⚠ for COM ports:")
-print("   - Arduino is not connected")
-print("   - Use: python find_arduino_port.py for help")
-print()
-print("4. Check that your Railroader key bindings match:")
-print()
-
-bindings = {
-    'v': 'WHISTLE',
-    'b': 'BELL',
-    'j': 'HEADLIGHT',
-    'shift+j': 'HEADLIGHT (decrease)',
-    '[': 'REVERSER',
-    ']': 'REVERSER (opposite)',
-    '-': 'THROTTLE',
-    '=': 'THROTTLE (decrease)',
-    "'": 'TRAIN BRAKE',
-    ';': 'TRAIN BRAKE (decrease)',
-    '.': 'INDEPENDENT BRAKE',
-    ',': 'INDEPENDENT BRAKE (decrease)',
-    'k': 'CYLINDER COCKS',
-}
-
-for key, control in bindings.items():
-    print(f"   {key:15} → {control}")
-
-print()
-print("=" * 70)
+        print(f"  ✗ Failed to open {port}: {e}")
+        return {'port': port, 'error': str(e)}
+
+    frames = errors = other = 0
+    gaps = []
+    last = None
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < seconds:
+            line = ser.readline().decode('utf-8', errors='replace').strip()
+            if not line:
+                continue
+            if line.startswith('@') or line == "OK" or "Ready" in line:
+                other += 1  # Step events, acks, banner
+                continue
+            now = time.perf_counter()
+            if controller.parse_serial_data(line) is None:
+                errors += 1
+                continue
+            frames += 1
+            if last is not None:
+                gaps.append(now - last)
+            last = now
+    finally:
+        ser.close()
+
+    elapsed = time.perf_counter() - start
+    total = frames + errors
+    report = {
+        'port': port,
+        'baud': baud,
+        'seconds': round(elapsed, 3),
+        'frames': frames,
+        'frame_rate': round(frames / elapsed, 2),
+        'parse_errors': errors,
+        'error_rate': round(errors / total, 4) if total else None,
+        'other_lines': other,
+        'frame_gap_ms': summarize(gaps),
+    }
+    print(f"  Port {port}: {frames} frames in {elapsed:.1f}s ({report['frame_rate']:.1f}/s), "
+          f"{errors} parse errors" + (f" ({report['error_rate']:.1%})" if total else ""))
+    if gaps:
+        show("frame gap", report['frame_gap_ms'], "ms")
+    return report
+
+
+def check_bindings(controller):
+    """
+    Check the key bindings against the control registry (CONTROL_HANDLERS and
+    CHANNEL_BINDINGS in the controller, with the settings file applied)
+    """
+    from config import load_config
+
+    keys = controller.active_config.keys
+    source = "built-in settings"
+    try:
+        keys = load_config(controller.CONFIG_FILE, controller.base_settings()).keys
+        source = controller.CONFIG_FILE
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"  ✗ {controller.CONFIG_FILE}: {e} (checking the built-in settings)")
+
+    problems = []
+    table = []
+    used = set()
+    for channel, name, _, _ in controller.CONTROL_HANDLERS:
+        binding_names = controller.CHANNEL_BINDINGS.get(channel)
+        if not binding_names:
+            problems.append(f"{channel} has no key binding")
+            continue
+        for binding in binding_names:
+            used.add(binding)
+            key = keys.get(binding)
+            if key is None:
+                problems.append(f"{channel}: binding '{binding}' is missing")
+                continue
+            if len(key) != 1:
+                problems.append(f"{channel}: '{binding}' = {key!r} is not a single key")
+            table.append({'channel': channel, 'control': name, 'binding': binding, 'key': key})
+            if binding in controller.SHIFTED_BINDINGS:
+                table.append({'channel': channel, 'control': f"{name} (Shift)", 'binding': binding,
+                              'key': f"shift+{key}"})
+
+    for binding in keys:
+        if binding not in used:
+            problems.append(f"binding '{binding}' is not used by any control")
+    by_key = {}
+    for binding, key in keys.items():
+        by_key.setdefault(key, []).append(binding)
+    for key, bindings in by_key.items():
+        if len(bindings) > 1:
+            problems.append(f"key {key!r} is bound to {', '.join(bindings)}")
+
+    print(f"  Bindings from {source} - check these match Railroader's key settings:")
+    for row in table:
+        print(f"   {row['key']:15} → {row['control']}")
+    if problems:
+        for problem in problems:
+            print(f"  ✗ {problem}")
+    else:
+        print("  ✓ Every control has a key, no key is used twice")
+    return {'source': source, 'bindings': table, 'problems': problems}
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def section(title):
+    print()
+    print(title)
+    print("-" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Railroader controller diagnostics")
+    parser.add_argument("--json", metavar="PATH", help="Save the report as JSON ('-' = print it)")
+    parser.add_argument("--inject", action="store_true", help="Time pynput / pyautogui key injection (presses Shift)")
+    parser.add_argument("--port", help="Panel port (default: probe all ports)")
+    parser.add_argument("--no-serial", action="store_true", help="Skip the panel checks")
+    args = parser.parse_args()
+
+    print()
+    print("=" * 70)
+    print("RAILROADER CONTROLLER - SYSTEM DIAGNOSTICS")
+    print("=" * 70)
+    print()
+
+    report = {'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S")}
+    report['environment'] = check_environment()
+
+    import railroader_controller_pynput as controller
+    report['controller'] = {'update_interval': controller.UPDATE_INTERVAL, 'input_source': controller.INPUT_SOURCE,
+                            'pynput_error': None if controller.PYNPUT_ERROR is None else str(controller.PYNPUT_ERROR)}
+
+    section("Timers")
+    report['timers'] = check_timers()
+    section(f"Loop jitter ({LOOP_SECONDS:g}s at {controller.UPDATE_INTERVAL * 1e3:g} ms)")
+    report['loop'] = check_loop_jitter(controller.UPDATE_INTERVAL)
+    section("Key injection")
+    report['key_injection'] = check_key_injection(controller, args.inject)
+    section("Focus check")
+    report['focus_check'] = check_focus(controller)
+    section("Panel")
+    report['serial'] = {'skipped': True} if args.no_serial else check_serial(controller, args.port)
+    section("Key bindings")
+    report['bindings'] = check_bindings(controller)
+
+    section("Next steps")
+    print("1. Run: python test_keys_pynput.py")
+    print("   - This will test if keys can actually reach Railroader")
+    print("2. If keys are sent but nothing happens in the game:")
+    print("   - Try fullscreen windowed mode OR run as Admin")
+    print("3. If no panel was found:")
+    print("   - Use: python find_arduino_port.py for help")
+    print()
+    print("=" * 70)
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report saved to {args.json} (attach it to bug reports)")
+    controller.scheduler.stop()
+    return 1 if report['bindings']['problems'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Digital input engine for buttons and switches
+Turns raw 0/1 samples into clean events, with time-based debouncing:
+
+    'press'       Rising edge (0 → 1)
+    'release'     Falling edge (1 → 0)
+    'long_press'  Held for `long_press` seconds (once per press)
+    'repeat'      Auto-repeat while held: first after `repeat_delay`, then `repeat_rate` per second
+
+Debouncing is leading-edge: the first change is accepted at once (no added
+latency), then the input ignores changes for `debounce` seconds while the
+contacts settle. If the input ends up at a different level afterwards, that
+change is accepted on the next sample.
+"""
+
+import time
+
+PRESS = 'press'
+RELEASE = 'release'
+LONG_PRESS = 'long_press'
+REPEAT = 'repeat'
+
+NO_EVENTS = ()
+
+
+class DigitalInput:
+    """One debounced digital channel"""
+    def __init__(self, name, debounce=0.03, long_press=0.0, repeat_delay=0.5, repeat_rate=0.0,
+                 initial=0, clock=time.monotonic):
+        """
+        Args:
+            name: Channel name (for display)
+            debounce: Seconds to ignore changes after an accepted edge
+            long_press: Seconds held before a 'long_press' event (0 = off)
+            repeat_delay: Seconds held before the first 'repeat'
+            repeat_rate: 'repeat' events per second while held (0 = off)
+            initial: Starting level
+            clock: Time source in seconds
+        """
+        self.name = name
+        self.clock = clock
+        self.state = 1 if initial else 0
+        self.changed_at = float('-inf')
+        self._long_sent = False
+        self._next_repeat = 0.0
+        self.configure(debounce, long_press, repeat_delay, repeat_rate)
+
+    def configure(self, debounce=0.03, long_press=0.0, repeat_delay=0.5, repeat_rate=0.0):
+        """Change timing without losing the current level"""
+        self.debounce = debounce
+        self.long_press = long_press
+        self.repeat_delay = repeat_delay
+        self.repeat_rate = repeat_rate
+
+    def update(self, raw, now=None):
+        """
+        Feed one raw sample
+
+        Args:
+            raw: Sample value (anything truthy = 1)
+            now: Sample time (defaults to the clock)
+
+        Returns:
+            Tuple of events (usually empty)
+        """
+        if now is None:
+            now = self.clock()
+        level = 1 if raw else 0
+
+        if level != self.state:
+            if now - self.changed_at < self.debounce:
+                return NO_EVENTS  # Contacts still bouncing
+            self.state = level
+            self.changed_at = now
+            if level:
+                self._long_sent = False
+                self._next_repeat = now + self.repeat_delay
+                return (PRESS,)
+            return (RELEASE,)
+
+        if not level:
+            return NO_EVENTS
+        held = now - self.changed_at
+        events = NO_EVENTS
+        if self.long_press and not self._long_sent and held >= self.long_press:
+            self._long_sent = True
+            events = (LONG_PRESS,)
+        if self.repeat_rate and now >= self._next_repeat:
+            period = 1.0 / self.repeat_rate
+            self._next_repeat += period
+            if self._next_repeat <= now:
+                self._next_repeat = now + period  # Fell behind (slow frames): don't burst
+            events += (REPEAT,)
+        return events
+
+
+class DigitalInputs:
+    """Debounced inputs by channel name"""
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.inputs = {}
+
+    def add(self, name, **options):
+        """Create (or reconfigure, keeping its level) the input for a channel"""
+        existing = self.inputs.get(name)
+        if existing is not None:
+            existing.configure(**options)
+            return existing
+        self.inputs[name] = DigitalInput(name, clock=self.clock, **options)
+        return self.inputs[name]
+
+    def __getitem__(self, name):
+        return self.inputs[name]
+
+    def update(self, name, raw, now=None):
+        """Feed a sample to one channel; returns its events"""
+        return self.inputs[name].update(raw, now)
+
+    def states(self):
+        """Debounced level per channel"""
+        return {name: digital.state for name, digital in self.inputs.items()}
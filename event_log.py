@@ -0,0 +1,179 @@
+"""
+Asynchronous structured event log for the Railroader controller
+
+The control loop never formats or prints anything itself. It pushes compact
+tuples (timestamp, level, event, args) onto a bounded queue; a background
+thread formats them and writes to the console and/or a rotating log file.
+
+- Level checks happen before anything is queued, so disabled events cost
+  one comparison
+- When the queue is full the event is dropped and counted (log_dropped)
+  instead of slowing down the control loop
+
+Usage:
+    events = EventLog(level=INFO, log_file="railroader.log")
+    events.start()
+    events.log(INFO, 'key', '-', "HELD", "THROTTLE UP", 5)
+    events.stop()  # Flushes what is still queued
+"""
+
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+import metrics
+
+# ============================================================================
+# LEVELS AND EVENTS
+# ============================================================================
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# Event name → format string, applied to the event args in the writer thread
+EVENT_FORMATS = {
+    'key': "  [{2}] {1}: '{0}'",
+    'key_step': "  [{2} (step {3})] {1}: '{0}'",
+    'key_plain': "  {1}: '{0}'",
+    'value': "{0}: value={1}, step={2}, prev_step={3}",
+    'whistle_value': "WHISTLE: value={0}, deadzone_val={1}",
+    'reverser_value': "REVERSER: value={0}, dz={1}, step={2}, prev_step={3}",
+    'parse_error': "✗ Error parsing serial data: {0}",
+    'read_error': "✗ Error reading from serial: {0}",
+    'handler_error': "✗ {0} error: {1}",
+    'keys_released': "⚠ Released held keys {1} ({0})",
+    'message': "{0}",
+}
+
+QUEUE_SIZE = 4096  # Events buffered before new ones are dropped
+LOG_FILE_MAX_BYTES = 1_000_000
+LOG_FILE_BACKUPS = 3
+
+
+def format_event(event, args):
+    """Turn a queued event into its message text"""
+    template = EVENT_FORMATS.get(event)
+    if template is None:
+        return f"{event}: {args}"
+    return template.format(*args)
+
+
+# ============================================================================
+# EVENT LOG
+# ============================================================================
+
+class EventLog:
+    """Bounded-queue event logger with a background writer thread"""
+    def __init__(self, level=INFO, console=True, log_file=None, queue_size=QUEUE_SIZE):
+        self.level = level
+        self.console = console
+        self.log_file = log_file
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = metrics.counter('log_dropped', "Log events dropped because the queue was full")
+        self._file_handler = None
+        self._thread = None
+
+    def enabled(self, level):
+        """True if events at this level are recorded"""
+        return level >= self.level
+
+    def log(self, level, event, *args):
+        """
+        Queue an event (never blocks)
+
+        Args:
+            level: DEBUG, INFO, WARNING or ERROR
+            event: Key into EVENT_FORMATS
+            *args: Raw values, formatted later by the writer thread
+        """
+        if level < self.level:
+            return
+        try:
+            self.queue.put_nowait((time.time(), level, event, args))
+        except queue.Full:
+            self.dropped.inc()
+
+    def debug(self, event, *args):
+        # Checked here too: forwarding *args builds a new tuple even when the level is off
+        if self.level <= DEBUG:
+            self.log(DEBUG, event, *args)
+
+    def info(self, event, *args):
+        self.log(INFO, event, *args)
+
+    def error(self, event, *args):
+        self.log(ERROR, event, *args)
+
+    def start(self):
+        """Start the writer thread (and open the log file if configured)"""
+        if self._thread is not None:
+            return
+        if self.log_file:
+            self._file_handler = logging.handlers.RotatingFileHandler(
+                self.log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding='utf-8'
+            )
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Flush everything still queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        # The sentinel waits for room at most `timeout`: a writer thread that died
+        # leaves a full queue behind, and nothing would ever make room in it
+        if self._thread.is_alive():
+            try:
+                self.queue.put((None, None, None, None), timeout=timeout)
+                self._thread.join(timeout)
+            except queue.Full:
+                pass
+        self._thread = None
+        if self._file_handler is not None:
+            self._file_handler.close()
+            self._file_handler = None
+
+    def _run(self):
+        """Writer thread: drain the queue in batches, format, write, flush once per batch"""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            console_lines = []
+            for timestamp, level, event, args in batch:
+                if event is None:
+                    stop = True
+                    continue
+                try:
+                    message = format_event(event, args)
+                except Exception as e:
+                    message = f"{event}: {args} (format error: {e})"
+                if self.console:
+                    console_lines.append(message)
+                if self._file_handler is not None:
+                    self._write_file(timestamp, level, message)
+
+            if console_lines:
+                sys.stdout.write("\n".join(console_lines) + "\n")
+                sys.stdout.flush()
+            if stop:
+                return
+
+    def _write_file(self, timestamp, level, message):
+        """Write one line to the rotating log file"""
+        record = logging.LogRecord("railroader", level, "", 0, message, None, None)
+        record.created = timestamp
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+        record.msg = f"{stamp}.{int(timestamp % 1 * 1000):03d} {LEVEL_NAMES.get(level, level)} {message}"
+        self._file_handler.emit(record)
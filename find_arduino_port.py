@@ -1,10 +1,32 @@
 """
 Simple utility to find Arduino COM ports
 Run this before setting up the main controller to identify your Arduino's port
+
+All ports are probed at the same time, so finding the panel takes about as
+long as checking one port, however many Bluetooth / virtual ports there are.
+The controller uses the same probe when SERIAL_PORT = "auto":
+
+    from find_arduino_port import find_panel
+    port = find_panel()  # e.g. "COM3", or None
 """
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
 import serial.tools.list_ports
-import sys
+
+BANNER = "Railroader Controller Ready"  # Printed by arduino_example.ino at startup
+PROBE_TIMEOUT = 2.5  # Seconds per port (an Arduino restarts when the port opens, then prints its banner after 1 s)
+HANDSHAKE_INTERVAL = 0.5  # Seconds between "?" handshakes (answered "OK" by the step-mode sketch)
+USB_HINTS = ('arduino', 'ch340', 'ch341', 'ftdi', 'cp210', 'usb serial', 'usb-serial')
+
+# Probe results, best first
+FOUND_BANNER = 3  # Sent the sketch's startup banner
+FOUND_HANDSHAKE = 2  # Answered the handshake, or sent frames / step events
+FOUND_DATA = 1  # Sent something that isn't ours
+FOUND_NOTHING = 0  # Opened, but silent
+FAILED = -1  # Could not be opened
 
 def list_available_ports():
     """List all available COM ports with descriptions"""
@@ -40,35 +62,159 @@ def list_available_ports():
     print("=" * 70)
 
 
-def test_connection(port, baud=9600):
-    """Test if a serial connection works"""
+def is_panel_line(line):
+    """True for a raw frame (WHISTLE:512;BELL:0;...) or a step event (@THROTTLE:7)"""
+    if line.startswith('@'):
+        line = line[1:]
+    pairs = line.split(';')
     try:
-        ser = serial.Serial(port, baud, timeout=2)
-        print(f"\n✓ Successfully connected to {port}")
-        
-        # Try to read some data
-        print(f"Waiting for data from {port}...")
-        for i in range(5):
-            if ser.in_waiting:
-                data = ser.readline().decode('utf-8', errors='ignore').strip()
-                print(f"Received: {data}")
-            else:
-                print(f"  [{i+1}/5] Waiting...", end='\r')
-                import time
-                time.sleep(1)
-        
-        ser.close()
-        print("\n✓ Connection test complete")
-        
+        return all(name.isupper() and value.strip().lstrip('-').isdigit()
+                   for name, value in (pair.split(':') for pair in pairs))
+    except ValueError:
+        return False
+
+
+def probe_port(port, baud=9600, timeout=PROBE_TIMEOUT, handshake=True):
+    """
+    Check whether the Railroader panel is on a port
+    Returns as soon as the port is identified, so a panel answers well
+    before the timeout.
+    
+    Args:
+        port: Port name (e.g., "COM3")
+        baud: Baud rate
+        timeout: Seconds to wait for the banner or a reply
+        handshake: Send "?" now and then (the step-mode sketch answers "OK")
+    
+    Returns:
+        Dict with port, result (FOUND_* or FAILED), reason, line (first line
+        received) and elapsed (seconds)
+    """
+    start = time.monotonic()
+    result = {'port': port, 'result': FAILED, 'reason': "", 'line': None, 'elapsed': 0.0}
+    try:
+        ser = serial.Serial(port, baud, timeout=0.1)
+    except Exception as e:
+        result['reason'] = str(e)
+        result['elapsed'] = time.monotonic() - start
+        return result
+    
+    result['result'] = FOUND_NOTHING
+    result['reason'] = "no data"
+    next_handshake = start
+    try:
+        while time.monotonic() - start < timeout:
+            if handshake and time.monotonic() >= next_handshake:
+                ser.write(b"?\n")
+                next_handshake += HANDSHAKE_INTERVAL
+            line = ser.readline().decode('utf-8', errors='replace').strip()
+            if not line:
+                continue
+            if result['line'] is None:
+                result['line'] = line
+            if BANNER in line:
+                result['result'], result['reason'] = FOUND_BANNER, "startup banner"
+                break
+            if line == "OK" or is_panel_line(line):
+                result['result'], result['reason'] = FOUND_HANDSHAKE, "handshake reply" if line == "OK" else "control frames"
+                break
+            result['result'], result['reason'] = FOUND_DATA, "unrecognised data"
     except Exception as e:
-        print(f"\n✗ Failed to connect to {port}: {e}")
+        result['reason'] = f"read failed: {e}"
+    finally:
+        try:
+            ser.close()
+        except Exception:
+            pass
+    result['elapsed'] = time.monotonic() - start
+    return result
+
+
+def probe_ports(ports=None, baud=9600, timeout=PROBE_TIMEOUT, handshake=True):
+    """
+    Probe every port at once
+    
+    Args:
+        ports: Port names (defaults to every port on the system)
+        baud, timeout, handshake: As for probe_port()
+    
+    Returns:
+        Probe results (see probe_port), best first; ports whose description
+        looks like an Arduino / USB serial adapter win ties
+    """
+    if ports is None:
+        infos = serial.tools.list_ports.comports()
+        ports = [info.device for info in infos]
+        descriptions = {info.device: f"{info.description} {info.manufacturer or ''}" for info in infos}
+    else:
+        descriptions = {}
+    if not ports:
+        return []
+    
+    with ThreadPoolExecutor(max_workers=len(ports), thread_name_prefix="probe") as pool:
+        results = list(pool.map(lambda port: probe_port(port, baud, timeout, handshake), ports))
+    
+    for result in results:
+        description = descriptions.get(result['port'], "")
+        result['description'] = description.strip()
+        result['usb'] = any(hint in description.lower() for hint in USB_HINTS)
+    results.sort(key=lambda r: (-r['result'], not r['usb'], r['elapsed']))
+    return results
+
+
+def find_panel(ports=None, baud=9600, timeout=PROBE_TIMEOUT):
+    """
+    Port of the Railroader panel
+    
+    Returns:
+        Port name, or None if no port sent the banner, frames or a handshake reply
+    """
+    results = probe_ports(ports, baud, timeout)
+    if results and results[0]['result'] >= FOUND_HANDSHAKE:
+        return results[0]['port']
+    return None
+
+
+def print_probe_results(results):
+    """Show probe_ports() results as a table"""
+    labels = {FOUND_BANNER: "✓ PANEL", FOUND_HANDSHAKE: "✓ PANEL", FOUND_DATA: "⚠ OTHER",
+              FOUND_NOTHING: "  silent", FAILED: "✗ error"}
+    for result in results:
+        print(f"  {labels[result['result']]:9} {result['port']:14} {result['reason']:22} "
+              f"({result['elapsed']:.1f}s)  {result.get('description', '')}")
+
+
+def test_connection(port, baud=9600):
+    """Test if a serial connection works"""
+    print(f"Waiting for data from {port}...")
+    result = probe_port(port, baud)
+    if result['result'] == FAILED:
+        print(f"\n✗ Failed to connect to {port}: {result['reason']}")
         print("  Try a different port or check your Arduino connection")
+        return
+    print(f"\n✓ Successfully connected to {port}")
+    if result['line'] is not None:
+        print(f"Received: {result['line']}")
+    if result['result'] >= FOUND_HANDSHAKE:
+        print(f"✓ Railroader panel found ({result['reason']})")
+    else:
+        print(f"⚠ No panel data ({result['reason']})")
+    print("\n✓ Connection test complete")
 
 
 if __name__ == "__main__":
     print()
     list_available_ports()
     
+    start = time.monotonic()
+    results = probe_ports()
+    if results:
+        print(f"Probing {len(results)} ports at once...")
+        print_probe_results(results)
+        print(f"  (took {time.monotonic() - start:.1f}s)")
+        if results[0]['result'] >= FOUND_HANDSHAKE:
+            print(f"\n✓ Railroader panel is on {results[0]['port']}")
+    
     # Offer to test a connection
     response = input("\nTest a connection to a specific port? (y/n): ").strip().lower()
     if response == 'y':
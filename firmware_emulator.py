@@ -0,0 +1,350 @@
+"""
+Firmware emulator for the Railroader controller
+Behaves like arduino_example.ino on the far end of a pseudo-terminal, so the
+unmodified serial path (open_serial_connection, pyserial, readline) can be
+tested and benchmarked on Linux/macOS without an Arduino:
+
+- Startup banner ("Railroader Controller Ready") after the sketch's 1 s boot delay
+- Raw frames in the sketch's format and channel order, at a configurable rate
+- Optional 9600-baud line limit: frames can't be sent faster than the link carries them
+- Lever values from a simulator.py scenario, with ADC noise
+- Step mode (T/H/M/? commands), like the sketch
+- Disconnects: the pty is hung up and a new one appears after a while
+
+Usage:
+    python firmware_emulator.py --rate 20 --link /tmp/railroader-arduino
+    python firmware_emulator.py --rate 1000 --no-baud-limit --noise 4
+    python firmware_emulator.py --disconnect-every 30 --disconnect-for 2 --link /tmp/railroader-arduino
+
+Then set SERIAL_PORT to the printed port (or the --link path, which follows
+reconnects) and INPUT_SOURCE = "serial".
+"""
+
+import argparse
+import bisect
+import os
+import select
+import threading
+import time
+
+from clock import RealClock
+from simulator import ScenarioSimulator, SCENARIOS, NOISE_LSB, format_frame
+from step_mode import ANALOG_CHANNELS, DIGITAL_CHANNELS, MAX_THRESHOLDS
+
+BANNER = "Railroader Controller Ready"
+BOOT_DELAY = 1.0  # Seconds from power-up to the banner (the sketch's delay(1000))
+STEP_INTERVAL = 0.01  # Seconds between samples in step mode (STEP_INTERVAL in the sketch)
+BITS_PER_BYTE = 10  # 8N1: start bit + 8 data bits + stop bit
+
+
+class FirmwareEmulator:
+    """arduino_example.ino on a pseudo-terminal"""
+    def __init__(self, rate=20, scenario='mixed', seed=None, noise=NOISE_LSB, baud=9600,
+                 boot_delay=BOOT_DELAY, disconnect_every=0.0, disconnect_for=1.0, link=None,
+                 duration=None, tag=False, on_frame=None, on_drop=None):
+        """
+        Args:
+            rate: Raw frames per second (the sketch sends 20)
+            scenario: simulator.py scenario driving the levers
+            seed: Random seed (None = different every run)
+            noise: ADC noise (standard deviation, counts)
+            baud: Emulated line speed; frames never go out faster than it carries them (None = no limit)
+            boot_delay: Seconds before the banner and the first frame
+            disconnect_every: Seconds between disconnects (0 = never)
+            disconnect_for: Seconds until the port comes back
+            link: Symlink kept pointing at the current port (follows reconnects)
+            duration: Stop sending after this many seconds, but keep the port open (None = run until stop())
+            tag: Prefix every raw frame with SEQ:<n>; (for latency measurements)
+            on_frame: Optional callable(seq) right before frame `seq` is written
+            on_drop: Optional callable(seq) when the pty buffer was full
+        """
+        self.rate = rate
+        # Levers move in wall-clock time, however fast frames actually go out
+        self.simulator = ScenarioSimulator(scenario, seed, max(rate, 1.0 / STEP_INTERVAL), noise)
+        self._frame = None
+        self.baud = baud
+        self.boot_delay = boot_delay
+        self.disconnect_every = disconnect_every
+        self.disconnect_for = disconnect_for
+        self.link = link
+        self.duration = duration
+        self.tag = tag
+        self.on_frame = on_frame
+        self.on_drop = on_drop
+        self.clock = RealClock()
+        self.master = None
+        self.slave = None
+        self.port = None
+        self._buffer = b''
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Step mode state (same as the sketch)
+        self.step_mode = False
+        self.thresholds = {channel: [0] * MAX_THRESHOLDS for channel in ANALOG_CHANNELS}
+        self.counts = {channel: 0 for channel in ANALOG_CHANNELS}
+        self.hysteresis = {channel: 0 for channel in ANALOG_CHANNELS}
+        self.steps = {}
+
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.events_sent = 0
+        self.disconnects = 0
+
+    # ------------------------------------------------------------------ port
+
+    def _open_pty(self):
+        import pty
+        import tty
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)  # No echo or newline translation, like a real serial device
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self._buffer = b''
+        if self.link:
+            temp = self.link + ".new"
+            if os.path.lexists(temp):
+                os.remove(temp)
+            os.symlink(self.port, temp)
+            os.replace(temp, self.link)  # Atomic: readers never see a missing link
+
+    def _close_pty(self):
+        # Closing our slave end too makes the reader's port hang up (EIO), like unplugging USB
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = None
+
+    def start(self):
+        """Create the port and start the firmware thread; returns the port path"""
+        self._open_pty()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="firmware-emulator", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self._close_pty()
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+    # ------------------------------------------------------------------ firmware
+
+    def _run(self):
+        started = self.clock.now()
+        if self._wait(started + self.boot_delay):
+            return
+        self._write(BANNER + "\n")
+        next_frame = self.clock.now()
+        end = next_frame + self.duration if self.duration is not None else None
+        next_disconnect = next_frame + self.disconnect_every if self.disconnect_every else None
+        seq = 0
+        while not self._stop.is_set():
+            if end is not None and self.clock.now() >= end:
+                self._stop.wait()  # Done sending; the reader drains what is left
+                return
+            if next_disconnect is not None and self.clock.now() >= next_disconnect:
+                self._disconnect()
+                if self._stop.is_set():
+                    return
+                next_frame = self.clock.now()
+                next_disconnect = next_frame + self.disconnect_every
+
+            frame = self._frame = self.simulator.frame_now() or self._frame
+            if self.step_mode:
+                text = self._step_events(frame)
+                interval = STEP_INTERVAL
+            else:
+                text = format_frame(frame) + "\n"
+                if self.tag:
+                    text = f"SEQ:{seq};" + text
+                interval = 1.0 / self.rate
+                if self.on_frame is not None:
+                    self.on_frame(seq)
+            if text and not self._write(text):
+                self.frames_dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(seq)
+            elif not self.step_mode:
+                self.frames_sent += 1
+            seq += 1
+
+            if self.baud:
+                interval = max(interval, len(text) * BITS_PER_BYTE / self.baud)  # Serial.print blocks on a full link
+            next_frame += interval
+            if next_frame < self.clock.now():
+                next_frame = self.clock.now()  # Fell behind: don't burst
+            if self._wait(next_frame):
+                return
+
+    def _wait(self, deadline):
+        """Serve commands until `deadline`; True if stopped"""
+        while not self._stop.is_set():
+            remaining = deadline - self.clock.now()
+            if remaining <= self.clock.spin_margin:
+                self.clock.sleep_until(deadline)
+                return False
+            try:
+                ready, _, _ = select.select([self.master], [], [], remaining - self.clock.spin_margin)
+            except (OSError, ValueError):
+                ready = []
+            if ready:
+                self._read_commands()
+        return True
+
+    def _write(self, text):
+        try:
+            os.write(self.master, text.encode('ascii'))
+            return True
+        except (BlockingIOError, OSError):
+            return False
+
+    def _disconnect(self):
+        self.disconnects += 1
+        self._close_pty()
+        print(f"⚠ Emulator disconnected ({self.disconnect_for:g} s)")
+        if self._stop.wait(self.disconnect_for):
+            return
+        self._open_pty()
+        self.step_mode = False  # The Arduino restarts when it is plugged back in
+        print(f"✓ Emulator reconnected on {self.port}")
+        self._write(BANNER + "\n")
+
+    # ------------------------------------------------------------------ commands
+
+    def _read_commands(self):
+        try:
+            self._buffer += os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return
+        while b'\n' in self._buffer:
+            line, self._buffer = self._buffer.split(b'\n', 1)
+            reply = self.handle_command(line.decode('ascii', errors='replace').strip())
+            if reply:
+                self._write(reply + "\n")
+
+    def handle_command(self, line):
+        """Apply one command line; returns the reply ("OK" / "ERR ...")"""
+        parts = line.split()
+        if not parts:
+            return None
+        op, args = parts[0], parts[1:]
+        try:
+            if op == "T":
+                channel, start, values = args[0], int(args[1]), [int(v) for v in args[2:]]
+                if channel not in self.thresholds:
+                    return "ERR bad T command"
+                if start < 0 or start + len(values) > MAX_THRESHOLDS:
+                    return "ERR too many thresholds"
+                self.thresholds[channel][start:start + len(values)] = values
+            elif op == "H":
+                channel, count, hysteresis = args[0], int(args[1]), int(args[2])
+                if channel not in self.counts or not 0 <= count <= MAX_THRESHOLDS:
+                    return "ERR bad H command"
+                self.counts[channel] = count
+                self.hysteresis[channel] = hysteresis
+                self.steps.pop(channel, None)
+            elif op == "M":
+                if args == ["STEPS"]:
+                    self.step_mode = True
+                    self.steps.clear()
+                elif args == ["RAW"]:
+                    self.step_mode = False
+                else:
+                    return "ERR bad mode"
+            elif op == "?":
+                self.steps.clear()
+            else:
+                return "ERR unknown command"
+        except (IndexError, ValueError):
+            return f"ERR bad {op} command"
+        return "OK"
+
+    def quantize(self, channel, value):
+        """Step for a reading, with the sketch's hysteresis"""
+        thresholds = self.thresholds[channel][:self.counts[channel]]
+        step = self.steps.get(channel)
+        if step is None:
+            return bisect.bisect_right(thresholds, value)
+        up = bisect.bisect_right(thresholds, value - self.hysteresis[channel])
+        if up > step:
+            return up
+        down = bisect.bisect_right(thresholds, value + self.hysteresis[channel])
+        if down < step:
+            return down
+        return step
+
+    def _step_events(self, frame):
+        lines = []
+        for channel in ANALOG_CHANNELS + DIGITAL_CHANNELS:
+            if channel in self.counts:
+                step = self.quantize(channel, frame[channel])
+            else:
+                step = frame[channel]
+            if step != self.steps.get(channel):
+                self.steps[channel] = step
+                lines.append(f"@{channel}:{step}\n")
+        self.events_sent += len(lines)
+        return "".join(lines)
+
+    def stats(self):
+        return {
+            'port': self.port,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'step_events': self.events_sent,
+            'disconnects': self.disconnects,
+            'step_mode': self.step_mode,
+        }
+
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Railroader Arduino firmware emulator (pseudo-terminal)")
+    parser.add_argument("--rate", type=float, default=20, help="Raw frames per second")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--noise", type=float, default=NOISE_LSB, help="ADC noise (counts)")
+    parser.add_argument("--baud", type=int, default=9600, help="Emulated line speed")
+    parser.add_argument("--no-baud-limit", action="store_true", help="Send at --rate even if 9600 baud couldn't carry it")
+    parser.add_argument("--disconnect-every", type=float, default=0, help="Seconds between disconnects (0 = never)")
+    parser.add_argument("--disconnect-for", type=float, default=1.0, help="Seconds until the port comes back")
+    parser.add_argument("--link", help="Symlink that always points at the current port")
+    parser.add_argument("--duration", type=float, default=None, help="Stop sending after this many seconds")
+    args = parser.parse_args()
+
+    emulator = FirmwareEmulator(args.rate, args.scenario, args.seed, args.noise,
+                                None if args.no_baud_limit else args.baud,
+                                disconnect_every=args.disconnect_every, disconnect_for=args.disconnect_for,
+                                link=args.link, duration=args.duration)
+    try:
+        port = emulator.start()
+    except ImportError:
+        print("✗ Pseudo-terminals are not available on this platform")
+        return
+    print(f"✓ Emulated Arduino on {port}" + (f" (also {args.link})" if args.link else ""))
+    print(f"  Set SERIAL_PORT = \"{args.link or port}\" and INPUT_SOURCE = \"serial\" (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            stats = emulator.stats()
+            print(f"  frames={stats['frames_sent']} dropped={stats['frames_dropped']} "
+                  f"step_events={stats['step_events']} disconnects={stats['disconnects']}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
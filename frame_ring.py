@@ -0,0 +1,224 @@
+"""
+Shared-memory frame ring: serial input in its own process
+Key injection (pynput / pyautogui) holds the GIL for the whole OS call, and
+while it does, a reader thread in the same process can't read or parse the
+next frame. With SERIAL_PROCESS = True the serial source runs in a child
+process instead. The child writes every frame into a fixed-layout ring in
+shared memory; the control loop takes the newest one each tick. Neither
+side ever waits for the other: there are no locks, only sequence numbers.
+
+Layout (little-endian):
+
+    Header   magic "RRFR", version, channel count, capacity
+             write_seq    frames written so far (frame n lives in slot (n - 1) % capacity)
+             state        STARTING / RUNNING / DISCONNECTED / FAILED / STOPPED (set by the child)
+             stop         set by the parent to end the child
+             drops, parse_errors   the child's counters
+    Slot     seq          frame number, 0 while the slot is being rewritten
+             time         time.monotonic() when the frame was read
+             present      bit i set = CHANNELS[i] is in the frame
+             values       one int32 per channel
+
+The writer clears a slot's seq, fills the slot, sets seq, then publishes
+write_seq. A reader copies the slot and checks that seq was the frame it
+wanted before and after the copy, so it never sees a half-written frame.
+"""
+
+import queue
+import struct
+import time
+from multiprocessing import shared_memory
+
+import metrics
+
+MAGIC = b"RRFR"
+VERSION = 1
+# Fixed channel order; other keys in a frame are not carried (SEQ tags benchmark frames)
+CHANNELS = ('WHISTLE', 'BELL', 'HEADLIGHT', 'CYLINDER', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE', 'SEQ')
+CAPACITY = 64  # Frames kept; at 1 kHz input that is 64 ms of history
+
+STARTING, RUNNING, FAILED, STOPPED, DISCONNECTED = 0, 1, 2, 3, 4  # DISCONNECTED = running, but reads fail
+READ_TIMEOUT = 0.1  # Seconds the child blocks on the port before checking for stop
+ERROR_BACKOFF = 0.1  # Seconds the child pauses after a read error (no busy loop on a dead port)
+
+HEADER = struct.Struct("<4sHHI4x Q I I Q Q")  # magic, version, channels, capacity | write_seq, state, stop, drops, parse_errors
+SLOT = struct.Struct(f"<Q d I {len(CHANNELS)}i 4x")
+SEQ = struct.Struct("<Q")
+WRITE_SEQ_OFFSET = 16
+STATE_OFFSET = 24
+STOP_OFFSET = 28
+COUNTERS = struct.Struct("<Q Q")
+COUNTERS_OFFSET = 32
+
+STAGE_TRANSFER = metrics.stage('ring_transfer')  # Child read the frame → control loop took it
+
+
+class FrameRing:
+    """A frame ring in shared memory (create in the parent, attach in the child)"""
+    def __init__(self, shm, capacity, owner):
+        self.shm = shm
+        self.buf = shm.buf
+        self.capacity = capacity
+        self.owner = owner
+        self.last_seq = 0  # Reader: newest frame taken
+
+    @classmethod
+    def create(cls, capacity=CAPACITY):
+        shm = shared_memory.SharedMemory(create=True, size=HEADER.size + capacity * SLOT.size)
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, len(CHANNELS), capacity, 0, STARTING, 0, 0, 0)
+        return cls(shm, capacity, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Raises:
+            ValueError: The segment isn't a frame ring of this version
+        """
+        # A spawned child shares its parent's resource tracker, so attaching
+        # here doesn't make the segment outlive (or die with) this process
+        shm = shared_memory.SharedMemory(name=name)
+        magic, version, channels, capacity = HEADER.unpack_from(shm.buf, 0)[:4]
+        if magic != MAGIC or version != VERSION or channels != len(CHANNELS):
+            shm.close()
+            raise ValueError(f"{name} is not a version {VERSION} frame ring")
+        return cls(shm, capacity, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    # ------------------------------------------------------------------ writer
+
+    def write(self, frame, received_at=None):
+        """
+        Append a frame (single writer only)
+
+        Raises:
+            struct.error: A value doesn't fit in 32 bits (nothing is written)
+        """
+        seq = SEQ.unpack_from(self.buf, WRITE_SEQ_OFFSET)[0] + 1
+        offset = self._slot_offset(seq)
+        present = 0
+        values = []
+        for i, channel in enumerate(CHANNELS):
+            value = frame.get(channel)
+            if value is None:
+                values.append(0)
+            else:
+                present |= 1 << i
+                values.append(value)
+        slot = SLOT.pack(0, time.monotonic() if received_at is None else received_at, present, *values)
+        SEQ.pack_into(self.buf, offset, 0)  # Readers skip the slot until it's complete
+        self.buf[offset:offset + SLOT.size] = slot
+        SEQ.pack_into(self.buf, offset, seq)
+        SEQ.pack_into(self.buf, WRITE_SEQ_OFFSET, seq)
+
+    def set_state(self, state):
+        struct.pack_into("<I", self.buf, STATE_OFFSET, state)
+
+    def set_counters(self, drops, parse_errors):
+        COUNTERS.pack_into(self.buf, COUNTERS_OFFSET, drops, parse_errors)
+
+    def stop_requested(self):
+        return struct.unpack_from("<I", self.buf, STOP_OFFSET)[0] != 0
+
+    # ------------------------------------------------------------------ reader
+
+    def latest(self):
+        """
+        Newest frame since the last call
+
+        Returns:
+            (frame dict, frames skipped) or (None, 0) if nothing new
+        """
+        while True:
+            seq = SEQ.unpack_from(self.buf, WRITE_SEQ_OFFSET)[0]
+            if seq == self.last_seq:
+                return None, 0
+            slot = SLOT.unpack_from(self.buf, self._slot_offset(seq))
+            if slot[0] != seq or SEQ.unpack_from(self.buf, self._slot_offset(seq))[0] != seq:
+                continue  # The writer lapped the ring while we copied; take the newer frame
+            skipped = seq - self.last_seq - 1
+            self.last_seq = seq
+            STAGE_TRANSFER.observe(time.monotonic() - slot[1])
+            present = slot[2]
+            return {channel: slot[3 + i] for i, channel in enumerate(CHANNELS) if present & (1 << i)}, skipped
+
+    def state(self):
+        return struct.unpack_from("<I", self.buf, STATE_OFFSET)[0]
+
+    def request_stop(self):
+        struct.pack_into("<I", self.buf, STOP_OFFSET, 1)
+
+    def counters(self):
+        """(drops, parse_errors) reported by the child"""
+        return COUNTERS.unpack_from(self.buf, COUNTERS_OFFSET)
+
+    def _slot_offset(self, seq):
+        return HEADER.size + ((seq - 1) % self.capacity) * SLOT.size
+
+
+# ============================================================================
+# CHILD PROCESS
+# ============================================================================
+
+def run_reader(source, ring_name, commands, realtime_options=None):
+    """
+    Child process entry: read frames from `source` into the ring until the
+    parent asks to stop
+
+    Args:
+        source: Unopened InputSource (SerialSource / StepSerialSource)
+        ring_name: Shared memory name from FrameRing.create()
+        commands: multiprocessing.Queue of new step tables (passed to source.reconfigure)
+        realtime_options: realtime.enable() arguments, or None
+    """
+    ring = FrameRing.attach(ring_name)
+    if realtime_options:
+        import realtime
+        realtime.enable(**realtime_options)
+    drops = metrics.counter('drops')
+    parse_errors = metrics.counter('parse_errors')
+    try:
+        if not source.open():
+            ring.set_state(FAILED)
+            return
+        ring.set_state(RUNNING)
+        while not ring.stop_requested():
+            _run_commands(source, commands)
+            errors = drops.value
+            frame = source.wait(READ_TIMEOUT)
+            if frame is not None:
+                try:
+                    ring.write(frame)
+                except struct.error:
+                    parse_errors.inc()  # A value out of range for the ring
+            ring.set_counters(drops.value, parse_errors.value)
+            ring.set_state(RUNNING if source.connected() else DISCONNECTED)
+            if drops.value != errors:
+                time.sleep(ERROR_BACKOFF)
+        ring.set_state(STOPPED)
+    except KeyboardInterrupt:
+        pass  # Ctrl+C reaches the whole console group; the parent shuts us down
+    finally:
+        source.close()
+        ring.close()
+
+
+def _run_commands(source, commands):
+    while True:
+        try:
+            tables = commands.get_nowait()
+        except queue.Empty:
+            return
+        if hasattr(source, 'reconfigure'):
+            source.reconfigure(tables)
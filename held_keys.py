@@ -0,0 +1,189 @@
+"""
+Held-key registry: every key press in the controller goes through here
+
+The registry knows which keys are down right now, releases timed holds from
+the scheduler (no blocking sleeps), and can release everything at once:
+
+    release_all('shutdown' | 'focus' | 'error' | 'watchdog')
+
+The watchdog runs on the scheduler. It releases everything if the control
+loop stops calling heartbeat(). It also retries a timed release that is
+overdue (e.g. because the backend raised). stuck_key_recoveries counts the
+keys that were really stuck: those the watchdog released, and timed holds
+found overdue by release_all(). A key that is simply down when the game
+loses focus or the controller stops is released without being counted.
+"""
+
+import threading
+import time
+
+import metrics
+
+REPRESS_GAP = 0.03  # Seconds a key stays up before it may be pressed again (the game needs to see the key-up)
+WATCHDOG_INTERVAL = 0.1  # Seconds between watchdog checks
+WATCHDOG_TIMEOUT = 1.0  # Release everything if the control loop is silent this long
+OVERDUE_GRACE = 0.1  # Seconds past its release time before a timed hold counts as stuck
+
+
+class HeldKeyRegistry:
+    """Tracks pressed keys and guarantees they are released"""
+    def __init__(self, keyboard, scheduler, clock=time.monotonic, on_recovery=None):
+        """
+        Args:
+            keyboard: Backend with press(key) and release(key)
+            scheduler: TimerScheduler for timed releases and the watchdog
+            clock: Time source in seconds
+            on_recovery: Optional callable(reason, keys) after an emergency release
+        """
+        self.keyboard = keyboard
+        self.scheduler = scheduler
+        self.clock = clock
+        self.on_recovery = on_recovery
+        self.held = {}  # Key → (pressed at, release at or None, release timer or None)
+        self.released_at = {}  # Key → time of its last release
+        self.last_heartbeat = clock()
+        self.enabled = True  # False = refuse all presses (e.g. while the game is not focused)
+        self.recoveries = metrics.counter('stuck_key_recoveries', "Stuck keys force-released (overdue timed holds, watchdog)")
+        self.on_press = None  # Optional callable(key, hold) after the backend pressed a key
+        self.on_release = None  # Optional callable(key, seconds held, reason) after it released one
+        self._lock = threading.RLock()
+        self._watchdog = None
+
+    def is_held(self, key):
+        return key in self.held
+
+    def any_held(self, keys):
+        return any(key in self.held for key in keys)
+
+    def ready(self, key):
+        """True if the key is up and has been up for at least REPRESS_GAP"""
+        if key in self.held:
+            return False
+        released = self.released_at.get(key)
+        return released is None or self.clock() - released >= REPRESS_GAP
+
+    # ---------------------------------------------------------------- presses
+
+    def press(self, key, hold=None):
+        """
+        Press a key
+
+        Args:
+            key: Key to press
+            hold: None = stay down until release(), 0 = tap, > 0 = release after `hold` seconds
+
+        Returns:
+            False (nothing sent) if presses are disabled, or the key is still
+            down or was released too recently
+        """
+        with self._lock:
+            if not self.enabled or not self.ready(key):
+                return False
+            now = self.clock()
+            self.keyboard.press(key)
+            # Tracked before anything else can raise, so the key is always released
+            release_at = None if hold is None else now + hold
+            self.held[key] = (now, release_at, None)
+            if hold == 0:
+                try:
+                    if self.on_press is not None:
+                        self.on_press(key, hold)
+                finally:
+                    self._release(key)
+                return True
+            if hold is not None:
+                self.held[key] = (now, release_at, self.scheduler.call_at(release_at, self.release, key))
+            if self.on_press is not None:
+                self.on_press(key, hold)
+            return True
+
+    def release(self, key, reason='release'):
+        """
+        Release a key if it is held (safe to call twice)
+
+        Args:
+            key: Key to release
+            reason: Passed to on_release ('watchdog' for an overdue hold the watchdog recovers)
+        """
+        with self._lock:
+            entry = self.held.get(key)
+            if entry is None:
+                return False
+            if entry[2] is not None:
+                entry[2].cancel()
+            self._release(key, reason)
+            return True
+
+    def _release(self, key, reason='release'):
+        # Forget the key only once the backend accepted the release, so a
+        # failed release is retried by the watchdog instead of being lost
+        self.keyboard.release(key)
+        pressed_at = self.held.pop(key)[0]
+        self.released_at[key] = now = self.clock()
+        if self.on_release is not None:
+            self.on_release(key, now - pressed_at, reason)
+
+    def release_all(self, reason="shutdown"):
+        """
+        Release every held key right now
+
+        Returns:
+            Number of keys released
+        """
+        with self._lock:
+            now = self.clock()
+            keys = list(self.held)
+            released = []
+            stuck = 0
+            for key in keys:
+                _, release_at, timer = self.held[key]
+                if timer is not None:
+                    timer.cancel()
+                try:
+                    self._release(key, reason)
+                    released.append(key)
+                except Exception:
+                    continue  # Left in `held`; the watchdog retries
+                if reason == 'watchdog' or (release_at is not None and now - release_at > OVERDUE_GRACE):
+                    stuck += 1
+        if stuck:
+            self.recoveries.inc(stuck)
+        if released and self.on_recovery is not None:
+            self.on_recovery(reason, released)
+        return len(released)
+
+    # --------------------------------------------------------------- watchdog
+
+    def heartbeat(self):
+        """Called by the control loop every iteration"""
+        self.last_heartbeat = self.clock()
+
+    def start_watchdog(self, interval=WATCHDOG_INTERVAL):
+        if self._watchdog is None:
+            self.last_heartbeat = self.clock()
+            self._watchdog = self.scheduler.call_every(interval, self.check)
+
+    def stop_watchdog(self):
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+
+    def check(self):
+        """Watchdog tick: release everything if the loop stalled, retry overdue releases"""
+        if not self.held:
+            return
+        now = self.clock()
+        if now - self.last_heartbeat > WATCHDOG_TIMEOUT:
+            self.release_all('watchdog')
+            return
+        with self._lock:
+            overdue = [key for key, (_, release_at, _) in self.held.items()
+                       if release_at is not None and now - release_at > OVERDUE_GRACE]
+        for key in overdue:
+            try:
+                if self.release(key, 'watchdog'):
+                    self.recoveries.inc()
+                    if self.on_recovery is not None:
+                        self.on_recovery('overdue', [key])
+            except Exception:
+                pass
@@ -0,0 +1,744 @@
+"""
+Input sources for the Railroader controller
+
+Every source delivers control frames (dicts of channel → value) through the
+same interface:
+
+    open()          Connect / start; returns True on success
+    poll()          Non-blocking: newest frame, or None if nothing new
+    wait(timeout)   Blocking: wait up to `timeout` seconds for a frame
+    close()         Disconnect / stop
+    connected()     False while the source knows it gets no input (port gone, panels down)
+    stats()         Dict of source-specific health info (may be empty)
+
+InputManager holds the active source and can switch to another one at
+runtime; the switch is applied by the control loop between ticks, so the
+loop never reads from a half-closed source. Sources are only created when
+selected, so unused ones cost nothing.
+"""
+
+import os
+import select
+import threading
+import time
+
+import metrics
+from clock import RealClock
+from frame_ring import CAPACITY, DISCONNECTED, RUNNING, STARTING, FrameRing, run_reader
+from step_mode import StepDecoder, table_commands
+
+STAGE_READ = metrics.stage('serial_read')
+STAGE_PARSE = metrics.stage('parse')
+DROPS = metrics.counter('drops', "Frames received but discarded before handling")
+PARSE_ERRORS = metrics.counter('parse_errors', "Frames that failed to parse")
+
+
+# ============================================================================
+# INTERFACE
+# ============================================================================
+
+class InputSource:
+    """Base class: subclasses implement poll(), and wait() when they can block efficiently"""
+    name = "base"
+
+    def open(self):
+        return True
+
+    def poll(self):
+        return None
+
+    def wait(self, timeout):
+        """Default blocking wait: poll every millisecond until a frame or the timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.poll()
+            if frame is not None:
+                return frame
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(0.001, remaining))
+
+    def close(self):
+        pass
+
+    def connected(self):
+        return True
+
+    def stats(self):
+        return {}
+
+
+# ============================================================================
+# SOURCES
+# ============================================================================
+
+class SimulationSource(InputSource):
+    """Generated frames (a new one on every poll)"""
+    name = "simulation"
+
+    def __init__(self, generate, interval=0.05):
+        """
+        Args:
+            generate: Callable returning a frame dict
+            interval: Seconds between frames for wait()
+        """
+        self.generate = generate
+        self.interval = interval
+
+    def poll(self):
+        return self.generate()
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        return self.generate()
+
+
+class SerialSource(InputSource):
+    """Single Arduino on a serial port"""
+    name = "serial"
+
+    def __init__(self, port, baud, open_connection, parse, ser=None):
+        """
+        Args:
+            port: Serial port (e.g. "COM3")
+            baud: Baud rate
+            open_connection: Callable(port, baud) returning a serial object or None
+            parse: Callable(line) returning a frame dict or None
+            ser: Already-open serial object (skips open_connection)
+        """
+        self.port = port
+        self.baud = baud
+        self.open_connection = open_connection
+        self.parse = parse
+        self.ser = ser
+        self.last_error = None
+        self._failing = False  # The last read raised
+        self._last_line = None  # Raw bytes of the last parsed line …
+        self._last_frame = None  # … and its frame
+
+    def open(self):
+        if self.ser is None:
+            self.ser = self.open_connection(self.port, self.baud)
+        return self.ser is not None
+
+    def poll(self):
+        # Read every line waiting and keep the newest frame: a panel sending faster
+        # than the loop ticks would otherwise queue up in the OS buffer, and every
+        # tick would act on an older frame than the last
+        frame = None
+        try:
+            while self.ser.in_waiting:
+                data = self._read_frame()
+                if data is not None:
+                    if frame is not None:
+                        DROPS.inc()
+                    frame = data
+        except Exception as e:
+            self._read_error(e)
+        return frame
+
+    def wait(self, timeout):
+        try:
+            self.ser.timeout = timeout  # Reconfigures the port, so it fails too once the device is gone
+            frame = self._read_frame()
+        except Exception as e:
+            self._read_error(e)
+            return None
+        newer = self.poll()  # Take any frames right behind it too (latest wins)
+        if newer is None:
+            return frame
+        if frame is not None:
+            DROPS.inc()
+        return newer
+
+    def _read_error(self, error):
+        """Count the dropped frame; print each distinct error once"""
+        DROPS.inc()
+        self._failing = True
+        if str(error) != self.last_error:
+            self.last_error = str(error)
+            print(f"✗ Error reading from serial: {error}")
+
+    def _read_frame(self):
+        t0 = time.perf_counter()
+        raw = self.ser.readline()
+        t1 = time.perf_counter()
+        STAGE_READ.observe(t1 - t0)
+        self._failing = False
+        if raw == self._last_line:
+            # Levers standing still: the same frame again, without decoding,
+            # splitting and building a dict (frames are read-only downstream)
+            return self._last_frame
+        line = raw.decode('utf-8').strip()
+        if not line:
+            return None
+        data = self.parse(line)
+        if data is not None:
+            self._last_line, self._last_frame = raw, data
+        STAGE_PARSE.observe(time.perf_counter() - t1)
+        return data
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except Exception:
+                pass
+            self.ser = None
+
+    def connected(self):
+        return self.ser is not None and not self._failing
+
+
+class StepSerialSource(SerialSource):
+    """
+    Arduino in step mode (see step_mode.py): the tables are pushed at connect
+    time and the Arduino sends only step changes. Firmware without step mode
+    doesn't answer the commands; the source then reads raw frames as usual.
+    """
+    BOOT_TIMEOUT = 3.0  # Seconds to wait for the Arduino to restart after the port opens
+    ACK_TIMEOUT = 1.0  # Seconds to wait for each command's OK
+
+    def __init__(self, port, baud, open_connection, parse, tables, hysteresis, ser=None):
+        """
+        Args:
+            port, baud, open_connection, parse, ser: As for SerialSource
+            tables: From step_mode.build_step_tables()
+            hysteresis: ADC counts past a threshold before a step changes
+        """
+        super().__init__(port, baud, open_connection, parse, ser)
+        self.decoder = StepDecoder(tables)
+        self.hysteresis = hysteresis
+        self.steps = False
+        self.events = metrics.counter('step_events', "Step changes received from the Arduino")
+
+    def open(self):
+        if not super().open():
+            return False
+        try:
+            self.steps = self._handshake()
+        except Exception as e:
+            print(f"✗ Step mode setup failed: {e}")
+            self.steps = False
+        if self.steps:
+            print(f"✓ Step mode: Arduino sends step changes only (hysteresis {self.hysteresis})")
+        else:
+            print("⚠ Arduino firmware has no step mode - reading raw frames")
+        return True
+
+    def _handshake(self):
+        """Push the tables and switch the Arduino to step mode; False if it never answers"""
+        self.ser.timeout = self.BOOT_TIMEOUT
+        self.ser.readline()  # "Railroader Controller Ready" or a raw frame once it is running
+        self.ser.reset_input_buffer()
+        commands = table_commands(self.decoder.tables, self.hysteresis) + ["M STEPS"]
+        for command in commands:
+            self.ser.write((command + "\n").encode('ascii'))
+            reply = self._read_reply()
+            if reply is None:
+                return False
+            if reply != "OK":
+                raise ValueError(f"{command.split()[0]} command rejected: {reply}")
+        return True
+
+    def _read_reply(self):
+        """Next OK/ERR line (raw frames in between are skipped)"""
+        deadline = time.monotonic() + self.ACK_TIMEOUT
+        while time.monotonic() < deadline:
+            self.ser.timeout = max(0.0, deadline - time.monotonic())
+            line = self.ser.readline().decode('utf-8', errors='replace').strip()
+            if line == "OK" or line.startswith("ERR"):
+                return line
+        return None
+
+    def reconfigure(self, tables):
+        """Push new tables while running (after a config reload); the replies are ignored"""
+        self.decoder.tables = tables
+        if self.steps and self.ser is not None:
+            commands = table_commands(tables, self.hysteresis) + ["?"]
+            self.ser.write("".join(command + "\n" for command in commands).encode('ascii'))
+
+    def poll(self):
+        if not self.steps:
+            return super().poll()
+        changed = False
+        try:
+            while self.ser.in_waiting:
+                changed |= self._read_event()
+        except Exception as e:
+            self._read_error(e)
+        return dict(self.decoder.frame) if changed else None
+
+    def wait(self, timeout):
+        if not self.steps:
+            return super().wait(timeout)
+        try:
+            self.ser.timeout = timeout
+            if self._read_event():
+                return self.poll() or dict(self.decoder.frame)  # Take any events right behind it too
+        except Exception as e:
+            self._read_error(e)
+        return None
+
+    def _read_event(self):
+        t0 = time.perf_counter()
+        line = self.ser.readline().decode('utf-8').strip()
+        t1 = time.perf_counter()
+        STAGE_READ.observe(t1 - t0)
+        self._failing = False
+        if not self.decoder.feed(line):
+            return False
+        self.events.inc()
+        STAGE_PARSE.observe(time.perf_counter() - t1)
+        return True
+
+    def stats(self):
+        return {'steps': self.steps}
+
+
+class PanelSetSource(InputSource):
+    """Several serial panels merged into one channel table (see panels.py)"""
+    name = "panels"
+
+    def __init__(self, panel_set):
+        self.panel_set = panel_set
+
+    def open(self):
+        self.panel_set.start()
+        return True
+
+    def poll(self):
+        return self.panel_set.merged_frame()
+
+    def close(self):
+        self.panel_set.stop()
+
+    def connected(self):
+        return any(panel.connected for panel in self.panel_set.panels)
+
+    def stats(self):
+        return {'panels': self.panel_set.health()}
+
+
+class UdpSource(InputSource):
+    """Network panel over UDP (see udp_input.py)"""
+    name = "udp"
+
+    def __init__(self, port, bind, parse, clock=time.monotonic):
+        self.port = port
+        self.bind = bind
+        self.parse = parse
+        self.clock = clock
+        self.udp = None
+
+    def open(self):
+        from udp_input import UdpInput
+        try:
+            self.udp = UdpInput(self.port, self.bind, self.parse, self.clock)
+        except OSError as e:
+            print(f"✗ Could not listen on UDP port {self.port}: {e}")
+            return False
+        return True
+
+    def poll(self):
+        return self.udp.poll()
+
+    def wait(self, timeout):
+        frame = self.udp.poll()
+        if frame is None:
+            ready, _, _ = select.select([self.udp.sock], [], [], timeout)
+            if ready:
+                frame = self.udp.poll()
+        return frame
+
+    def close(self):
+        if self.udp is not None:
+            self.udp.close()
+            self.udp = None
+
+    def connected(self):
+        # Connectionless: the panel counts as gone once it has been silent for a while
+        return self.udp is not None and not self.udp.silent()
+
+    def stats(self):
+        return {'udp': self.udp.stats()} if self.udp is not None else {}
+
+
+class PtySource(InputSource):
+    """
+    Pseudo-terminal input (Linux/macOS): creates a pty pair and reads frames
+    from the master side. Point any writer - e.g. the firmware emulator - at
+    `slave_path` as if it were the Arduino.
+    """
+    name = "pty"
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.master = None
+        self.slave = None
+        self.slave_path = None
+        self._buffer = b''
+
+    def open(self):
+        try:
+            import pty
+            import tty
+        except ImportError:
+            print("✗ Pseudo-terminals are not available on this platform")
+            return False
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.slave_path = os.ttyname(self.slave)
+        print(f"✓ Pseudo-terminal ready: write frames to {self.slave_path}")
+        return True
+
+    def poll(self):
+        try:
+            self._buffer += os.read(self.master, 65536)
+        except (BlockingIOError, OSError):
+            pass
+        if b'\n' not in self._buffer:
+            return None
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        text = line.decode('utf-8', errors='replace').strip()
+        return self.parse(text) if text else None
+
+    def wait(self, timeout):
+        frame = self.poll()
+        if frame is None and b'\n' not in self._buffer:
+            ready, _, _ = select.select([self.master], [], [], timeout)
+            if ready:
+                frame = self.poll()
+        return frame
+
+    def close(self):
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = None
+
+
+class ReplaySource(InputSource):
+    """
+    Replays a recorded frame log at its original timing (scaled by `speed`)
+    Log format, one frame per line:  <seconds since start> <frame>
+    (as written by RecordingSource). Lines without a timestamp are played
+    back every `interval` seconds.
+    """
+    name = "replay"
+
+    def __init__(self, path, parse, speed=1.0, loop=False, interval=0.05, clock=None):
+        self.path = path
+        self.parse = parse
+        self.speed = speed
+        self.loop = loop
+        self.interval = interval
+        # Playback follows this clock and wait() sleeps on it (a VirtualClock for offline runs)
+        self.clock = clock if clock is not None else RealClock()
+        self.frames = []
+        self.index = 0
+        self.started_at = None
+
+    def open(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for number, line in enumerate(f):
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    stamp, _, frame = line.partition(' ')
+                    try:
+                        offset = float(stamp)
+                    except ValueError:
+                        offset, frame = number * self.interval, line
+                    self.frames.append((offset, frame))
+        except OSError as e:
+            print(f"✗ Could not open replay file {self.path}: {e}")
+            return False
+        print(f"✓ Replaying {len(self.frames)} frames from {self.path}")
+        return bool(self.frames)
+
+    def _due(self):
+        """Index of the newest frame whose time has come"""
+        if self.started_at is None:
+            self.started_at = self.clock.now()
+        elapsed = (self.clock.now() - self.started_at) * self.speed
+        index = self.index
+        while index < len(self.frames) and self.frames[index][0] <= elapsed:
+            index += 1
+        return index
+
+    def poll(self):
+        if self.index >= len(self.frames):
+            if not self.loop:
+                return None
+            self.index, self.started_at = 0, None
+        due = self._due()
+        if due == self.index:
+            return None
+        self.index = due
+        return self.parse(self.frames[due - 1][1])  # Latest wins
+
+    def wait(self, timeout):
+        frame = self.poll()
+        if frame is None and self.index < len(self.frames) and self.started_at is not None:
+            next_at = self.started_at + self.frames[self.index][0] / self.speed
+            self.clock.sleep(max(0.0, min(timeout, next_at - self.clock.now())))
+            frame = self.poll()
+        return frame
+
+    def finished(self):
+        """True once every frame has been played (never while looping)"""
+        return not self.loop and self.index >= len(self.frames)
+
+    def stats(self):
+        return {'replay': (self.index, len(self.frames))}
+
+
+class RecordingSource(InputSource):
+    """Wraps another source and appends every frame it returns to a log (for ReplaySource)"""
+
+    def __init__(self, inner, path):
+        self.inner = inner
+        self.name = inner.name
+        self.path = path
+        self.file = None
+        self.started_at = None
+
+    def open(self):
+        if not self.inner.open():
+            return False
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.started_at = time.monotonic()
+        return True
+
+    def _record(self, frame):
+        if frame is not None:
+            frame_text = ";".join(f"{channel}:{value}" for channel, value in frame.items())
+            self.file.write(f"{time.monotonic() - self.started_at:.4f} {frame_text}\n")
+        return frame
+
+    def poll(self):
+        return self._record(self.inner.poll())
+
+    def wait(self, timeout):
+        return self._record(self.inner.wait(timeout))
+
+    def close(self):
+        self.inner.close()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def connected(self):
+        return self.inner.connected()
+
+    def stats(self):
+        return self.inner.stats()
+
+
+class ProcessSource(InputSource):
+    """
+    Runs a serial source in a child process and takes its frames from a
+    shared-memory ring (see frame_ring.py), so key injection in this process
+    never delays reading and parsing, and reading never delays the keys
+    """
+    START_TIMEOUT = 10.0  # Seconds for the child to start and open the port (a step handshake takes a few)
+    STOP_TIMEOUT = 2.0  # Seconds to wait for the child to exit before terminating it
+
+    def __init__(self, source, realtime_options=None, capacity=CAPACITY):
+        """
+        Args:
+            source: Unopened SerialSource / StepSerialSource (opened in the child)
+            realtime_options: realtime.enable() arguments for the child, or None
+            capacity: Frames in the ring
+        """
+        self.source = source
+        self.name = source.name
+        self.realtime_options = realtime_options
+        self.capacity = capacity
+        self.ring = None
+        self.process = None
+        self.commands = None
+        self.superseded = 0  # Frames replaced by a newer one before the loop took them
+        self._counters = (0, 0)
+
+    def open(self):
+        import multiprocessing
+        context = multiprocessing.get_context('spawn')  # The same on every OS (Windows can only spawn)
+        self.ring = FrameRing.create(self.capacity)
+        self.commands = context.Queue()
+        self.process = context.Process(target=run_reader, name=f"{self.name}-reader", daemon=True,
+                                       args=(self.source, self.ring.name, self.commands, self.realtime_options))
+        self.process.start()
+        deadline = time.monotonic() + self.START_TIMEOUT
+        while self.ring.state() == STARTING and self.process.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if self.ring.state() not in (RUNNING, DISCONNECTED):
+            print("✗ Serial reader process failed to start")
+            self.close()
+            return False
+        print(f"✓ Reading {self.name} in process {self.process.pid}")
+        return True
+
+    def poll(self):
+        frame, skipped = self.ring.latest()
+        if frame is not None:
+            self.superseded += skipped
+            self._sync_counters()
+        return frame
+
+    def reconfigure(self, tables):
+        """Hand new step tables to the source in the child"""
+        self.commands.put(tables)
+
+    def _sync_counters(self):
+        """Add the child's new drops and parse errors to this process's counters"""
+        counters = self.ring.counters()
+        if counters != self._counters:
+            DROPS.inc(counters[0] - self._counters[0])
+            PARSE_ERRORS.inc(counters[1] - self._counters[1])
+            self._counters = counters
+
+    def close(self):
+        if self.process is not None:
+            self.ring.request_stop()
+            self.process.join(self.STOP_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(self.STOP_TIMEOUT)
+            self.process = None
+        if self.commands is not None:
+            self.commands.close()
+            self.commands = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def connected(self):
+        return self.ring is not None and self.ring.state() == RUNNING
+
+    def stats(self):
+        if self.ring is None:
+            return {}
+        self._sync_counters()
+        return {'process': {'pid': self.process.pid if self.process else None,
+                            'alive': self.process is not None and self.process.is_alive(),
+                            'frames': self.ring.last_seq, 'superseded': self.superseded}}
+
+
+# ============================================================================
+# MANAGER (RUNTIME SWITCHING)
+# ============================================================================
+
+class InputManager:
+    """
+    Owns the active input source and switches between sources at runtime
+    switch() may be called from any thread; the control loop applies it
+    at its next poll, so there is never a tick without a valid source.
+    """
+    def __init__(self, factory, on_switch=None):
+        """
+        Args:
+            factory: Callable(name) → InputSource (unopened); raises ValueError for unknown names
+            on_switch: Callable(source) run once a new source is current (on the thread that made it current)
+        """
+        self.factory = factory
+        self.on_switch = on_switch
+        self.current = None
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def select(self, name):
+        """Open a source and make it current immediately (use before the loop starts)"""
+        source = self.factory(name)
+        if not source.open():
+            return False
+        old, self.current = self.current, source
+        if old is not None:
+            old.close()
+        if self.on_switch is not None:
+            self.on_switch(source)
+        return True
+
+    def switch(self, name):
+        """
+        Prepare a source and hand it to the control loop (safe from any thread)
+
+        Returns:
+            True if the new source opened and will be used from the next tick
+        """
+        source = self.factory(name)
+        if not source.open():
+            return False
+        with self._lock:
+            if self._pending is not None:
+                self._pending.close()
+            self._pending = source
+        return True
+
+    def reopen(self, name):
+        """
+        Replace the current source at once, closing it before the new one opens
+        (control loop thread only, between ticks) - for a new source that needs
+        what the current one holds, such as the same serial port. If the new
+        source doesn't open, the current one is opened again and stays current.
+
+        Returns:
+            True if the new source opened and is current
+        """
+        source = self.factory(name)
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.close()
+        old = self.current
+        old.close()
+        if not source.open():
+            old.open()
+            return False
+        self.current = source
+        print(f"✓ Input source reopened as {source.name}")
+        if self.on_switch is not None:
+            self.on_switch(source)
+        return True
+
+    def _apply_pending(self):
+        with self._lock:
+            source, self._pending = self._pending, None
+        if source is not None:
+            old, self.current = self.current, source
+            if old is not None:
+                old.close()
+            print(f"✓ Input source switched to {source.name}")
+            if self.on_switch is not None:
+                self.on_switch(source)
+
+    def poll(self):
+        if self._pending is not None:
+            self._apply_pending()
+        return self.current.poll()
+
+    def wait(self, timeout):
+        if self._pending is not None:
+            self._apply_pending()
+        return self.current.wait(timeout)
+
+    def close(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+        for source in (pending, self.current):
+            if source is not None:
+                source.close()
+        self.current = None
+
+    def connected(self):
+        return self.current is not None and self.current.connected()
+
+    def stats(self):
+        return self.current.stats() if self.current is not None else {}
@@ -0,0 +1,436 @@
+"""
+Key audit log and session analyzer
+With KEY_AUDIT_FILE set, the controller appends a compact binary record for
+every key a handler asked for (an intent, sent or refused) and for every
+key the backend actually pressed and released. The analyzer reads the log
+back and answers "how many keys did we send, how many were wasted, and how
+far behind the panel was the game?".
+
+    python key_audit.py railroader_keys.bin             # report
+    python key_audit.py railroader_keys.bin --json -    # the same as JSON
+
+Records are fixed-size (34 bytes, little-endian), so a log of many hours is
+read in chunks and never held in memory:
+
+    kind     u8   SESSION / INTENT / PRESS / RELEASE
+    control  u8   index into CHANNELS (255 = key of no control, e.g. Shift)
+    flags    u8   INTENT: SENT, SHIFT, HAS_ASSUMED; RELEASE: index into REASONS
+    frame    u32  frames handled so far in the session
+    time     f64  seconds since the session started (SESSION: time.time())
+    hold     f32  INTENT/PRESS: requested hold (0 = tap, -1 = until released);
+                  RELEASE: seconds the key was actually down
+    target   i16  INTENT: step / zone / state the panel asks for (whistle -1 low, 0 off, 1 high)
+    assumed  i16  INTENT: where we assume the game is, before this key
+    key      10s  key name, UTF-8
+
+Every run starts with a SESSION record whose key is MAGIC.
+Records are written by a background thread, like event_log.py's: the
+control loop only queues a tuple, and drops (counted) if the queue is full.
+"""
+
+import argparse
+import json
+import queue
+import struct
+import sys
+import threading
+import time
+
+import metrics
+from state_export import ASSUMED_FIELDS, CHANNELS, WHISTLE_CODES
+
+MAGIC = b"RRKA1"
+RECORD = struct.Struct("<BBBx I d f h h 10s")
+SESSION, INTENT, PRESS, RELEASE = 0, 1, 2, 3
+SENT, SHIFT, HAS_ASSUMED = 1, 2, 4
+REASONS = ('release', 'focus', 'shutdown', 'error', 'watchdog')
+NO_CONTROL = 255
+QUEUE_SIZE = 8192  # Records buffered before new ones are dropped
+CHUNK_RECORDS = 4096  # Records read at a time by the analyzer
+
+# Analysis
+REVERSAL_WINDOW = 2.0  # A key undoing one sent less than this many seconds before is a wasted reversal
+MOVE_GAP = 0.5  # Seconds without an intent after which a control's next intent starts a new movement
+STEPPED = ('HEADLIGHT', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE')  # One key moves these one step
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# ============================================================================
+# WRITER
+# ============================================================================
+
+class KeyAudit:
+    """Appends audit records to a file from a background thread"""
+    def __init__(self, path, queue_size=QUEUE_SIZE, clock=time.monotonic):
+        """
+        Args:
+            path: Log file (appended to)
+            queue_size: Records buffered before new ones are dropped
+            clock: Time source for the record times
+        """
+        self.path = path
+        self.clock = clock
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = metrics.counter('audit_dropped', "Key audit records dropped because the queue was full")
+        self.controls = {}  # Key → channel, see bind()
+        self.started_at = None
+        self._file = None
+        self._thread = None
+
+    def bind(self, controls):
+        """
+        Set which control each key belongs to (call again after a config reload)
+
+        Args:
+            controls: Dict of key → channel name
+        """
+        self.controls = {key: CHANNELS.index(channel) for key, channel in controls.items() if channel in CHANNELS}
+
+    def start(self):
+        """
+        Open the log (appending) and start the writer thread
+
+        Returns:
+            True on success
+        """
+        try:
+            self._file = open(self.path, 'ab')
+            # A run killed mid-write can leave half a record; drop it so records stay aligned
+            size = self._file.seek(0, 2)
+            if size % RECORD.size:
+                self._file.truncate(size - size % RECORD.size)
+        except OSError as e:
+            print(f"✗ Could not open key audit log {self.path}: {e}")
+            return False
+        self.started_at = self.clock()
+        self._file.write(RECORD.pack(SESSION, NO_CONTROL, 0, 0, time.time(), 0.0, 0, 0, MAGIC))
+        self._thread = threading.Thread(target=self._run, name="key-audit", daemon=True)
+        self._thread.start()
+        print(f"✓ Auditing keys to {self.path}")
+        return True
+
+    def stop(self, timeout=2.0):
+        """Write everything still queued and close the file"""
+        if self._thread is None:
+            return
+        # The sentinel waits for room at most `timeout`: a writer thread that died
+        # leaves a full queue behind, and nothing would ever make room in it
+        if self._thread.is_alive():
+            try:
+                self.queue.put(None, timeout=timeout)
+                self._thread.join(timeout)
+            except queue.Full:
+                pass
+        self._thread = None
+        self._file.close()
+        self._file = None
+
+    def intent(self, state, key, hold, sent, frame, shift=False):
+        """
+        A handler asked for a key (control loop)
+
+        Args:
+            state: ControlState (target and assumed position are read from it)
+            key: Key asked for
+            hold: Requested hold in seconds (0 = tap, None = until released)
+            sent: Whether the key went out
+            frame: Frames handled so far
+            shift: Sent as Shift+key
+        """
+        control = self.controls.get(key, NO_CONTROL)
+        flags = (SENT if sent else 0) | (SHIFT if shift else 0)
+        target = assumed = 0
+        if control != NO_CONTROL:
+            target = state.targets.get(CHANNELS[control], 0)
+            target = WHISTLE_CODES.get(target, target)
+            field = ASSUMED_FIELDS[control]
+            if field is not None:
+                flags |= HAS_ASSUMED
+                assumed = getattr(state, field)
+                assumed = WHISTLE_CODES.get(assumed, assumed)
+        self._put((INTENT, control, flags, frame, -1.0 if hold is None else hold, target, assumed, key))
+
+    def press(self, key, hold, frame):
+        """The backend pressed a key (HeldKeyRegistry.on_press)"""
+        self._put((PRESS, self.controls.get(key, NO_CONTROL), 0, frame, -1.0 if hold is None else hold, 0, 0, key))
+
+    def release(self, key, held_for, reason, frame):
+        """The backend released a key (HeldKeyRegistry.on_release)"""
+        reason = REASONS.index(reason) if reason in REASONS else 0
+        self._put((RELEASE, self.controls.get(key, NO_CONTROL), reason, frame, held_for, 0, 0, key))
+
+    def _put(self, record):
+        try:
+            self.queue.put_nowait((self.clock(),) + record)
+        except queue.Full:
+            self.dropped.inc()
+
+    def _run(self):
+        """Writer thread: pack a batch of records, write it in one go"""
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            data = bytearray()
+            stop = False
+            for item in batch:
+                if item is None:
+                    stop = True
+                    continue
+                at, kind, control, flags, frame, hold, target, assumed, key = item
+                data += RECORD.pack(kind, control, flags, frame & 0xFFFFFFFF, at - self.started_at, hold,
+                                    max(-32768, min(32767, int(target))), max(-32768, min(32767, int(assumed))),
+                                    str(key).encode('utf-8')[:10])
+            self._file.write(data)
+            self._file.flush()
+            if stop:
+                return
+
+
+# ============================================================================
+# ANALYZER
+# ============================================================================
+
+def read_records(path):
+    """
+    Yield the log's records as tuples, reading CHUNK_RECORDS at a time
+
+    Raises:
+        OSError: The file can't be read
+        ValueError: The file isn't a key audit log
+    """
+    with open(path, 'rb') as f:
+        first = True
+        while True:
+            data = f.read(RECORD.size * CHUNK_RECORDS)
+            usable = len(data) - len(data) % RECORD.size  # A log being written may end mid-record
+            if usable == 0:
+                return
+            for record in RECORD.iter_unpack(memoryview(data)[:usable]):
+                if first and (record[0] != SESSION or record[8].rstrip(b'\0') != MAGIC):
+                    raise ValueError(f"{path} is not a key audit log")
+                first = False
+                yield record
+
+
+class ControlStats:
+    """Running totals for one control"""
+    def __init__(self):
+        self.intents = 0
+        self.refused = 0
+        self.keys = 0
+        self.reversals = 0
+        self.forced_releases = 0
+        self.moves = 0
+        self.moving_time = 0.0  # Seconds the game was behind the panel (within movements)
+        self.error_time = 0.0  # Integral of |target - assumed| over moving_time, in step·seconds
+        self.max_error = 0
+        # Per-session tracking
+        self.last_sent = None  # (time, direction) of the last key sent
+        self.last_intent = None  # (time, error) of the last intent
+        self.move_start = None
+
+    def reset_session(self):
+        self.last_sent = self.last_intent = self.move_start = None
+
+    def report(self, minutes):
+        return {
+            'keys': self.keys,
+            'keys_per_minute': round(self.keys / minutes, 2) if minutes else None,
+            'intents': self.intents,
+            'refused': self.refused,
+            'reversals': self.reversals,
+            'reversal_ratio': round(self.reversals / self.keys, 4) if self.keys else 0.0,
+            'moves': self.moves,
+            'mean_error': round(self.error_time / self.moving_time, 3) if self.moving_time else 0.0,
+            'max_error': self.max_error,
+            'forced_releases': self.forced_releases,
+        }
+
+
+class SessionAnalyzer:
+    """Feed it records in order (feed()), then call report()"""
+    def __init__(self):
+        self.sessions = 0
+        self.records = 0
+        self.duration = 0.0
+        self.controls = {channel: ControlStats() for channel in CHANNELS}
+        self.keys = 0
+        self.per_minute = {}  # (session, minute) → keys pressed
+        self.key_wait = metrics.Histogram('key_wait', LATENCY_BUCKETS)  # First refused intent → key sent
+        self.catch_up = metrics.Histogram('catch_up', LATENCY_BUCKETS)  # Movement start → game at the target
+        self.release_late = metrics.Histogram('release_late')  # Timed hold: actual - requested duration
+        self._session_end = 0.0
+        self._waiting = {}  # Control → time of its first refused intent
+        self._holds = {}  # Key → requested hold of its current press
+
+    def feed(self, record):
+        kind, control, flags, frame, at, hold, target, assumed, key = record
+        self.records += 1
+        if kind == SESSION:
+            self._end_session()
+            self.sessions += 1
+            return
+        self._session_end = max(self._session_end, at)
+        if kind == PRESS:
+            self.keys += 1
+            minute = (self.sessions, int(at // 60))
+            self.per_minute[minute] = self.per_minute.get(minute, 0) + 1
+            self._holds[key] = hold
+            if control != NO_CONTROL:
+                self.controls[CHANNELS[control]].keys += 1
+        elif kind == RELEASE:
+            requested = self._holds.pop(key, None)
+            if flags != 0 and control != NO_CONTROL:
+                self.controls[CHANNELS[control]].forced_releases += 1
+            elif requested is not None and requested > 0:
+                self.release_late.observe(max(0.0, hold - requested))
+        elif kind == INTENT and control != NO_CONTROL:
+            self._intent(CHANNELS[control], flags, at, target, assumed)
+
+    def _intent(self, channel, flags, at, target, assumed):
+        stats = self.controls[channel]
+        stats.intents += 1
+        sent = flags & SENT
+        if not sent:
+            stats.refused += 1
+            self._waiting.setdefault(channel, at)
+        elif channel in self._waiting:
+            self.key_wait.observe(at - self._waiting.pop(channel))
+        if not flags & HAS_ASSUMED:
+            return
+        error = abs(target - assumed)
+        stats.max_error = max(stats.max_error, error)
+
+        # Movements: intents keep coming every frame until the game reaches the target
+        if stats.last_intent is not None and stats.move_start is not None and at - stats.last_intent[0] <= MOVE_GAP:
+            elapsed = at - stats.last_intent[0]
+            stats.moving_time += elapsed
+            stats.error_time += stats.last_intent[1] * elapsed
+        else:
+            stats.move_start = at
+            stats.moves += 1
+        stats.last_intent = (at, error)
+
+        if sent:
+            direction = (target > assumed) - (target < assumed)
+            if (stats.last_sent is not None and direction and direction == -stats.last_sent[1]
+                    and at - stats.last_sent[0] <= REVERSAL_WINDOW):
+                stats.reversals += 1
+            stats.last_sent = (at, direction)
+            if error <= 1 or channel not in STEPPED:
+                # This key brings the game to the target
+                self.catch_up.observe(at - stats.move_start)
+                stats.move_start = None
+
+    def _end_session(self):
+        self.duration += self._session_end
+        self._session_end = 0.0
+        self._waiting.clear()
+        self._holds.clear()
+        for stats in self.controls.values():
+            stats.reset_session()
+
+    def report(self):
+        """The analysis so far as a dict (JSON-ready)"""
+        self._end_session()
+        minutes = self.duration / 60
+        return {
+            'sessions': self.sessions,
+            'records': self.records,
+            'duration_s': round(self.duration, 1),
+            'keys': self.keys,
+            'keys_per_minute': round(self.keys / minutes, 2) if minutes else None,
+            'peak_keys_per_minute': max(self.per_minute.values(), default=0),
+            'controls': {channel: stats.report(minutes) for channel, stats in self.controls.items()
+                         if stats.intents or stats.keys},
+            'latency': {name: _quantiles(hist) for name, hist in
+                        (('key_wait', self.key_wait), ('catch_up', self.catch_up),
+                         ('release_late', self.release_late))},
+        }
+
+
+def _quantiles(hist):
+    """
+    Count and bucket-bound p50/p90/p99 in seconds
+    None when empty or when the quantile lies beyond the last bucket
+    (Histogram.quantile's inf, which JSON can't hold); `over` counts those
+    observations, `last_bound` is the bound they exceeded
+    """
+    values = {'count': int(hist.count), 'over': int(hist.counts[-1]), 'last_bound': hist.buckets[-1]}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        value = hist.quantile(fraction)
+        values[name] = None if value == float('inf') else value
+    return values
+
+
+def analyze(path):
+    """
+    Analyze a key audit log
+
+    Returns:
+        Report dict (see SessionAnalyzer.report)
+    """
+    analyzer = SessionAnalyzer()
+    for record in read_records(path):
+        analyzer.feed(record)
+    return analyzer.report()
+
+
+def print_report(path, report):
+    print("=" * 70)
+    print(f"KEY AUDIT: {path}")
+    print("=" * 70)
+    print(f"Sessions: {report['sessions']}   Recorded: {report['duration_s'] / 60:.1f} min   "
+          f"Records: {report['records']}")
+    if report['keys_per_minute'] is not None:
+        print(f"Keys sent: {report['keys']} ({report['keys_per_minute']:.1f}/min, "
+              f"peak {report['peak_keys_per_minute']}/min)")
+    print("-" * 70)
+    print(f"{'CONTROL':12} {'KEYS':>6} {'/MIN':>6} {'REFUSED':>8} {'REVERSALS':>10} {'MOVES':>6} "
+          f"{'ERR AVG':>8} {'MAX':>4}")
+    for channel, stats in report['controls'].items():
+        rate = stats['keys_per_minute']
+        print(f"{channel:12} {stats['keys']:>6} {(f'{rate:.1f}' if rate is not None else '-'):>6} "
+              f"{stats['refused']:>8} {stats['reversals']:>4} ({stats['reversal_ratio']:>4.0%}) "
+              f"{stats['moves']:>6} {stats['mean_error']:>8.2f} {stats['max_error']:>4}")
+        if stats['forced_releases']:
+            print(f"{'':12} ⚠ {stats['forced_releases']} key(s) force-released (focus loss, error, watchdog…)")
+    print("-" * 70)
+    labels = {'key_wait': "Refused → sent", 'catch_up': "Panel → game caught up",
+              'release_late': "Hold overrun"}
+    for name, values in report['latency'].items():
+        if values['count']:
+            print(f"{labels[name]:24} n={values['count']:<6} "
+                  + "   ".join(f"{q} < {metrics.format_seconds(values[q])}" if values[q] is not None
+                             else f"{q} > {metrics.format_seconds(values['last_bound'])}"
+                             for q in ('p50', 'p90', 'p99')))
+    print("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a Railroader key audit log")
+    parser.add_argument("path", help="Log written with KEY_AUDIT_FILE")
+    parser.add_argument("--json", metavar="PATH", help="Save the report as JSON ('-' = print it)")
+    args = parser.parse_args()
+    try:
+        report = analyze(args.path)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+    if args.json == '-':
+        print(json.dumps(report, indent=2, allow_nan=False))
+        return 0
+    print_report(args.path, report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, allow_nan=False)
+        print(f"✓ Report saved to {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Keyboard output backends for the Railroader controller
+pynput's Controller is the real backend; RecordingKeyboard stands in for it
+on machines without a display (benchmarks, hardware-free testing)
+"""
+
+import time
+
+
+class Key:
+    """Stand-in for pynput.keyboard.Key with the special keys the controller uses"""
+    shift = 'shift'
+
+
+class RecordingKeyboard:
+    """
+    Drop-in replacement for pynput's keyboard Controller
+    Records every press/release instead of sending it to the OS
+
+    Each event is a tuple: (timestamp, action, key, tag)
+    `tag` is whatever the caller last assigned to `keyboard.tag`, which lets
+    benchmarks attribute a key event to the input frame that caused it
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.events = []
+        self.tag = None
+
+    def press(self, key):
+        self.events.append((self.clock(), 'press', key, self.tag))
+
+    def release(self, key):
+        self.events.append((self.clock(), 'release', key, self.tag))
+
+    def clear(self):
+        """Forget all recorded events"""
+        self.events = []
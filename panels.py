@@ -0,0 +1,225 @@
+"""
+Multi-panel input for the Railroader controller
+Each Arduino panel (cab, brake stand, ...) gets its own reader thread,
+channel namespace and health tracking. Frames are merged into one channel
+table using per-channel ownership / arbitration rules.
+
+Channel rules:
+    '<panel name>'  Only that panel drives the channel (falls back to others if it goes unhealthy)
+    'priority'      First healthy panel in PANELS order that has the channel
+    'latest'        Panel whose value changed most recently wins
+    'max' / 'min'   Highest / lowest value wins (e.g. 'max' for brakes = most applied)
+"""
+
+import threading
+import time
+
+import metrics
+import realtime
+
+PANEL_TIMEOUT = 1.0  # Seconds without a frame before a panel counts as unhealthy
+RECONNECT_DELAY = 2.0  # Seconds between reconnect attempts
+ARBITRATION_RULES = ('priority', 'latest', 'max', 'min')
+
+
+# ============================================================================
+# SINGLE PANEL
+# ============================================================================
+
+class SerialPanel:
+    """
+    One serial panel, read continuously by its own thread
+    Only the newest frame is kept, so a slow consumer never builds a backlog
+    """
+    def __init__(self, name, port, baud, open_connection, parse, clock=time.monotonic):
+        """
+        Args:
+            name: Panel name, also its channel namespace (e.g. "cab" → "cab.THROTTLE")
+            port: Serial port (e.g. "COM4")
+            baud: Baud rate
+            open_connection: Callable(port, baud) returning a serial object or None
+            parse: Callable(line) returning a dict of channel values or None
+            clock: Time source in seconds for frame times and health
+        """
+        self.name = name
+        self.port = port
+        self.baud = baud
+        self.open_connection = open_connection
+        self.parse = parse
+        self.clock = clock
+
+        self.latest = {}  # Channel → value from the newest frame
+        self.changed_at = {}  # Channel → clock time the value last changed
+        self.last_frame_time = 0.0
+        self.sequence = 0  # Increments with every frame
+        self.connected = False
+
+        self.frames = metrics.counter(f"panel_{name}_frames", f"Frames received from panel {name}")
+        self.errors = metrics.counter(f"panel_{name}_errors", f"Read/parse errors on panel {name}")
+        self.reconnects = metrics.counter(f"panel_{name}_reconnects", f"Reconnects of panel {name}")
+
+        self._ser = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"panel-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self._close()
+
+    def healthy(self, now=None):
+        """Connected and a frame arrived within PANEL_TIMEOUT"""
+        now = self.clock() if now is None else now
+        return self.connected and now - self.last_frame_time < PANEL_TIMEOUT
+
+    def namespaced(self):
+        """Latest frame with channel names prefixed by the panel name"""
+        return {f"{self.name}.{channel}": value for channel, value in self.latest.items()}
+
+    def _close(self):
+        if self._ser is not None:
+            try:
+                self._ser.close()
+            except Exception:
+                pass
+            self._ser = None
+        self.connected = False
+
+    def _run(self):
+        """Reader thread: (re)connect, then read frames as fast as they arrive"""
+        realtime.join_thread('reader')
+        while not self._stop.is_set():
+            if self._ser is None:
+                self._ser = self.open_connection(self.port, self.baud)
+                if self._ser is None:
+                    self._stop.wait(RECONNECT_DELAY)
+                    continue
+                self.connected = True
+
+            try:
+                line = self._ser.readline()
+            except Exception:
+                self.errors.inc()
+                self.reconnects.inc()
+                self._close()
+                continue
+            if not line:
+                continue  # Read timeout
+
+            text = line.decode('utf-8', errors='replace').strip()
+            if ':' not in text:
+                continue  # Startup banner or noise
+            data = self.parse(text)
+            if data is None:
+                self.errors.inc()
+                continue
+            self._store(data)
+
+    def _store(self, data):
+        """Record a parsed frame"""
+        now = self.clock()
+        latest = self.latest
+        for channel, value in data.items():
+            if latest.get(channel) != value:
+                self.changed_at[channel] = now
+        # Swap in a new dict so readers never see a half-updated frame
+        self.latest = dict(data)
+        self.last_frame_time = now
+        self.sequence += 1
+        self.frames.inc()
+
+
+# ============================================================================
+# PANEL SET (MERGING)
+# ============================================================================
+
+class PanelSet:
+    """All configured panels plus the rules that merge them into one channel table"""
+    def __init__(self, panels, channel_rules=None, default_rule='priority', clock=time.monotonic):
+        """
+        Args:
+            panels: List of SerialPanel, in priority order
+            channel_rules: Dict channel → rule (see module docstring)
+            default_rule: Rule for channels not in channel_rules
+            clock: Time source in seconds (the panels' clock)
+        """
+        self.panels = panels
+        self.clock = clock
+        self.channel_rules = channel_rules or {}
+        self.default_rule = default_rule
+        self._last_sequences = None
+
+        names = {panel.name for panel in panels}
+        for channel, rule in self.channel_rules.items():
+            if rule not in ARBITRATION_RULES and rule not in names:
+                raise ValueError(f"Unknown rule for {channel}: {rule!r} (use a panel name or one of {ARBITRATION_RULES})")
+
+    def start(self):
+        for panel in self.panels:
+            panel.start()
+
+    def stop(self):
+        for panel in self.panels:
+            panel.stop()
+
+    def merged_frame(self):
+        """
+        Merged channel table, or None if no panel produced a new frame since the last call
+        Namespaced values ("cab.THROTTLE") are included next to the merged ones
+        """
+        sequences = [panel.sequence for panel in self.panels]
+        if sequences == self._last_sequences:
+            return None
+        self._last_sequences = sequences
+
+        now = self.clock()
+        healthy = [panel for panel in self.panels if panel.healthy(now)]
+        if not healthy:
+            return None
+
+        # Which panels offer each channel
+        providers = {}
+        for panel in healthy:
+            frame = panel.latest
+            for channel in frame:
+                providers.setdefault(channel, []).append((panel, frame))
+
+        merged = {}
+        for channel, offers in providers.items():
+            merged[channel] = self._arbitrate(channel, offers)
+        for panel in healthy:
+            merged.update(panel.namespaced())
+        return merged
+
+    def _arbitrate(self, channel, offers):
+        """Pick the value for one channel from [(panel, frame), ...] (healthy panels, priority order)"""
+        rule = self.channel_rules.get(channel, self.default_rule)
+        if len(offers) == 1:
+            return offers[0][1][channel]
+        if rule == 'latest':
+            panel, frame = max(offers, key=lambda offer: offer[0].changed_at.get(channel, 0.0))
+            return frame[channel]
+        if rule == 'max':
+            return max(frame[channel] for panel, frame in offers)
+        if rule == 'min':
+            return min(frame[channel] for panel, frame in offers)
+        if rule != 'priority':
+            # Owned channel: owner wins while healthy, otherwise fall back to priority order
+            for panel, frame in offers:
+                if panel.name == rule:
+                    return frame[channel]
+        return offers[0][1][channel]
+
+    def health(self):
+        """List of (name, port, healthy, frames, errors) per panel"""
+        now = self.clock()
+        return [
+            (panel.name, panel.port, panel.healthy(now), panel.frames.value, panel.errors.value)
+            for panel in self.panels
+        ]
@@ -0,0 +1,282 @@
+"""
+Motion prediction for the notched levers
+Every notch is a key held for NOTCH_HOLD (150 ms), and the next one can't
+start before it is released, so a quick sweep over ten notches reaches the
+game a second and a half after the lever got there. With a lead set for a
+control ([prediction] in the settings file), its handler estimates how fast
+the lever moves and presses towards the notch the lever will be at `lead`
+seconds from now instead of the one it is at:
+
+- velocity: the lever's change between readings, smoothed; a reading
+  within the lever's calibrated noise of the last one counts as standing
+  still (nothing is computed, nothing allocated)
+- the projection is only used while the lever moves faster than
+  `min_speed`, and reaches at most `max_ahead` notches past the real one
+- when the lever slows down, stops or turns, the projection collapses back
+  to the real notch. There is never more than one notch key in flight, so
+  a wrong prediction costs at most the notches already sent, and the
+  handler walks those back like any other change.
+
+Tune the leads offline on a recorded session (RECORD_FILE) - the session is
+replayed on a virtual clock once without prediction and once per lead:
+
+    python prediction.py session.frames
+    python prediction.py session.frames --leads 0.1 0.2 0.3 --control THROTTLE
+"""
+
+import argparse
+import json
+import sys
+import time
+
+CHANNELS = ('REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE')
+ASSUMED_FIELDS = {'REVERSER': 'reverser_step', 'THROTTLE': 'throttle_step',
+                  'TRAINBRAKE': 'train_brake_step', 'INDBRAKE': 'ind_brake_step'}
+SETTINGS = {'REVERSER': 'reverser_lead', 'THROTTLE': 'throttle_lead',
+            'TRAINBRAKE': 'train_brake_lead', 'INDBRAKE': 'ind_brake_lead'}  # [prediction] key per control
+SMOOTHING = 0.5  # Weight of the newest reading in the velocity estimate
+EVALUATION_LEADS = (0.1, 0.15, 0.2, 0.3)  # Seconds tried by default
+SETTLE_TIME = 3.0  # Seconds an evaluation keeps running after the last frame
+
+
+class MotionPredictor:
+    """Per-channel velocity estimate and projection"""
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.last = {}  # Reading the velocity was last measured from …
+        self.last_time = {}  # … and when
+        self.velocity = {}  # ADC counts per second
+
+    def reset(self):
+        """Forget every lever's motion (after a clock change)"""
+        self.last.clear()
+        self.last_time.clear()
+        self.velocity.clear()
+
+    def project(self, channel, value, lead, noise=0, min_speed=0.0):
+        """
+        Where the lever will be `lead` seconds from now
+
+        Args:
+            channel: Channel name
+            value: Newest reading
+            lead: Seconds to look ahead
+            noise: The lever's calibrated noise (smaller changes are not movement)
+            min_speed: Counts per second below which the lever isn't projected
+
+        Returns:
+            Projected reading (may lie outside 0 … 1023), or None while the
+            lever stands still or moves slower than min_speed
+        """
+        last = self.last.get(channel)
+        if last is None:
+            self.last[channel] = value
+            self.last_time[channel] = self.clock()
+            self.velocity[channel] = 0.0
+            return None
+        moved = value - last if value > last else last - value
+        if moved <= noise:
+            # Standing still, or creeping within the noise: the creep is measured
+            # once it adds up, from the last reading that counted
+            self.velocity[channel] = 0.0
+            return None
+        now = self.clock()
+        elapsed = now - self.last_time[channel]
+        self.last[channel] = value
+        self.last_time[channel] = now
+        if elapsed <= 0:
+            return None
+        speed = (value - last) / elapsed
+        velocity = self.velocity[channel]
+        if velocity == 0.0 or (velocity > 0) != (speed > 0):
+            velocity = speed  # Starting or turning: don't average through zero
+        else:
+            velocity += SMOOTHING * (speed - velocity)
+        self.velocity[channel] = velocity
+        if abs(velocity) < min_speed:
+            return None
+        return int(value + velocity * lead)
+
+
+# ============================================================================
+# OFFLINE EVALUATION
+# ============================================================================
+
+class Tracker:
+    """How closely the assumed game positions followed the panel, tick by tick"""
+    def __init__(self):
+        self.assumed = {}
+        self.direction = {channel: 0 for channel in CHANNELS}  # Sign of the last notch sent
+        self.behind_since = {}
+        self.latencies = {channel: [] for channel in CHANNELS}
+        self.behind = {channel: 0.0 for channel in CHANNELS}  # Notch-seconds short of the target
+        self.overshoot = {channel: 0.0 for channel in CHANNELS}  # Notch-seconds past it
+        self.presses = {channel: 0 for channel in CHANNELS}
+
+    def sample(self, now, elapsed, state):
+        """
+        Args:
+            now: Time of this tick
+            elapsed: Seconds since the previous tick
+            state: ControlState after the tick
+        """
+        for channel in CHANNELS:
+            target = state.targets.get(channel)
+            if target is None:
+                continue
+            assumed = getattr(state, ASSUMED_FIELDS[channel])
+            previous = self.assumed.get(channel, assumed)
+            if assumed != previous:
+                self.presses[channel] += abs(assumed - previous)
+                self.direction[channel] = 1 if assumed > previous else -1
+            self.assumed[channel] = assumed
+            gap = (assumed - target) * self.direction[channel]
+            if gap > 0:
+                self.overshoot[channel] += gap * elapsed
+            else:
+                self.behind[channel] += abs(assumed - target) * elapsed
+            # Latency: from the target moving away from the game until the game is there
+            if assumed != target:
+                self.behind_since.setdefault(channel, now)
+            elif channel in self.behind_since:
+                self.latencies[channel].append(now - self.behind_since.pop(channel))
+
+    def report(self, channels):
+        """Totals over `channels`"""
+        latencies = sorted(latency for channel in channels for latency in self.latencies[channel])
+        return {
+            'catch_ups': len(latencies),
+            'latency_mean': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95': latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            'behind': sum(self.behind[channel] for channel in channels),
+            'overshoot': sum(self.overshoot[channel] for channel in channels),
+            'presses': sum(self.presses[channel] for channel in channels),
+        }
+
+
+def evaluate(path, leads, overrides=None):
+    """
+    Replay a recorded session through the control loop on a virtual clock
+
+    Args:
+        path: Frame log (RECORD_FILE format)
+        leads: Channel → lead in seconds (missing = no prediction)
+        overrides: Other [prediction] settings to use (max_ahead, min_speed)
+
+    Returns:
+        Tracker, or None if the file can't be replayed
+    """
+    import railroader_controller_pynput as controller
+    from clock import VirtualClock
+    from config import CompiledConfig
+    from input_sources import ReplaySource
+    from key_backends import RecordingKeyboard
+
+    clock = VirtualClock()
+    controller.set_clock(clock)
+    controller.set_keyboard_backend(RecordingKeyboard(clock=clock.now))
+    controller.state = controller.ControlState()
+    controller.digital_inputs.inputs.clear()
+    settings = {section: dict(values) for section, values in controller.active_config.settings.items()}
+    settings['prediction'].update(overrides or {})
+    for channel in CHANNELS:
+        settings['prediction'][SETTINGS[channel]] = float(leads.get(channel, 0.0))
+    controller.apply_config(CompiledConfig(settings, controller.active_config.calibration), switch_input=False)
+
+    source = ReplaySource(path, controller.parse_serial_data, clock=clock)
+    if not source.open():
+        return None
+    tracker = Tracker()
+    end = None
+    last = clock.now()
+    try:
+        while end is None or clock.now() < end:
+            controller.control_tick(source, lambda: True)
+            now = clock.now()
+            tracker.sample(now, now - last, controller.state)
+            last = now
+            if end is None and source.finished():
+                end = now + SETTLE_TIME
+            clock.sleep(controller.UPDATE_INTERVAL)
+    finally:
+        controller.whistle.stop()
+        controller.held_keys.release_all('shutdown')
+    return tracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate motion prediction on a recorded session")
+    parser.add_argument('session', help="Frame log recorded with RECORD_FILE")
+    parser.add_argument('--leads', type=float, nargs='+', default=list(EVALUATION_LEADS),
+                        help="Lead times to try, in seconds")
+    parser.add_argument('--control', choices=CHANNELS, action='append',
+                        help="Only predict (and score) this control; repeat for several (default: all)")
+    parser.add_argument('--max-ahead', type=int, help="Notches a prediction may run ahead (default: the settings')")
+    parser.add_argument('--min-speed', type=float, help="Counts per second before a lever is predicted (default: the settings')")
+    parser.add_argument('--json', metavar='FILE', help="Also write the results as JSON ('-' = stdout)")
+    args = parser.parse_args()
+
+    import calibration
+    import railroader_controller_pynput as controller
+    from config import CompiledConfig, load_config
+    from event_log import INFO
+
+    # Score with the settings and lever calibration the controller would drive with
+    try:
+        cfg = load_config(controller.CONFIG_FILE, controller.base_settings())
+    except FileNotFoundError:
+        cfg = controller.active_config
+    except (OSError, ValueError) as e:
+        print(f"✗ {controller.CONFIG_FILE}: {e}")
+        return 1
+    try:
+        ranges = calibration.load(controller.CALIBRATION_FILE)
+    except (OSError, ValueError):
+        ranges = {}
+    controller.apply_config(CompiledConfig(cfg.settings, ranges), switch_input=False)
+    controller.LOG_KEYS = False
+    controller.events.level = INFO
+    channels = tuple(args.control or CHANNELS)
+    overrides = {}
+    if args.max_ahead is not None:
+        overrides['max_ahead'] = args.max_ahead
+    if args.min_speed is not None:
+        overrides['min_speed'] = args.min_speed
+
+    results = []
+    for lead in [0.0] + args.leads:
+        tracker = evaluate(args.session, {channel: lead for channel in channels}, overrides)
+        if tracker is None:
+            return 1
+        results.append(dict(tracker.report(channels), lead=lead))
+
+    baseline = results[0]
+    print("=" * 78)
+    print(f"MOTION PREDICTION - {args.session} ({', '.join(channels)})")
+    print("=" * 78)
+    print(f"{'lead':>6}  {'latency':>9}  {'p95':>7}  {'vs off':>7}  {'behind':>9}  {'overshoot':>9}  {'presses':>7}")
+    for result in results:
+        change = ""
+        if result['lead'] and baseline['latency_mean']:
+            change = f"{(result['latency_mean'] / baseline['latency_mean'] - 1) * 100:+.0f}%"
+        label = f"{result['lead']:.2f}s" if result['lead'] else "off"
+        print(f"{label:>6}  "
+              f"{result['latency_mean'] * 1000:7.0f}ms  {result['latency_p95'] * 1000:5.0f}ms  {change:>7}  "
+              f"{result['behind']:8.1f}n  {result['overshoot']:8.1f}n  {result['presses']:7d}")
+    print("-" * 78)
+    print("latency: lever reached a new notch → game at that notch (mean, 95th percentile)")
+    print("behind / overshoot: notch-seconds the game spent short of / past the lever")
+    print("presses: notch keys sent (more than 'off' = notches sent and walked back)")
+
+    if args.json:
+        text = json.dumps(results, indent=2)
+        if args.json == '-':
+            print(text)
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
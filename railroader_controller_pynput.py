@@ -6,41 +6,192 @@ Uses pynput library which works better with some fullscreen games
 SAFETY: Only sends keys when Railroader window is focused!
 """
 
-from pynput.keyboard import Key, Controller
 import time
-import random
 import serial
 import serial.tools.list_ports
 import ctypes
 import sys
+import threading
+
+import metrics
+from dashboard import Dashboard
+from panels import PanelSet, SerialPanel
+from input_sources import (InputManager, SimulationSource, SerialSource, StepSerialSource, PanelSetSource,
+                           UdpSource, PtySource, ReplaySource, RecordingSource, ProcessSource)
+from event_log import EventLog, DEBUG, INFO, WARNING, ERROR
+from scheduler import TimerScheduler
+from held_keys import HeldKeyRegistry
+from whistle import WhistleDriver
+from simulator import ScenarioSimulator
+from step_mode import build_step_tables
+import realtime
+from find_arduino_port import find_panel
+from config import ADC_MAX, CompiledConfig, ConfigWatcher, load_config, lookup
+import calibration
+from calibration import CalibrationCompiler, Calibrator
+from prediction import MotionPredictor
+from digital_inputs import DigitalInputs, PRESS, REPEAT
+from clock import RealClock, VirtualClock
+from state_export import CHANNELS, StateExport
+from key_audit import KeyAudit
+
+try:
+    from pynput.keyboard import Key, Controller
+    PYNPUT_ERROR = None
+except Exception as e:
+    # pynput needs a display server; on a headless box (benchmarks) fall back
+    # to the recording backend so the module can still be imported
+    from key_backends import Key, RecordingKeyboard as Controller
+    PYNPUT_ERROR = e
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
-SIMULATION_MODE = True  # Set to False to use real Arduino serial input
-UPDATE_INTERVAL = 0.05  # Seconds between control updates
+# Where control frames come from (can also be switched while running, see README):
+#   "simulation" - simulated driver (see SIMULATION_SCENARIO), no hardware needed
+#   "serial"     - one Arduino on SERIAL_PORT
+#   "panels"     - several Arduinos, see PANELS
+#   "udp"        - network panel (ESP32 / tablet), see UDP_PORT
+#   "replay"     - play back a recorded session from REPLAY_FILE
+#   "pty"        - pseudo-terminal for hardware-free testing (Linux/macOS)
+INPUT_SOURCE = "simulation"
+UPDATE_INTERVAL = 0.05  # Seconds between control updates (at most config.MAX_UPDATE_INTERVAL, 0.25)
 MAX_STEPS = 20  # Maximum steps for multi-step controls (throttle, brake, etc.)
-SERIAL_PORT = "COM3"  # Change to your Arduino's COM port
+SERIAL_PORT = "COM3"  # Change to your Arduino's COM port, or "auto" to probe every port for the panel
 SERIAL_BAUD = 9600  # Standard baud rate
+SERIAL_MODE = "raw"  # "raw" = Arduino streams every sample, "steps" = Arduino sends only notch changes (needs the step-mode sketch)
+STEP_HYSTERESIS = 4  # ADC counts a lever must move past a notch boundary before the Arduino changes step ("steps" mode)
+SERIAL_PROCESS = False  # Read and parse serial in a separate process (see frame_ring.py), so key injection never delays input
 STARTUP_DELAY = 5  # Seconds to wait before starting (time to switch to Railroader)
 DEBUG_MODE = False  # Set to True to see detailed value debugging (very verbose!)
 LOG_KEYS = True  # Log each key press to console
+
+# Multi-panel setup (INPUT_SOURCE = "panels"): one entry per Arduino
+PANELS = [
+    # {'name': 'cab', 'port': 'COM3'},
+    # {'name': 'brakestand', 'port': 'COM4', 'baud': 9600},
+]
+# Who drives a channel when several panels have it: a panel name, or
+# 'priority' (first panel in PANELS), 'latest' (last moved), 'max', 'min'
+CHANNEL_RULES = {
+    # 'THROTTLE': 'cab',
+    # 'TRAINBRAKE': 'max',
+}
+DEFAULT_CHANNEL_RULE = 'priority'
+
+# Network panel (INPUT_SOURCE = "udp"): listen for UDP frames on this port
+UDP_PORT = 5005
+UDP_BIND = "0.0.0.0"  # "0.0.0.0" = accept from the LAN, "127.0.0.1" = this PC only
+
+# Simulation mode (INPUT_SOURCE = "simulation"), see simulator.py
+SIMULATION_SCENARIO = "mixed"  # "departure", "braking", "random_walk", "mixed" or "uniform" (old random spam)
+SIMULATION_SEED = None  # Set a number to get the same run every time
+SIMULATION_RATE = 1000  # Simulated panel samples per second
+
+REPLAY_FILE = "session.frames"  # Frame log for INPUT_SOURCE = "replay"
+REPLAY_SPEED = 1.0  # 2.0 = twice as fast
+RECORD_FILE = None  # Append every received frame to this file (for replay later), None = off
+
 WINDOW_NAME = "Railroader"  # Partial name of Railroader window (case-insensitive)
+LOG_FILE = None  # Path for a rotating log file (e.g. "railroader.log"), None = console only
+DASHBOARD_ENABLED = True  # Live cab dashboard instead of per-key console lines
+DASHBOARD_RATE = 5  # Dashboard redraws per second
+METRICS_PORT = 9108  # Localhost port for Prometheus metrics (0 = disabled)
+METRICS_SUMMARY_INTERVAL = 30  # Seconds between console metric summaries (0 = disabled)
+KEY_AUDIT_FILE = None  # Append every key intent and key press to this binary log (analyze with key_audit.py), None = off
+STATE_EXPORT_FILE = ""  # Live state file for overlays and loggers, e.g. "railroader_state.bin" (see state_export.py; "" = disabled)
+
+# Real-time mode (see realtime.py): higher priority, CPU pinning and garbage collector control
+REALTIME_MODE = False
+REALTIME_PRIORITY = True  # Raise process/thread priority where the OS allows it
+CONTROL_CORES = None  # CPU cores for the control loop and key timing, e.g. [2] (None = any)
+READER_CORES = None  # CPU cores for serial reader threads, e.g. [3] (None = any)
+GC_MODE = "scheduled"  # "auto" = Python default, "freeze" = freeze startup objects, "scheduled" = also collect only between ticks
+
+# Control tuning
+NOTCH_HOLD = 0.15  # Seconds a notch key is held so the game registers it
+WHISTLE_DEADZONE = 50  # ± ADC counts around center with no whistle
+WHISTLE_MODE = "hold"  # "hold" = sound while pulled, "pulse" = pulse faster the further it is pulled, "tap" = one tap
+WHISTLE_PULSE_RATE = 5.0  # Pulses per second in "pulse" mode
+WHISTLE_MIN_DUTY = 0.2  # Fraction of each pulse the key is down just outside the deadzone ("pulse" mode)
+REVERSER_DEADZONE = 50  # ± ADC counts around center = neutral
+HEADLIGHT_POSITIONS = 5  # Positions of the headlight switch
+DEBOUNCE_TIME = 0.03  # Seconds to ignore button/switch bounce after a change
+BELL_REPEAT_RATE = 0  # Re-press the bell key this many times per second while held (0 = once per press)
+BELL_REPEAT_DELAY = 0.5  # Seconds the bell button is held before repeating starts
+
+# Lever calibration (see calibration.py; run "python calibration.py" for a guided calibration)
+CALIBRATION_FILE = "railroader_calibration.toml"  # Learned range, center and noise per lever, None = off
+CALIBRATE_ONLINE = True  # Keep learning while driving (not from the simulation or step mode) and save on exit
+CALIBRATION_INTERVAL = 2.0  # Seconds between table rebuilds while the online calibration learns
+NOISE_MARGIN = 2.0  # Calibrated whistle/reverser deadzone = this × the lever's noise …
+MIN_DEADZONE = 8  # … but at least this many ADC counts (replaces WHISTLE_DEADZONE / REVERSER_DEADZONE)
+
+# Motion prediction: press towards the notch a moving lever will reach this many seconds from now,
+# hiding part of the NOTCH_HOLD per notch (see prediction.py; tune with "python prediction.py session.frames")
+THROTTLE_LEAD = 0.0  # 0 = off
+TRAIN_BRAKE_LEAD = 0.0
+IND_BRAKE_LEAD = 0.0
+REVERSER_LEAD = 0.0
+PREDICT_MAX_AHEAD = 2  # Notches a prediction may run ahead of the lever
+PREDICT_MIN_SPEED = 100.0  # ADC counts per second a lever must move before it is predicted (above pot jitter)
+
+# Railroader key bindings
+KEY_BINDINGS = {
+    'whistle': 'h',  # Shift+key = high whistle
+    'bell': 'b',
+    'headlight': 'j',  # Shift+key = dimmer
+    'cylinder': 'k',
+    'reverser_forward': '[',
+    'reverser_backward': ']',
+    'throttle_up': '-',
+    'throttle_down': '=',
+    'train_brake_up': "'",
+    'train_brake_down': ';',
+    'ind_brake_up': '.',
+    'ind_brake_down': ',',
+}
+
+# Optional settings file: the settings set in it override the values above; reloaded when saved
+CONFIG_FILE = "railroader_config.toml"
+CONFIG_CHECK_INTERVAL = 1.0  # Seconds between checks for changes
 
 # Initialize pynput keyboard controller
 keyboard = Controller()
 
+# ============================================================================
+# METRICS
+# ============================================================================
+
+STAGE_FOCUS = metrics.stage('focus_check')
+STAGE_HANDLERS = metrics.stage('handlers')
+STAGE_KEY_INJECT = metrics.stage('key_inject')
+STAGE_TICK = metrics.stage('tick')  # Whole loop iteration, excluding the sleep
+
+FRAMES = metrics.counter('frames', "Control frames handled")
+KEYS = metrics.counter('keys', "Key presses injected")
+DROPS = metrics.counter('drops', "Frames received but discarded before handling")
+PARSE_ERRORS = metrics.counter('parse_errors', "Frames that failed to parse")
+
 # ============================================================================
 # WINDOW FOCUS DETECTION (SAFETY)
 # ============================================================================
 
-def get_active_window_title():
-    """Get the title of the currently active window (Windows only)"""
+_railroader_hwnd = None  # Foreground window last found to be Railroader
+
+
+def get_foreground_window():
+    """Handle of the currently active window (Windows only), or None"""
+    try:
+        return ctypes.windll.user32.GetForegroundWindow()
+    except Exception:
+        return None
+
+
+def get_window_title(hwnd):
+    """Get the title of a window (Windows only)"""
     try:
-        # Get foreground window handle
-        hwnd = ctypes.windll.user32.GetForegroundWindow()
-        
         # Get window title length
         length = ctypes.windll.user32.GetWindowTextLengthW(hwnd)
         
@@ -53,130 +204,413 @@ def get_active_window_title():
         return ""
 
 
+def get_active_window_title():
+    """Get the title of the currently active window (Windows only)"""
+    hwnd = get_foreground_window()
+    if hwnd is None:
+        return ""
+    return get_window_title(hwnd)
+
+
 def is_railroader_focused():
-    """Check if Railroader window is currently focused"""
-    title = get_active_window_title()
-    if not title:
+    """
+    Check if Railroader window is currently focused
+    The title is only read when the foreground window changes: while
+    Railroader stays in front, the check is one API call and no strings
+    """
+    global _railroader_hwnd
+    hwnd = get_foreground_window()
+    if not hwnd:
         return False
+    if hwnd == _railroader_hwnd:
+        return True
+    title = get_window_title(hwnd)
     # Check if "Railroader" is in the window title (case-insensitive)
-    is_focused = WINDOW_NAME.lower() in title.lower()
+    is_focused = bool(title) and WINDOW_NAME.lower() in title.lower()
+    _railroader_hwnd = hwnd if is_focused else None
     return is_focused
 
 # ============================================================================
 # DEBUG LOGGING
 # ============================================================================
 
-def log_key(key, action="PRESS", control=""):
-    """Debug logging for key presses"""
+# Structured event log - handlers queue raw values, a background thread formats and prints
+events = EventLog(level=DEBUG if DEBUG_MODE else INFO, log_file=LOG_FILE)
+
+
+def log_key(key, action="PRESS", control="", step=None):
+    """Debug logging for key presses (queued, formatted off the control loop)"""
     if LOG_KEYS:
-        if control:
-            print(f"  [{control}] {action}: '{key}'")
+        if step is not None:
+            events.log(INFO, 'key_step', key, action, control, step)
+        elif control:
+            events.log(INFO, 'key', key, action, control)
         else:
-            print(f"  {action}: '{key}'")
+            events.log(INFO, 'key_plain', key, action)
 
 # ============================================================================
-# KEYBOARD FUNCTIONS (PYNPUT)
+# CONFIG FILE
 # ============================================================================
 
-def press_key(key, hold_duration: float = 0):
-    """Press and release a key with optional hold duration"""
-    keyboard.press(key)
-    if hold_duration > 0:
-        time.sleep(hold_duration)
-    keyboard.release(key)
+def input_settings():
+    """The input settings in use (what the open source was built from)"""
+    return {'source': INPUT_SOURCE, 'serial_port': SERIAL_PORT, 'serial_baud': SERIAL_BAUD,
+            'serial_mode': SERIAL_MODE, 'step_hysteresis': STEP_HYSTERESIS, 'serial_process': SERIAL_PROCESS}
+
+
+def set_input_settings(values):
+    """Make `values` (a settings [input] table) the input settings create_input_source() builds from"""
+    global INPUT_SOURCE, SERIAL_PORT, SERIAL_BAUD, SERIAL_MODE, STEP_HYSTERESIS, SERIAL_PROCESS
+    INPUT_SOURCE, SERIAL_PORT, SERIAL_BAUD = values['source'], values['serial_port'], values['serial_baud']
+    SERIAL_MODE, STEP_HYSTERESIS = values['serial_mode'], values['step_hysteresis']
+    SERIAL_PROCESS = values['serial_process']
+
+
+def base_settings():
+    """Settings from the CONFIGURATION section, as the base a config file is laid over"""
+    return {
+        'loop': {'update_interval': float(UPDATE_INTERVAL)},
+        'input': input_settings(),
+        'controls': {
+            'max_steps': MAX_STEPS,
+            'notch_hold': NOTCH_HOLD,
+            'whistle_center': 512,
+            'whistle_deadzone': WHISTLE_DEADZONE,
+            'whistle_mode': WHISTLE_MODE,
+            'whistle_pulse_rate': float(WHISTLE_PULSE_RATE),
+            'whistle_min_duty': float(WHISTLE_MIN_DUTY),
+            'reverser_center': 512,
+            'reverser_deadzone': REVERSER_DEADZONE,
+            'headlight_positions': HEADLIGHT_POSITIONS,
+        },
+        'digital': {
+            'debounce': float(DEBOUNCE_TIME),
+            'bell_repeat_delay': float(BELL_REPEAT_DELAY),
+            'bell_repeat_rate': float(BELL_REPEAT_RATE),
+        },
+        'keys': dict(KEY_BINDINGS),
+        'calibration': {'online': CALIBRATE_ONLINE, 'noise_margin': float(NOISE_MARGIN), 'min_deadzone': MIN_DEADZONE},
+        'prediction': {
+            'throttle_lead': float(THROTTLE_LEAD),
+            'train_brake_lead': float(TRAIN_BRAKE_LEAD),
+            'ind_brake_lead': float(IND_BRAKE_LEAD),
+            'reverser_lead': float(REVERSER_LEAD),
+            'max_ahead': PREDICT_MAX_AHEAD,
+            'min_speed': float(PREDICT_MIN_SPEED),
+        },
+        'logging': {'log_keys': LOG_KEYS, 'debug': DEBUG_MODE},
+    }
 
-def hold_key(key):
-    """Hold a key down"""
-    keyboard.press(key)
 
-def release_key(key):
-    """Release a held key"""
-    keyboard.release(key)
+# Compiled tables and bindings used by the handlers; replaced whole by apply_config()
+active_config = CompiledConfig(base_settings())
+config_watcher = None
+calibrator = None  # Calibrator while CALIBRATION_FILE is set
+calibration_compiler = None  # Its CalibrationCompiler (the thread is started by main())
 
-def press_hotkey(modifier, key):
-    """Press a key combination (e.g., shift+j)"""
-    keyboard.press(modifier)
-    keyboard.press(key)
-    keyboard.release(key)
-    keyboard.release(modifier)
+# Time for the loop, key timing, debouncing and the scheduler; set_clock() swaps it
+# (no spin before deadlines: the loop's sleeps don't need sub-millisecond precision)
+clock = RealClock(spin_margin=0)
 
-# ============================================================================
-# HELPER FUNCTIONS
-# ============================================================================
+# Debounced buttons and switches (see digital_inputs.py)
+digital_inputs = DigitalInputs(clock.now)
 
-def map_to_steps(value, in_min=0, in_max=1023, steps=MAX_STEPS):
+# Lever velocity for motion prediction (see prediction.py)
+predictor = MotionPredictor(clock.now)
+
+
+def configure_digital_inputs(cfg):
+    """(Re)apply debounce / repeat timing; current button levels are kept"""
+    digital = cfg.digital
+    digital_inputs.add('BELL', debounce=digital['debounce'],
+                       repeat_delay=digital['bell_repeat_delay'], repeat_rate=digital['bell_repeat_rate'])
+    digital_inputs.add('CYLINDER', debounce=digital['debounce'])
+
+
+configure_digital_inputs(active_config)
+
+
+def apply_config(new_config, switch_input=True):
     """
-    Map an analog value (0-1023) to discrete steps (0-MAX_STEPS)
-    Useful for throttle, brake pedals that need stepped control
+    Make a compiled config current (called between ticks)
+    Assumed game positions are kept, so controls just walk to their new targets
     
     Args:
-        value: Analog input value (0-1023)
-        in_min: Minimum input value
-        in_max: Maximum input value
-        steps: Number of steps to map to
-    
-    Returns:
-        Step value (0 to steps)
+        new_config: CompiledConfig
+        switch_input: Reopen the input source if its settings changed
     """
-    # Clamp value within bounds
-    value = max(in_min, min(in_max, value))
+    global active_config, UPDATE_INTERVAL, MAX_STEPS, LOG_KEYS, DEBUG_MODE
+    # Compared with what the open source was built from, not with the last config:
+    # input settings that failed to open are tried again on the next reload
+    old_input = input_settings()
+    old_tables = active_config.tables
+    active_config = new_config
     
-    # Map to 0-1 range
-    normalized = (value - in_min) / (in_max - in_min)
+    settings = new_config.settings
+    UPDATE_INTERVAL = new_config.update_interval
+    MAX_STEPS = new_config.max_steps
+    LOG_KEYS = settings['logging']['log_keys']
+    DEBUG_MODE = settings['logging']['debug']
+    events.level = DEBUG if DEBUG_MODE else INFO
+    configure_digital_inputs(new_config)
+    if key_audit is not None:
+        key_audit.bind(key_controls(new_config))
+    new_input = settings['input']
+    set_input_settings(new_input)
+    update_calibration_learning()
     
-    # Map to step range
-    step = int(normalized * steps)
-    return step
+    if switch_input and new_input != old_input and input_manager.current is not None:
+        print(f"Input settings changed - reopening '{INPUT_SOURCE}'")
+        if not reopen_input_source(old_input):
+            set_input_settings(old_input)
+            update_calibration_learning()
+            print(f"✗ Could not open the new input settings - keeping '{INPUT_SOURCE}' "
+                  "(tried again on the next reload)")
+    elif new_config.tables != old_tables:
+        # An Arduino in step mode needs the new notch positions
+        # (a ProcessSource forwards them to the StepSerialSource in its child)
+        source = getattr(input_manager.current, 'inner', input_manager.current)
+        if isinstance(source, (StepSerialSource, ProcessSource)):
+            try:
+                source.reconfigure(build_step_tables(new_config))
+            except ValueError as e:
+                print(f"✗ {e} - Arduino keeps the old step tables")
 
 
-def deadzone(value, center=512, deadzone_range=50):
+def load_config_file():
     """
-    Apply deadzone to analog input
-    Returns 0 if within deadzone, otherwise returns the value
-    Prevents drift and unwanted small movements
-    
-    Args:
-        value: Analog input value
-        center: Center point of deadzone (typically 512 for 0-1023)
-        deadzone_range: How far from center to apply deadzone
+    Apply CONFIG_FILE if it exists and start watching it for changes
     
     Returns:
-        0 if in deadzone, otherwise the value
+        False if the file exists but is invalid, True otherwise
     """
-    if abs(value - center) < deadzone_range:
-        return 0
-    return value - center
+    global config_watcher
+    base = base_settings()
+    try:
+        apply_config(load_config(CONFIG_FILE, base), switch_input=False)
+        print(f"✓ Settings loaded from {CONFIG_FILE} (reloaded automatically when saved)")
+    except FileNotFoundError:
+        print(f"Using built-in settings ({CONFIG_FILE} not found)")
+    except (OSError, ValueError) as e:
+        print(f"✗ {CONFIG_FILE}: {e}")
+        return False
+    # Reloads are compiled with the lever calibration in the watcher's thread, not the loop's
+    config_watcher = ConfigWatcher(CONFIG_FILE, base, CONFIG_CHECK_INTERVAL,
+                                   lambda: calibrator.ranges() if calibrator is not None else None)
+    config_watcher.start()
+    return True
 
 
-def get_5pos_zone(value):
+def calibrated(cfg):
+    """The same settings compiled with the current calibration"""
+    if calibrator is None:
+        return cfg
+    return CompiledConfig(cfg.settings, calibrator.ranges())
+
+
+def update_calibration_learning(source=None):
     """
-    Divide 0-1023 range into 5 zones for 5-position controls
-    Used for headlight control with 5 positions
+    Learn online only from real levers: simulated ones would calibrate the
+    panel to the simulator, and step mode sends notches, not readings
+    Goes by the source actually in use (a console "input" switch changes it
+    without touching the settings); called again after every switch
     
-    Zone mapping:
-    - 0: 0-204 (far left)
-    - 1: 205-409 (left/neutral area)
-    - 2: 410-613 (middle/neutral)
-    - 3: 614-818 (right/neutral area)
-    - 4: 819-1023 (far right)
+    Args:
+        source: The source just made current (defaults to the InputManager's)
+    """
+    if calibrator is None:
+        return
+    if source is None:
+        source = input_manager.current
+    if source is None:
+        # Nothing open yet, or the loop was handed its source directly: go by the settings
+        name, step_mode = INPUT_SOURCE, INPUT_SOURCE == "serial" and SERIAL_MODE == "steps"
+    else:
+        inner = getattr(source, 'inner', source)  # RecordingSource …
+        inner = getattr(inner, 'source', inner)  # … ProcessSource
+        name, step_mode = source.name, isinstance(inner, StepSerialSource)
+    calibrator.enabled = active_config.settings['calibration']['online'] and name != "simulation" and not step_mode
+
+
+def load_calibration():
+    """Apply CALIBRATION_FILE if it exists and set up the calibrator and its compiler"""
+    global calibrator, calibration_compiler
+    saved = {}
+    try:
+        saved = calibration.load(CALIBRATION_FILE)
+        print(f"✓ Lever calibration loaded from {CALIBRATION_FILE} ({len(saved)} levers)")
+    except FileNotFoundError:
+        print(f"Levers uncalibrated ({CALIBRATION_FILE} not found - run python calibration.py)")
+    except (OSError, ValueError) as e:
+        print(f"✗ {CALIBRATION_FILE}: {e} - levers uncalibrated")
+    calibrator = Calibrator(saved)
+    calibration_compiler = CalibrationCompiler(calibrator, lambda: active_config, CALIBRATION_INTERVAL)
+    update_calibration_learning()
+    apply_config(calibrated(active_config), switch_input=False)
+
+
+def save_calibration():
+    """
+    Write what the calibrator knows to CALIBRATION_FILE if it learned anything
+
+    Returns:
+        True if the file was written
+    """
+    ranges = calibrator.ranges()
+    try:
+        if ranges == calibration.load(CALIBRATION_FILE):
+            return False
+    except (OSError, ValueError):
+        if not ranges:
+            return False
+    try:
+        calibration.save(CALIBRATION_FILE, ranges)
+    except OSError as e:
+        print(f"  ✗ Could not save the lever calibration: {e}")
+        return False
+    return True
+
+
+# ============================================================================
+# KEYBOARD FUNCTIONS (PYNPUT)
+# ============================================================================
+
+# Every press goes through the held-key registry, which releases timed holds
+# from the scheduler thread and releases everything on shutdown, focus loss,
+# handler errors or a stalled loop (see held_keys.py)
+scheduler = TimerScheduler(clock.now)
+held_keys = HeldKeyRegistry(keyboard, scheduler, clock.now,
+                            on_recovery=lambda reason, keys: events.log(WARNING, 'keys_released', reason, keys))
+whistle = WhistleDriver(held_keys, scheduler, Key.shift)
+
+# While a modifier is held (high whistle), other keys wait in the whistle's queue:
+# they would arrive as Shift+key, so they go out once it is up (see whistle.py)
+MODIFIER_KEYS = (Key.shift,)
+
+
+def set_keyboard_backend(backend):
+    """
+    Replace the keyboard backend used by every key function
+    Any object with press(key) and release(key) works (e.g. key_backends.RecordingKeyboard)
+    """
+    global keyboard
+    keyboard = backend
+    held_keys.keyboard = backend
+
+def set_clock(new_clock):
+    """
+    Replace the clock behind the control loop, key timing, debouncing and the
+    scheduler (call before the loop starts, like set_keyboard_backend)
+    With a clock.VirtualClock the loop's sleeps return at once and the
+    scheduler's timers run on the loop's thread at their exact times, so a
+    test runs far faster than real time with the same key timeline
     
     Args:
-        value: Analog input value (0-1023)
+        new_clock: clock.RealClock or clock.VirtualClock
+    """
+    global clock
+    clock = new_clock
+    scheduler.stop()
+    scheduler.clock = held_keys.clock = digital_inputs.clock = new_clock.now
+    # Times taken on the old clock mean nothing on the new one
+    for digital in digital_inputs.inputs.values():
+        digital.clock = new_clock.now
+        digital.changed_at = float('-inf')
+    held_keys.released_at.clear()
+    held_keys.last_heartbeat = new_clock.now()
+    predictor.clock = new_clock.now
+    predictor.reset()
+    scheduler.threaded = not isinstance(new_clock, VirtualClock)
+    if isinstance(new_clock, VirtualClock):
+        new_clock.attach(scheduler)
+
+key_audit = None  # KeyAudit while KEY_AUDIT_FILE is set
+
+
+def audit_intent(key, hold, sent, shift=False):
+    """Record a key a handler asked for, sent or not (no-op without KEY_AUDIT_FILE)"""
+    if key_audit is not None:
+        key_audit.intent(state, key, hold, sent, FRAMES.value, shift)
+
+def press_key(key, hold_duration: float = 0):
+    """
+    Press a key and release it after hold_duration, without blocking
+    (the scheduler does the release)
     
     Returns:
-        Zone number (0-4)
+        False if the key is still held from an earlier press (nothing sent).
+        While the high whistle holds Shift the key is queued and sent once
+        Shift is up (True), unless it is already queued (False)
     """
-    value = max(0, min(1023, value))  # Clamp to 0-1023
-    zone = int(value / 1023 * 5)
-    return min(zone, 4)  # Ensure zone is 0-4
+    if held_keys.any_held(MODIFIER_KEYS):
+        queued = whistle.defer(key, hold_duration)
+        audit_intent(key, hold_duration, queued)
+        return queued
+    t0 = time.perf_counter()
+    pressed = held_keys.press(key, hold_duration)
+    STAGE_KEY_INJECT.observe(time.perf_counter() - t0)
+    if pressed:
+        KEYS.inc()
+    audit_intent(key, hold_duration, pressed)
+    return pressed
 
+def hold_key(key):
+    """Hold a key down until release_key() (queued like press_key while Shift is held)"""
+    if held_keys.any_held(MODIFIER_KEYS):
+        queued = whistle.defer(key, None)
+        audit_intent(key, None, queued)
+        return queued
+    t0 = time.perf_counter()
+    pressed = held_keys.press(key)
+    STAGE_KEY_INJECT.observe(time.perf_counter() - t0)
+    if pressed:
+        KEYS.inc()
+    audit_intent(key, None, pressed)
+    return pressed
+
+def release_key(key):
+    """Release a held key"""
+    t0 = time.perf_counter()
+    whistle.discard(key)
+    held_keys.release(key)
+    STAGE_KEY_INJECT.observe(time.perf_counter() - t0)
+
+def press_hotkey(modifier, key):
+    """
+    Press a key combination (e.g., shift+j)
+    
+    Returns:
+        False if either key is still held (nothing sent)
+    """
+    if modifier in MODIFIER_KEYS and held_keys.is_held(modifier):
+        # The high whistle holds it: the key goes down under its Shift
+        sent = whistle.tap_shifted(key)
+        audit_intent(key, 0, sent, shift=True)
+        return sent
+    if not (held_keys.ready(modifier) and held_keys.ready(key)):
+        audit_intent(key, 0, False, shift=True)
+        return False
+    t0 = time.perf_counter()
+    held_keys.press(modifier)
+    try:
+        held_keys.press(key, 0)
+    finally:
+        held_keys.release(modifier)
+    STAGE_KEY_INJECT.observe(time.perf_counter() - t0)
+    KEYS.inc()
+    audit_intent(key, 0, True, shift=True)
+    return True
 
 # ============================================================================
 # STATE TRACKING
 # ============================================================================
 
 class ControlState:
-    """Stores the previous state of all controls to avoid key spam"""
+    """
+    Stores the previous state of all controls to avoid key spam
+    The *_step / *_zone fields are the positions we assume the game is in;
+    `targets` holds where the panel wants each control to be
+    """
     def __init__(self):
         self.whistle_active = False
         self.whistle_type: str | None = None  # 'low', 'high', or None
@@ -186,9 +620,52 @@ class ControlState:
         self.throttle_step = 0
         self.train_brake_step = 0
         self.ind_brake_step = 0
+        
+        # Per-channel values for the dashboard (written by the control loop only)
+        self.raw = {}  # Last value received
+        self.filtered = {}  # Value after clamping/deadzone, as used by the handler
+        self.targets = {}  # Step/zone the panel asks for
+        self.focused = False
+        self.active_window = ""
+    
+    def assumed_positions(self):
+        """Position we assume the game is in, per channel"""
+        return {
+            'WHISTLE': self.whistle_type or "off",
+            'BELL': "-",
+            'HEADLIGHT': self.headlight_zone,
+            'CYLINDER': self.cylinder_state,
+            'REVERSER': self.reverser_step,
+            'THROTTLE': self.throttle_step,
+            'TRAINBRAKE': self.train_brake_step,
+            'INDBRAKE': self.ind_brake_step,
+        }
+    
+    def snapshot(self):
+        """
+        Copy of the state for display, safe to call from another thread
+        (dict copies are atomic under the GIL, so the control loop is never blocked)
+        """
+        assumed = self.assumed_positions()
+        targets = dict(self.targets)
+        pending = {}
+        for channel, target in targets.items():
+            position = assumed.get(channel)
+            if isinstance(target, int) and isinstance(position, int) and target != position:
+                pending[channel] = target - position
+        return {
+            'raw': dict(self.raw),
+            'filtered': dict(self.filtered),
+            'targets': targets,
+            'assumed': assumed,
+            'pending': pending,
+            'focused': self.focused,
+            'active_window': self.active_window,
+        }
 
 
 state = ControlState()
+state_export = None  # StateExport while STATE_EXPORT_FILE is set
 
 
 # ============================================================================
@@ -213,12 +690,20 @@ def open_serial_connection(port=SERIAL_PORT, baud=SERIAL_BAUD):
     Handles errors gracefully
     
     Args:
-        port: COM port (e.g., "COM3")
+        port: COM port (e.g., "COM3"), or "auto" to find the panel
         baud: Baud rate (typically 9600)
     
     Returns:
         Serial object or None if connection fails
     """
+    if port == "auto":
+        print("Looking for the panel on all serial ports...")
+        port = find_panel(baud=baud)
+        if port is None:
+            print("✗ No panel found - is the Arduino plugged in and running the sketch?")
+            print(f"Available ports: {find_arduino_ports()}")
+            return None
+        print(f"✓ Panel found on {port}")
     try:
         ser = serial.Serial(port, baud, timeout=1)
         print(f"✓ Connected to {port} at {baud} baud")
@@ -238,17 +723,24 @@ def parse_serial_data(data_string):
         data_string: Raw serial string from Arduino
     
     Returns:
-        Dictionary with control values, or None if parsing fails
+        Dictionary with control values, or None if parsing fails or a
+        control's value is outside 0 … ADC_MAX (other fields, e.g. the UDP
+        sequence number, pass through)
     """
     try:
         controls = {}
         pairs = data_string.strip().split(';')
         for pair in pairs:
             key, value = pair.split(':')
-            controls[key.strip()] = int(value.strip())
+            key = key.strip()
+            value = int(value.strip())
+            if key in CHANNELS and not 0 <= value <= ADC_MAX:
+                raise ValueError(f"{key} out of range: {value}")
+            controls[key] = value
         return controls
     except Exception as e:
-        print(f"✗ Error parsing serial data: {e}")
+        PARSE_ERRORS.inc()
+        events.log(ERROR, 'parse_error', e)
         return None
 
 
@@ -256,58 +748,187 @@ def parse_serial_data(data_string):
 # INPUT READING
 # ============================================================================
 
-def get_simulation_data():
+def create_simulator():
     """
-    Generate random control values for testing without Arduino
-    Simulates realistic control movements
+    Build the scenario simulator for simulation mode (see simulator.py)
     
     Returns:
-        Dictionary with all control values
-    """
-    data = {
-        'WHISTLE': random.randint(450, 550),  # Usually near center, sometimes moves
-        'BELL': random.choice([0, 0, 0, 1]),  # Mostly 0, occasionally pressed
-        'HEADLIGHT': random.randint(0, 1023),
-        'CYLINDER': random.choice([0, 1]),
-        'REVERSER': random.randint(0, 1023),
-        'THROTTLE': random.randint(0, 1023),
-        'TRAINBRAKE': random.randint(0, 1023),
-        'INDBRAKE': random.randint(0, 1023),
-    }
-    return data
+        ScenarioSimulator - call frame_now() for the newest frame
+    """
+    return ScenarioSimulator(SIMULATION_SCENARIO, seed=SIMULATION_SEED, rate=SIMULATION_RATE, clock=clock.now)
 
 
-def get_control_data(ser=None):
+def create_input_source(name):
     """
-    Get control data from either simulation or serial
+    Build (but don't open) the input source called `name`
     
     Args:
-        ser: Serial connection object (None if simulation mode)
+        name: One of the INPUT_SOURCE options
     
     Returns:
-        Dictionary with control values
+        InputSource
     """
-    if SIMULATION_MODE:
-        return get_simulation_data()
+    if name == "simulation":
+        source = SimulationSource(create_simulator().frame_now, UPDATE_INTERVAL)
+    elif name == "serial":
+        source = None
+        if SERIAL_MODE == "steps":
+            try:
+                source = StepSerialSource(SERIAL_PORT, SERIAL_BAUD, open_serial_connection, parse_serial_data,
+                                          build_step_tables(active_config), STEP_HYSTERESIS)
+            except ValueError as e:
+                print(f"✗ {e} - using raw frames")
+        if source is None:
+            source = SerialSource(SERIAL_PORT, SERIAL_BAUD, open_serial_connection, parse_serial_data)
+        if SERIAL_PROCESS:
+            # The child's main thread is its reader, so it gets the reader cores
+            options = None
+            if REALTIME_MODE:
+                options = {'priority': REALTIME_PRIORITY, 'control_cores': READER_CORES, 'gc_mode': 'freeze'}
+            source = ProcessSource(source, options)
+    elif name == "panels":
+        panel_list = [
+            SerialPanel(panel['name'], panel['port'], panel.get('baud', SERIAL_BAUD),
+                        open_serial_connection, parse_serial_data)
+            for panel in PANELS
+        ]
+        source = PanelSetSource(PanelSet(panel_list, CHANNEL_RULES, DEFAULT_CHANNEL_RULE))
+    elif name == "udp":
+        source = UdpSource(UDP_PORT, UDP_BIND, parse_serial_data)
+    elif name == "replay":
+        source = ReplaySource(REPLAY_FILE, parse_serial_data, speed=REPLAY_SPEED, clock=clock)
+    elif name == "pty":
+        source = PtySource(parse_serial_data)
+    else:
+        raise ValueError(f"Unknown input source: {name!r}")
     
-    if ser is None:
-        print("✗ Serial port not connected in serial mode")
-        return None
+    if RECORD_FILE and name != "replay":
+        source = RecordingSource(source, RECORD_FILE)
+    return source
+
+
+input_manager = InputManager(create_input_source, on_switch=update_calibration_learning)
+
+
+def get_control_data(source=None):
+    """
+    Get the newest control frame from the active input source
+    
+    Args:
+        source: Input source to read (defaults to the InputManager's current source)
+    
+    Returns:
+        Dictionary with control values, or None if nothing new arrived
+    """
+    if source is None:
+        source = input_manager
+    return source.poll()
+
+
+def switch_input_source(name):
+    """
+    Switch to another input source while running (takes effect next tick)
     
+    Returns:
+        True if the new source opened successfully
+    """
     try:
-        if ser.in_waiting:
-            line = ser.readline().decode('utf-8').strip()
-            return parse_serial_data(line)
-    except Exception as e:
-        print(f"✗ Error reading from serial: {e}")
+        return input_manager.switch(name)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return False
+
+
+def reopen_input_source(old_input):
+    """
+    Open the source for changed input settings (from apply_config, between ticks)
+    A serial port is exclusive (always on Windows), so a new baud or mode on
+    the same port closes the current source before the new one opens;
+    anything else is switched to like a console switch
+    
+    Args:
+        old_input: Input settings the current source was built from
     
-    return None
+    Returns:
+        True if the new source opened
+    """
+    if (input_manager.current.name == "serial" and INPUT_SOURCE == "serial"
+            and SERIAL_PORT == old_input['serial_port']):
+        try:
+            return input_manager.reopen(INPUT_SOURCE)
+        except ValueError as e:
+            print(f"✗ {e}")
+            return False
+    return switch_input_source(INPUT_SOURCE)
+
+
+def read_console_commands(stream=None):
+    """
+    Commands typed into this console window while the controller runs
+    (run in a daemon thread; reads until the stream closes):
+
+        input <name>    switch the input source (one of the INPUT_SOURCE options)
+    
+    Args:
+        stream: Line source (defaults to sys.stdin)
+    """
+    for line in stream or sys.stdin:
+        words = line.split()
+        if len(words) == 2 and words[0] == 'input':
+            switch_input_source(words[1])
+        elif words:
+            print("⚠ Unknown command - type: input <name>")
 
 
 # ============================================================================
 # CONTROL HANDLERS
 # ============================================================================
 
+def settle(cfg, channel, value, step):
+    """
+    Notch hysteresis: keep the channel's current target while `value` is
+    within the lever's calibrated noise of it (see CompiledConfig.bands)
+    
+    Returns:
+        Step/zone to use
+    """
+    previous = state.targets.get(channel)
+    if previous is None or previous == step:
+        return step
+    below, above = cfg.bands[channel]
+    if lookup(below, value) <= previous <= lookup(above, value):
+        return previous
+    return step
+
+
+def lead(cfg, channel, value, step):
+    """
+    Motion prediction: the step a notched handler presses towards
+    With a lead set for the channel, that is the step the lever will be at
+    lead seconds from now (see prediction.py), at most max_ahead notches
+    past `step`; otherwise, and while the lever stands still, `step` itself
+    
+    Returns:
+        Step to move the game towards
+    """
+    seconds = cfg.leads[channel]
+    if not seconds:
+        return step
+    prediction = cfg.prediction
+    projected = predictor.project(channel, value, seconds, cfg.noise[channel], prediction['min_speed'])
+    if projected is None:
+        return step
+    ahead = lookup(cfg.tables[channel], projected)
+    limit = prediction['max_ahead']
+    if ahead > step + limit:
+        ahead = step + limit
+    elif ahead < step - limit:
+        ahead = step - limit
+    if step > 0 > ahead or step < 0 < ahead:
+        ahead = 0  # Never predict the reverser through neutral
+    return ahead
+
+
 def handle_whistle(whistle_value):
     """
     Whistle control: potentiometer with middle deadzone
@@ -315,30 +936,50 @@ def handle_whistle(whistle_value):
     Above center → Shift+H (high pitch)
     In deadzone → nothing
     
+    WHISTLE_MODE "hold" keeps the key down while the lever is pulled, "pulse"
+    pulses it harder the further it is pulled (see whistle.py), "tap" sends
+    one tap when the lever leaves the deadzone
+    
     Args:
         whistle_value: Analog value (0-1023)
     """
-    # Apply deadzone around center (512)
-    dz = deadzone(whistle_value, center=512, deadzone_range=50)
+    cfg = active_config
+    controls = cfg.controls
+    direction = lookup(cfg.tables['WHISTLE'], whistle_value)
+    dz = lookup(cfg.tables['WHISTLE_OFFSET'], whistle_value)
+    state.filtered['WHISTLE'] = dz
+    state.targets['WHISTLE'] = 'high' if direction > 0 else 'low' if direction < 0 else "off"
     
-    if DEBUG_MODE:
-        print(f"WHISTLE: value={whistle_value}, deadzone_val={dz}")
+    events.debug('whistle_value', whistle_value, dz)
+    
+    if controls['whistle_mode'] != 'tap':
+        pitch = 'high' if direction > 0 else 'low' if direction < 0 else None
+        whistle.update(pitch, lookup(cfg.tables['WHISTLE_INTENSITY'], whistle_value), cfg.keys['whistle'],
+                       controls['whistle_mode'], controls['whistle_pulse_rate'], controls['whistle_min_duty'])
+        if pitch is not None and pitch != state.whistle_type:
+            key = cfg.keys['whistle'].upper()
+            log_key(f"Shift+{key}" if pitch == 'high' else key, "HELD", f"WHISTLE {pitch.upper()}")
+        state.whistle_active = pitch is not None
+        state.whistle_type = pitch
+        return
+    if whistle.sounding:
+        whistle.stop()  # Switched to tap mode by a config reload
     
     # Check which direction from center
-    if dz > 0:
+    if direction > 0:
         # Above center - high pitch whistle (Shift+H)
         if not state.whistle_active or state.whistle_type != 'high':
-            press_hotkey(Key.shift, 'h')
-            log_key('Shift+H', "PRESS", "WHISTLE HIGH")
-            state.whistle_active = True
-            state.whistle_type = 'high'
-    elif dz < 0:
+            if press_hotkey(Key.shift, cfg.keys['whistle']):
+                log_key(f"Shift+{cfg.keys['whistle'].upper()}", "PRESS", "WHISTLE HIGH")
+                state.whistle_active = True
+                state.whistle_type = 'high'
+    elif direction < 0:
         # Below center - low pitch whistle (H)
         if not state.whistle_active or state.whistle_type != 'low':
-            press_key('h')
-            log_key('H', "PRESS", "WHISTLE LOW")
-            state.whistle_active = True
-            state.whistle_type = 'low'
+            if press_key(cfg.keys['whistle']):
+                log_key(cfg.keys['whistle'].upper(), "PRESS", "WHISTLE LOW")
+                state.whistle_active = True
+                state.whistle_type = 'low'
     else:
         # In deadzone - no whistle
         if state.whistle_active:
@@ -349,17 +990,21 @@ def handle_whistle(whistle_value):
 def handle_bell(bell_value):
     """
     Bell control: button press
-    Trigger key "b" when button goes from 0 to 1
+    Trigger key "b" once when the (debounced) button goes from 0 to 1,
+    plus auto-repeat while held if BELL_REPEAT_RATE is set
     
     Args:
         bell_value: Button state (0 or 1)
     """
-    # We only trigger on the rising edge (0→1)
-    # Note: This needs external tracking if we want to avoid repeated presses
-    # For now, we'll just press when value is 1
-    if bell_value == 1:
-        press_key('b')
-        log_key('b', "PRESS", "BELL")
+    button = digital_inputs['BELL']
+    fired = button.update(bell_value)
+    if fired:  # Usually empty; don't build an iterator for nothing
+        for event in fired:
+            if event == PRESS or event == REPEAT:
+                key = active_config.keys['bell']
+                if press_key(key):
+                    log_key(key, "PRESS" if event == PRESS else "REPEAT", "BELL")
+    state.targets['BELL'] = button.state
 
 
 def handle_headlight(headlight_value):
@@ -371,33 +1016,41 @@ def handle_headlight(headlight_value):
     Args:
         headlight_value: Analog value (0-1023)
     """
-    zone = get_5pos_zone(headlight_value)
+    cfg = active_config
+    zone = settle(cfg, 'HEADLIGHT', headlight_value, lookup(cfg.tables['HEADLIGHT'], headlight_value))
+    state.filtered['HEADLIGHT'] = lookup(cfg.tables['ADC'], headlight_value)
+    state.targets['HEADLIGHT'] = zone
     
-    # If zone changed, emit appropriate key
+    # If zone changed, emit one key per frame until the game catches up
+    key = cfg.keys['headlight']
     if zone > state.headlight_zone:
         # Zone increased (moved right)
-        press_key('j')
-        log_key('j', "PRESS", "HEADLIGHT UP")
+        if press_key(key):
+            state.headlight_zone += 1
+            log_key(key, "PRESS", "HEADLIGHT UP")
     elif zone < state.headlight_zone:
         # Zone decreased (moved left)
-        press_hotkey(Key.shift, 'j')
-        log_key('shift+j', "PRESS", "HEADLIGHT DOWN")
-    
-    state.headlight_zone = zone
+        if press_hotkey(Key.shift, key):
+            state.headlight_zone -= 1
+            log_key(f"shift+{key}", "PRESS", "HEADLIGHT DOWN")
 
 
 def handle_cylinder_cocks(cylinder_value):
     """
     Cylinder cocks: toggle switch
-    Press "k" when state changes (0→1 or 1→0)
+    Press "k" when the debounced state changes (0→1 or 1→0)
     
     Args:
         cylinder_value: Switch state (0 or 1)
     """
-    if cylinder_value != state.cylinder_state:
-        press_key('k')
-        log_key('k', "PRESS", "CYLINDER COCKS")
-        state.cylinder_state = cylinder_value
+    switch = digital_inputs['CYLINDER']
+    switch.update(cylinder_value)
+    state.targets['CYLINDER'] = switch.state
+    if switch.state != state.cylinder_state:
+        key = active_config.keys['cylinder']
+        if press_key(key):
+            log_key(key, "PRESS", "CYLINDER COCKS")
+            state.cylinder_state = switch.state
 
 
 def handle_reverser(reverser_value):
@@ -410,32 +1063,30 @@ def handle_reverser(reverser_value):
     Args:
         reverser_value: Analog value (0-1023)
     """
-    # Apply deadzone around middle
-    dz = deadzone(reverser_value, center=512, deadzone_range=50)
+    cfg = active_config
+    current_step = settle(cfg, 'REVERSER', reverser_value, lookup(cfg.tables['REVERSER'], reverser_value))
+    dz = lookup(cfg.tables['REVERSER_OFFSET'], reverser_value)
     
-    if dz == 0:
-        # In deadzone, reset to step 0
-        current_step = 0
-    elif dz > 0:
-        # Right side - map to positive steps
-        current_step = map_to_steps(reverser_value, in_min=562, in_max=1023, steps=MAX_STEPS)
-    else:
-        # Left side - map to negative steps
-        current_step = -map_to_steps(reverser_value, in_min=0, in_max=461, steps=MAX_STEPS)
+    state.filtered['REVERSER'] = dz
+    state.targets['REVERSER'] = current_step
     
-    if DEBUG_MODE:
-        print(f"REVERSER: value={reverser_value}, dz={dz}, step={current_step}, prev_step={state.reverser_step}")
+    events.debug('reverser_value', reverser_value, dz, current_step, state.reverser_step)
     
-    # Emit keys when step increases (forward/backward direction changes)
-    # HOLD the key for 0.15s so the game registers it
-    if current_step > state.reverser_step:
-        press_key('[', hold_duration=0.15)
-        log_key('[', "HELD", f"REVERSER FORWARD (step {current_step})")
-    elif current_step < state.reverser_step:
-        press_key(']', hold_duration=0.15)
-        log_key(']', "HELD", f"REVERSER BACKWARD (step {current_step})")
-    
-    state.reverser_step = current_step
+    # Emit one notch per frame towards the target (forward/backward; with prediction on:
+    # where the lever is heading)
+    # HOLD the key for NOTCH_HOLD so the game registers it; while the previous
+    # notch is still held, press_key refuses and we try again next frame
+    target = lead(cfg, 'REVERSER', reverser_value, current_step)
+    if target > state.reverser_step:
+        key = cfg.keys['reverser_forward']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.reverser_step += 1
+            log_key(key, "HELD", "REVERSER FORWARD", state.reverser_step)
+    elif target < state.reverser_step:
+        key = cfg.keys['reverser_backward']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.reverser_step -= 1
+            log_key(key, "HELD", "REVERSER BACKWARD", state.reverser_step)
 
 
 def handle_throttle(throttle_value):
@@ -447,20 +1098,27 @@ def handle_throttle(throttle_value):
     Args:
         throttle_value: Analog value (0-1023)
     """
-    step = map_to_steps(throttle_value, steps=MAX_STEPS)
-    
-    if DEBUG_MODE:
-        print(f"THROTTLE: value={throttle_value}, step={step}, prev_step={state.throttle_step}")
+    cfg = active_config
+    step = settle(cfg, 'THROTTLE', throttle_value, lookup(cfg.tables['THROTTLE'], throttle_value))
+    state.filtered['THROTTLE'] = lookup(cfg.tables['ADC'], throttle_value)
+    state.targets['THROTTLE'] = step
     
-    # HOLD the key for 0.15s so the game registers the increment
-    if step > state.throttle_step:
-        press_key('-', hold_duration=0.15)
-        log_key('-', "HELD", f"THROTTLE UP (step {step})")
-    elif step < state.throttle_step:
-        press_key('=', hold_duration=0.15)
-        log_key('=', "HELD", f"THROTTLE DOWN (step {step})")
+    events.debug('value', "THROTTLE", throttle_value, step, state.throttle_step)
     
-    state.throttle_step = step
+    # One notch per frame towards the target (with prediction on: where the lever is heading)
+    # HOLD the key for NOTCH_HOLD so the game registers the increment
+    # (released by the scheduler, so the other controls are not blocked)
+    target = lead(cfg, 'THROTTLE', throttle_value, step)
+    if target > state.throttle_step:
+        key = cfg.keys['throttle_up']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.throttle_step += 1
+            log_key(key, "HELD", "THROTTLE UP", state.throttle_step)
+    elif target < state.throttle_step:
+        key = cfg.keys['throttle_down']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.throttle_step -= 1
+            log_key(key, "HELD", "THROTTLE DOWN", state.throttle_step)
 
 
 def handle_train_brake(brake_value):
@@ -472,20 +1130,27 @@ def handle_train_brake(brake_value):
     Args:
         brake_value: Analog value (0-1023)
     """
-    step = map_to_steps(brake_value, steps=MAX_STEPS)
-    
-    if DEBUG_MODE:
-        print(f"TRAIN_BRAKE: value={brake_value}, step={step}, prev_step={state.train_brake_step}")
+    cfg = active_config
+    step = settle(cfg, 'TRAINBRAKE', brake_value, lookup(cfg.tables['TRAINBRAKE'], brake_value))
+    state.filtered['TRAINBRAKE'] = lookup(cfg.tables['ADC'], brake_value)
+    state.targets['TRAINBRAKE'] = step
     
-    # HOLD the key for 0.15s so the game registers the increment
-    if step > state.train_brake_step:
-        press_key("'", hold_duration=0.15)
-        log_key("'", "HELD", f"TRAIN BRAKE UP (step {step})")
-    elif step < state.train_brake_step:
-        press_key(';', hold_duration=0.15)
-        log_key(';', "HELD", f"TRAIN BRAKE DOWN (step {step})")
+    events.debug('value', "TRAIN_BRAKE", brake_value, step, state.train_brake_step)
     
-    state.train_brake_step = step
+    # One notch per frame towards the target (with prediction on: where the lever is heading)
+    # HOLD the key for NOTCH_HOLD so the game registers the increment
+    # (released by the scheduler, so the other controls are not blocked)
+    target = lead(cfg, 'TRAINBRAKE', brake_value, step)
+    if target > state.train_brake_step:
+        key = cfg.keys['train_brake_up']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.train_brake_step += 1
+            log_key(key, "HELD", "TRAIN BRAKE UP", state.train_brake_step)
+    elif target < state.train_brake_step:
+        key = cfg.keys['train_brake_down']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.train_brake_step -= 1
+            log_key(key, "HELD", "TRAIN BRAKE DOWN", state.train_brake_step)
 
 
 def handle_independent_brake(ind_brake_value):
@@ -497,26 +1162,65 @@ def handle_independent_brake(ind_brake_value):
     Args:
         ind_brake_value: Analog value (0-1023)
     """
-    step = map_to_steps(ind_brake_value, steps=MAX_STEPS)
+    cfg = active_config
+    step = settle(cfg, 'INDBRAKE', ind_brake_value, lookup(cfg.tables['INDBRAKE'], ind_brake_value))
+    state.filtered['INDBRAKE'] = lookup(cfg.tables['ADC'], ind_brake_value)
+    state.targets['INDBRAKE'] = step
     
-    if DEBUG_MODE:
-        print(f"IND_BRAKE: value={ind_brake_value}, step={step}, prev_step={state.ind_brake_step}")
+    events.debug('value', "IND_BRAKE", ind_brake_value, step, state.ind_brake_step)
     
-    # HOLD the key for 0.15s so the game registers the increment
-    if step > state.ind_brake_step:
-        press_key('.', hold_duration=0.15)
-        log_key('.', "HELD", f"IND BRAKE UP (step {step})")
-    elif step < state.ind_brake_step:
-        press_key(',', hold_duration=0.15)
-        log_key(',', "HELD", f"IND BRAKE DOWN (step {step})")
-    
-    state.ind_brake_step = step
+    # One notch per frame towards the target (with prediction on: where the lever is heading)
+    # HOLD the key for NOTCH_HOLD so the game registers the increment
+    # (released by the scheduler, so the other controls are not blocked)
+    target = lead(cfg, 'INDBRAKE', ind_brake_value, step)
+    if target > state.ind_brake_step:
+        key = cfg.keys['ind_brake_up']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.ind_brake_step += 1
+            log_key(key, "HELD", "IND BRAKE UP", state.ind_brake_step)
+    elif target < state.ind_brake_step:
+        key = cfg.keys['ind_brake_down']
+        if press_key(key, hold_duration=cfg.notch_hold):
+            state.ind_brake_step -= 1
+            log_key(key, "HELD", "IND BRAKE DOWN", state.ind_brake_step)
 
 
 # ============================================================================
 # MAIN CONTROL HANDLER
 # ============================================================================
 
+# Control registry: (channel, display name, handler, timer)
+# handle_controls dispatches every channel present in a frame through this table
+CONTROL_HANDLERS = [
+    ('WHISTLE', "Whistle", handle_whistle, metrics.stage('handler_whistle')),
+    ('BELL', "Bell", handle_bell, metrics.stage('handler_bell')),
+    ('HEADLIGHT', "Headlight", handle_headlight, metrics.stage('handler_headlight')),
+    ('CYLINDER', "Cylinder cocks", handle_cylinder_cocks, metrics.stage('handler_cylinder')),
+    ('REVERSER', "Reverser", handle_reverser, metrics.stage('handler_reverser')),
+    ('THROTTLE', "Throttle", handle_throttle, metrics.stage('handler_throttle')),
+    ('TRAINBRAKE', "Train brake", handle_train_brake, metrics.stage('handler_trainbrake')),
+    ('INDBRAKE', "Independent brake", handle_independent_brake, metrics.stage('handler_indbrake')),
+]
+
+# Key bindings (KEY_BINDINGS names) each channel's handler sends (checked by diagnostics.py)
+CHANNEL_BINDINGS = {
+    'WHISTLE': ('whistle',),
+    'BELL': ('bell',),
+    'HEADLIGHT': ('headlight',),
+    'CYLINDER': ('cylinder',),
+    'REVERSER': ('reverser_forward', 'reverser_backward'),
+    'THROTTLE': ('throttle_up', 'throttle_down'),
+    'TRAINBRAKE': ('train_brake_up', 'train_brake_down'),
+    'INDBRAKE': ('ind_brake_up', 'ind_brake_down'),
+}
+SHIFTED_BINDINGS = ('whistle', 'headlight')  # Also sent as Shift+key (high whistle, dimmer)
+
+
+def key_controls(cfg):
+    """Key → channel for every key a handler sends (names the control in key audit records)"""
+    return {cfg.keys[binding]: channel for channel, bindings in CHANNEL_BINDINGS.items() for binding in bindings}
+
+
 def handle_controls(data):
     """
     Main control handler: processes all controls from input data
@@ -528,79 +1232,184 @@ def handle_controls(data):
     if data is None:
         return
     
+    FRAMES.inc()
+    
     # Process each control with error handling
-    try:
-        if 'WHISTLE' in data:
-            handle_whistle(data['WHISTLE'])
-    except Exception as e:
-        print(f"✗ Whistle error: {e}")
+    # (indexed rather than a for loop: a steady tick allocates nothing, not even an iterator)
+    i = 0
+    while i < len(CONTROL_HANDLERS):
+        channel, name, handler, timer = CONTROL_HANDLERS[i]
+        i += 1
+        if channel not in data:
+            continue
+        state.raw[channel] = data[channel]
+        if calibrator is not None:
+            calibrator.observe(channel, data[channel])
+        t0 = time.perf_counter()
+        try:
+            handler(data[channel])
+        except Exception as e:
+            events.log(ERROR, 'handler_error', name, e)
+            held_keys.release_all('error')
+        timer.observe(time.perf_counter() - t0)
+
+
+# ============================================================================
+# MAIN PROGRAM
+# ============================================================================
+
+def loop_stats():
+    """Counters and tick timing for the dashboard"""
+    source_stats = input_manager.stats()
+    tick_p50 = STAGE_TICK.quantile(0.5)
+    tick_p99 = STAGE_TICK.quantile(0.99)
+    return {
+        'frames': FRAMES.value,
+        'keys': KEYS.value,
+        'drops': DROPS.value,
+        'parse_errors': PARSE_ERRORS.value,
+        'held_keys': [str(key) for key in list(held_keys.held)],
+        'recoveries': held_keys.recoveries.value,
+        'source': input_manager.current.name if input_manager.current is not None else "-",
+        'panels': source_stats.get('panels', []),
+        'udp': source_stats.get('udp'),
+        'tick_p50': metrics.format_seconds(tick_p50) if tick_p50 is not None else "-",
+        'tick_p99': metrics.format_seconds(tick_p99) if tick_p99 is not None else "-",
+    }
+
+
+def control_tick(source=None, focus_check=None):
+    """
+    One pass of the control loop: focus check, read, handle
+    While nothing changes (same frame, no key to send) a tick allocates
+    nothing - test_allocations.py checks that
     
-    try:
-        if 'BELL' in data:
-            handle_bell(data['BELL'])
-    except Exception as e:
-        print(f"✗ Bell error: {e}")
+    Args:
+        source: Input source (defaults to the InputManager)
+        focus_check: Focus test to use (defaults to is_railroader_focused)
     
-    try:
-        if 'HEADLIGHT' in data:
-            handle_headlight(data['HEADLIGHT'])
-    except Exception as e:
-        print(f"✗ Headlight error: {e}")
+    Returns:
+        True if Railroader is focused
+    """
+    tick_start = time.perf_counter()
+    held_keys.heartbeat()
     
-    try:
-        if 'CYLINDER' in data:
-            handle_cylinder_cocks(data['CYLINDER'])
-    except Exception as e:
-        print(f"✗ Cylinder cocks error: {e}")
+    # CHECK WINDOW FOCUS EVERY SINGLE ITERATION (CRITICAL SAFETY!)
+    currently_focused = focus_check() if focus_check is not None else is_railroader_focused()
+    STAGE_FOCUS.observe(time.perf_counter() - tick_start)
+    state.focused = currently_focused
+    held_keys.enabled = currently_focused  # Also stops scheduled presses (whistle pulses)
     
-    try:
-        if 'REVERSER' in data:
-            handle_reverser(data['REVERSER'])
-    except Exception as e:
-        print(f"✗ Reverser error: {e}")
+    # Only process controls if Railroader is focused
+    if currently_focused:
+        # Read control data
+        data = get_control_data(source)
+        
+        # Process controls
+        if data:
+            t0 = time.perf_counter()
+            handle_controls(data)
+            STAGE_HANDLERS.observe(time.perf_counter() - t0)
+    else:
+        # Never leave a key down in whatever window has focus now
+        if whistle.sounding:
+            whistle.stop()
+        if held_keys.held:
+            held_keys.release_all('focus')
+        # Not focused - show warning occasionally
+        window_title = get_active_window_title()
+        state.active_window = window_title
+        if window_title and not DASHBOARD_ENABLED:  # Only print if we got a title
+            print(f"⚠ PAUSED - Railroader not focused (current: '{window_title[:50]}')  ", end='\r')
     
-    try:
-        if 'THROTTLE' in data:
-            handle_throttle(data['THROTTLE'])
-    except Exception as e:
-        print(f"✗ Throttle error: {e}")
+    # Overlays and loggers see the new state (a no-op while nothing changed)
+    if state_export is not None:
+        state_export.publish(state, (input_manager if source is None else source).connected())
+    if currently_focused:
+        STAGE_TICK.observe(time.perf_counter() - tick_start)
+    return currently_focused
+
+
+def control_loop(source=None, stop_event=None, focus_check=None):
+    """
+    Read → handle loop, runs until Ctrl+C or until stop_event is set
     
-    try:
-        if 'TRAINBRAKE' in data:
-            handle_train_brake(data['TRAINBRAKE'])
-    except Exception as e:
-        print(f"✗ Train brake error: {e}")
+    Args:
+        source: Input source (defaults to the InputManager, which allows runtime switching)
+        stop_event: Optional threading.Event that ends the loop when set
+        focus_check: Focus test to use (defaults to is_railroader_focused)
+    """
+    realtime.join_thread('control')
     
-    try:
-        if 'INDBRAKE' in data:
-            handle_independent_brake(data['INDBRAKE'])
-    except Exception as e:
-        print(f"✗ Independent brake error: {e}")
-
+    while stop_event is None or not stop_event.is_set():
+        # Swap in a reloaded config between ticks, never in the middle of one
+        if config_watcher is not None and config_watcher.pending is not None:
+            new_config = config_watcher.take()
+            if new_config is not None:
+                apply_config(new_config)
+                events.log(INFO, 'message', f"✓ Settings reloaded from {CONFIG_FILE}")
+        # Tables rebuilt from what the online calibration learned (compiled in the background)
+        if calibration_compiler is not None and calibration_compiler.pending is not None:
+            new_config = calibration_compiler.take()
+            if new_config is not None and new_config.settings is active_config.settings:
+                apply_config(new_config, switch_input=False)
+                events.log(INFO, 'message', "✓ Lever calibration updated")
+            elif new_config is not None:
+                calibrator.changed = True  # Compiled from settings reloaded since: build it again
+        
+        # Wait before next update (collecting garbage first with GC_MODE = "scheduled");
+        # longer delay when not focused
+        interval = UPDATE_INTERVAL if control_tick(source, focus_check) else 0.5
+        remaining = interval - realtime.collect_idle(interval)
+        if remaining > 0:
+            clock.sleep(remaining)
 
-# ============================================================================
-# MAIN PROGRAM
-# ============================================================================
 
 def main():
     """Main program loop"""
+    global state_export, key_audit
     
     print("=" * 70)
     print("RAILROADER TRAIN CONTROL PANEL INTERFACE (PYNPUT VERSION)")
     print("=" * 70)
     print()
     
-    # Display mode
-    if SIMULATION_MODE:
-        print("MODE: SIMULATION (random values)")
-        print("LOG_KEYS: Enabled - watch console to verify key presses")
-        ser = None
-    else:
-        print("MODE: SERIAL (Arduino)")
-        ser = open_serial_connection(SERIAL_PORT, SERIAL_BAUD)
-        if ser is None:
-            print("✗ Failed to connect to Arduino. Exiting.")
+    if PYNPUT_ERROR is not None:
+        print(f"✗ pynput is not available: {PYNPUT_ERROR}")
+        print("  Install with: pip install pynput")
+        return
+    
+    if not load_config_file():
+        print("Fix the settings file and try again. Exiting.")
+        return
+    if CALIBRATION_FILE:
+        load_calibration()
+        calibration_compiler.start()
+    
+    if REALTIME_MODE:
+        try:
+            report = realtime.enable(REALTIME_PRIORITY, CONTROL_CORES, READER_CORES, GC_MODE)
+        except ValueError as e:
+            print(f"✗ {e}")
             return
+        thread = report['control_thread']
+        print(f"✓ Real-time mode: process priority {report['process_priority']}, "
+              f"control thread {thread.get('priority', 'unchanged')}"
+              + (f" on cores {thread['cores']}" if 'cores' in thread else "")
+              + f", GC {report['gc_mode']}")
+    
+    # Open the input source
+    print(f"MODE: {INPUT_SOURCE.upper()}")
+    if INPUT_SOURCE == "simulation":
+        print("LOG_KEYS: Enabled - watch console to verify key presses")
+    try:
+        opened = input_manager.select(INPUT_SOURCE)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return
+    if not opened:
+        print(f"✗ Failed to open input source '{INPUT_SOURCE}'. Exiting.")
+        return
     
     print()
     print(f"Waiting {STARTUP_DELAY} seconds before starting...")
@@ -621,38 +1430,47 @@ def main():
     # Wait for user to switch to game window
     for i in range(STARTUP_DELAY, 0, -1):
         print(f"Starting in {i} seconds...", end='\r')
-        time.sleep(1)
+        clock.sleep(1)
     
     print("Starting control loop...          ")
     print()
-    print("KEY PRESSES WILL APPEAR BELOW:")
-    print("(If you don't see key presses, check LOG_KEYS = True above)")
-    print("-" * 70)
+    if METRICS_PORT and metrics.start_server(METRICS_PORT):
+        print(f"Metrics: http://127.0.0.1:{METRICS_PORT}/metrics")
+    if sys.stdin is not None and sys.stdin.isatty():
+        threading.Thread(target=read_console_commands, name="console", daemon=True).start()
+        print("Switch input: type 'input <name>' and Enter in this window")
+    if METRICS_SUMMARY_INTERVAL and not DASHBOARD_ENABLED:
+        metrics.start_console_summary(METRICS_SUMMARY_INTERVAL, ['tick', 'serial_read', 'parse', 'handlers', 'focus_check', 'key_inject'])
     print()
+    if not DASHBOARD_ENABLED:
+        print("KEY PRESSES WILL APPEAR BELOW:")
+        print("(If you don't see key presses, check LOG_KEYS = True above)")
+        print("-" * 70)
+        print()
     
+    dashboard = None
+    if DASHBOARD_ENABLED:
+        # Key events go to LOG_FILE only; the dashboard replaces the console stream
+        events.console = False
+        dashboard = Dashboard(lambda: state.snapshot(), loop_stats, rate=DASHBOARD_RATE)
+        dashboard.start()
+    
+    if KEY_AUDIT_FILE:
+        audit = KeyAudit(KEY_AUDIT_FILE, clock=clock.now)
+        if audit.start():
+            audit.bind(key_controls(active_config))
+            held_keys.on_press = lambda key, hold: audit.press(key, hold, FRAMES.value)
+            held_keys.on_release = lambda key, held_for, reason: audit.release(key, held_for, reason, FRAMES.value)
+            key_audit = audit
+    if STATE_EXPORT_FILE:
+        export = StateExport(STATE_EXPORT_FILE)
+        if export.open():
+            state_export = export
+    
+    events.start()
+    held_keys.start_watchdog()
     try:
-        while True:
-            # CHECK WINDOW FOCUS EVERY SINGLE ITERATION (CRITICAL SAFETY!)
-            currently_focused = is_railroader_focused()
-            
-            # Only process controls if Railroader is focused
-            if currently_focused:
-                # Read control data
-                data = get_control_data(ser)
-                
-                # Process controls
-                if data:
-                    handle_controls(data)
-            else:
-                # Not focused - show warning occasionally
-                window_title = get_active_window_title()
-                if window_title:  # Only print if we got a title
-                    print(f"⚠ PAUSED - Railroader not focused (current: '{window_title[:50]}')  ", end='\r')
-                time.sleep(0.5)  # Longer delay when not focused
-                continue
-            
-            # Wait before next update
-            time.sleep(UPDATE_INTERVAL)
+        control_loop()
     
     except KeyboardInterrupt:
         print("\n\n" + "=" * 70)
@@ -660,16 +1478,36 @@ def main():
         print("=" * 70)
     
     finally:
-        # Clean shutdown
+        # Clean shutdown: keys first, so nothing stays pressed whatever happens below
+        held_keys.stop_watchdog()
+        held_keys.enabled = False
+        whistle.stop()
+        released = held_keys.release_all('shutdown')
+        scheduler.stop()
+        if dashboard is not None:
+            dashboard.stop()
+        if config_watcher is not None:
+            config_watcher.stop()
+        if calibration_compiler is not None:
+            calibration_compiler.stop()
+        if state_export is not None:
+            state_export.close()
+        if key_audit is not None:
+            key_audit.stop()
+        events.stop()
         print("\nShutting down...")
+        print(f"  ✓ Held keys released ({released} were down)")
+        if calibrator is not None and save_calibration():
+            print(f"  ✓ Lever calibration saved to {CALIBRATION_FILE}")
+        if events.dropped.value:
+            print(f"  ⚠ {events.dropped.value} log events dropped (queue full)")
         
-        # Close serial connection
-        if ser is not None:
-            try:
-                ser.close()
-                print("  ✓ Serial connection closed")
-            except:
-                pass
+        # Close the input source (serial port, panel threads, UDP socket, ...)
+        try:
+            input_manager.close()
+            print("  ✓ Input source closed")
+        except Exception:
+            pass
         
         print("\n" + "=" * 70)
         print("✓ Program stopped safely - All keys released")
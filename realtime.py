@@ -0,0 +1,226 @@
+"""
+Real-time mode for the Railroader controller (opt-in: REALTIME_MODE = True)
+
+While the game runs it competes with the controller for CPU, and Python's
+garbage collector can stop the loop at any moment. Real-time mode:
+
+- raises the process and thread priority where the OS allows it
+  (Windows: HIGH_PRIORITY_CLASS; Linux: SCHED_FIFO or a lower nice value,
+  which needs root or CAP_SYS_NICE - otherwise it is reported and skipped)
+- pins the control loop and the reader threads to chosen CPU cores
+- freezes everything allocated at startup (gc.freeze), so collections
+  never walk it again
+- GC_MODE "scheduled": turns off automatic collection and collects from
+  the control loop's idle time instead, with a full (gen-2) collection at
+  most every FULL_GC_INTERVAL seconds and only when the tick has room for it
+
+Threads opt in by calling join_thread('control' | 'reader') when they
+start; it does nothing while real-time mode is off.
+"""
+
+import gc
+import os
+import threading
+import time
+
+import metrics
+
+GC_MODES = ('auto', 'freeze', 'scheduled')
+FULL_GC_INTERVAL = 30.0  # Seconds between full collections in "scheduled" mode
+FULL_GC_MIN_SLACK = 0.02  # Only run a full collection if at least this much of the tick is idle
+# "scheduled" mode collects generation 0 at this many new objects instead of 700:
+# ints up to 256 are cached, so reading the count every tick allocates nothing
+YOUNG_THRESHOLD = 256
+PROCESS_NICE = -5  # Linux: process nice value when SCHED_FIFO isn't allowed
+FIFO_PRIORITY = 10  # Linux: SCHED_FIFO priority for the control thread (1 … 99)
+
+# Windows API constants
+HIGH_PRIORITY_CLASS = 0x80
+THREAD_PRIORITY = {'control': 2, 'reader': 1}  # THREAD_PRIORITY_HIGHEST, THREAD_PRIORITY_ABOVE_NORMAL
+
+GC_PAUSE = metrics.stage('gc_pause')  # Every collection, automatic or scheduled
+
+_settings = None  # Set by enable()
+_last_full = 0.0
+_gc_start = None
+applied = {}  # Thread name → what join_thread() managed to apply
+
+
+def enable(priority=True, control_cores=None, reader_cores=None, gc_mode='scheduled'):
+    """
+    Switch real-time mode on (call from the thread that runs the control loop,
+    before the reader threads start)
+
+    Args:
+        priority: Raise process and thread priority
+        control_cores: CPU cores for the control loop and scheduler (None = any)
+        reader_cores: CPU cores for serial reader threads (None = any)
+        gc_mode: 'auto' (Python's default), 'freeze' or 'scheduled'
+
+    Returns:
+        Dict describing what was applied (for printing / reports)
+    """
+    global _settings, _last_full
+    if gc_mode not in GC_MODES:
+        raise ValueError(f"gc_mode must be one of {', '.join(GC_MODES)}")
+    _settings = {'priority': priority, 'cores': {'control': control_cores, 'reader': reader_cores},
+                 'gc_mode': gc_mode}
+    report = {'process_priority': _raise_process_priority() if priority else "unchanged", 'gc_mode': gc_mode}
+
+    if _gc_callback not in gc.callbacks:
+        gc.callbacks.append(_gc_callback)
+    if gc_mode in ('freeze', 'scheduled'):
+        gc.collect()
+        gc.freeze()  # Startup objects (modules, tables, config) are never scanned again
+        report['frozen_objects'] = gc.get_freeze_count()
+    if gc_mode == 'scheduled':
+        gc.disable()
+        _last_full = time.monotonic()
+
+    report['control_thread'] = join_thread('control')
+    return report
+
+
+def disable():
+    """Undo what can be undone (the GC, affinity, thread priority); used by the benchmark"""
+    global _settings
+    if _settings is None:
+        return
+    gc.enable()
+    gc.unfreeze()
+    if _gc_callback in gc.callbacks:
+        gc.callbacks.remove(_gc_callback)
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, range(os.cpu_count() or 1))
+        except OSError:
+            pass
+    if hasattr(os, 'sched_setscheduler'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+        except OSError:
+            pass
+    _settings = None
+
+
+def enabled():
+    return _settings is not None
+
+
+# ============================================================================
+# PRIORITY AND AFFINITY
+# ============================================================================
+
+def _raise_process_priority():
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), HIGH_PRIORITY_CLASS):
+            return "high priority class"
+        return "not permitted"
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, PROCESS_NICE)
+        return f"nice {PROCESS_NICE}"
+    except (OSError, AttributeError):
+        return "not permitted (needs root or CAP_SYS_NICE)"
+
+
+def _raise_thread_priority(role):
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        if kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY[role]):
+            return "raised"
+        return "not permitted"
+    if role == 'control' and hasattr(os, 'sched_setscheduler'):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(FIFO_PRIORITY))
+            return f"SCHED_FIFO {FIFO_PRIORITY}"
+        except OSError:
+            pass
+    try:
+        # On Linux the nice value is per thread (0 = the calling thread)
+        os.setpriority(os.PRIO_PROCESS, 0, PROCESS_NICE)
+        return f"nice {PROCESS_NICE}"
+    except (OSError, AttributeError):
+        return "not permitted"
+
+
+def _pin(cores):
+    if os.name == 'nt':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        mask = sum(1 << core for core in cores)
+        if kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), mask):
+            return sorted(cores)
+        return "failed"
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cores)  # 0 = the calling thread on Linux
+            return sorted(os.sched_getaffinity(0))
+        except OSError as e:
+            return f"failed ({e})"
+    return "not supported on this platform"
+
+
+def join_thread(role):
+    """
+    Apply real-time settings to the calling thread (no-op when the mode is off)
+
+    Args:
+        role: 'control' (control loop, key scheduler) or 'reader' (serial readers)
+
+    Returns:
+        Dict of what was applied, or None when real-time mode is off
+    """
+    if _settings is None:
+        return None
+    result = {'role': role}
+    if _settings['priority']:
+        result['priority'] = _raise_thread_priority(role)
+    cores = _settings['cores'].get(role)
+    if cores:
+        result['cores'] = _pin(cores)
+    applied[threading.current_thread().name] = result
+    return result
+
+
+# ============================================================================
+# GARBAGE COLLECTION
+# ============================================================================
+
+def _gc_callback(phase, info):
+    global _gc_start
+    if phase == 'start':
+        _gc_start = time.perf_counter()
+    elif _gc_start is not None:
+        GC_PAUSE.observe(time.perf_counter() - _gc_start)
+        _gc_start = None
+
+
+def collect_idle(slack):
+    """
+    Called by the control loop when a tick's work is done ("scheduled" mode)
+    Collects the young generations when they are due (YOUNG_THRESHOLD), and the old one when
+    FULL_GC_INTERVAL has passed and the tick has at least FULL_GC_MIN_SLACK
+    seconds to spare.
+
+    Args:
+        slack: Seconds until the next tick
+    
+    Returns:
+        Seconds spent collecting (the loop takes them off its sleep)
+    """
+    global _last_full
+    if _settings is None or _settings['gc_mode'] != 'scheduled':
+        return 0.0
+    start = time.monotonic()
+    if slack >= FULL_GC_MIN_SLACK and start - _last_full >= FULL_GC_INTERVAL:
+        _last_full = start
+        gc.collect(2)
+    else:
+        count0, count1, _ = gc.get_count()
+        if count0 < YOUNG_THRESHOLD:
+            return 0.0
+        gc.collect(1 if count1 >= gc.get_threshold()[1] else 0)
+    return time.monotonic() - start
@@ -0,0 +1,156 @@
+"""
+Timer scheduler for the Railroader controller
+Runs callbacks at a given time on one background thread, so handlers can
+schedule "release this key in 150 ms" or "pulse every 100 ms" instead of
+blocking the control loop with time.sleep().
+
+    scheduler = TimerScheduler()
+    timer = scheduler.call_later(0.15, keyboard.release, 'h')
+    timer.cancel()
+    scheduler.call_every(0.1, watchdog)
+
+Timers run in deadline order. A callback that raises is counted
+(scheduler_errors) and does not stop the thread. The thread starts on the
+first scheduled timer. Tests can drive it without a thread
+(threaded=False) via run_pending(now), or let a clock.VirtualClock do that
+(VirtualClock.attach).
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+import metrics
+import realtime
+
+
+_order = itertools.count()  # Ties on `when` run in the order the timers were scheduled
+
+
+class Timer:
+    """Handle for a scheduled callback"""
+    __slots__ = ('when', 'callback', 'args', 'interval', 'cancelled', 'order')
+
+    def __init__(self, when, callback, args, interval=None):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+        self.order = next(_order)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __lt__(self, other):
+        if self.when == other.when:
+            return self.order < other.order
+        return self.when < other.when
+
+
+class TimerScheduler:
+    """Deadline-ordered timers served by one daemon thread"""
+    def __init__(self, clock=time.monotonic, name="scheduler", threaded=True):
+        """
+        Args:
+            clock: Time source in seconds (must match the thread's waits, so
+                   only pass a virtual clock together with threaded=False)
+            name: Thread name
+            threaded: Start a thread on the first timer (False = run_pending() is called by someone else)
+        """
+        self.clock = clock
+        self.name = name
+        self.threaded = threaded
+        self._timers = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.errors = metrics.counter('scheduler_errors', "Scheduled callbacks that raised")
+        self.late = metrics.stage('scheduler_late')  # How far behind its deadline each timer ran
+
+    # ------------------------------------------------------------- scheduling
+
+    def call_at(self, when, callback, *args):
+        """Run callback(*args) at clock time `when`"""
+        return self._add(Timer(when, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Run callback(*args) after `delay` seconds"""
+        return self._add(Timer(self.clock() + delay, callback, args))
+
+    def call_every(self, interval, callback, *args):
+        """Run callback(*args) every `interval` seconds until cancelled"""
+        return self._add(Timer(self.clock() + interval, callback, args, interval))
+
+    def _add(self, timer):
+        with self._condition:
+            heapq.heappush(self._timers, timer)
+            self._condition.notify()
+        if self._thread is None and self.threaded:
+            self.start()
+        return timer
+
+    # ---------------------------------------------------------------- running
+
+    def run_pending(self, now=None):
+        """
+        Run every timer that is due (used by the thread, or directly in tests)
+
+        Returns:
+            Seconds until the next timer, or None if there is none
+        """
+        if now is None:
+            now = self.clock()
+        while True:
+            with self._condition:
+                if not self._timers:
+                    return None
+                timer = self._timers[0]
+                if timer.when > now:
+                    return timer.when - now
+                heapq.heappop(self._timers)
+                if timer.cancelled:
+                    continue
+                late = now - timer.when
+                if timer.interval is not None:
+                    timer.when += timer.interval
+                    if timer.when <= now:
+                        timer.when = now + timer.interval  # Fell behind: skip, don't burst
+                    heapq.heappush(self._timers, timer)
+            self.late.observe(late)
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                self.errors.inc()
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread; pending timers are kept and run if it is started again"""
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._running = False
+            self._condition.notify()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+
+    def _run(self):
+        realtime.join_thread('control')  # Key releases are as time-critical as the loop
+        while True:
+            self.run_pending()
+            with self._condition:
+                if not self._running:
+                    return
+                wait = None
+                if self._timers:
+                    wait = self._timers[0].when - self.clock()
+                    if wait <= 0:
+                        continue
+                self._condition.wait(wait)
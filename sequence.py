@@ -0,0 +1,333 @@
+"""
+Declarative driving sequences for Railroader
+
+A sequence file lists timed steps. A step sets target positions for one or
+more controls and/or taps a key. Loading compiles the file into one flat,
+absolute-time schedule of key presses and releases. The executor then plays
+that schedule against a clock.
+
+- Controls moved in the same step move in parallel (their notches interleave)
+- Notches on one control are NOTCH_INTERVAL apart; `over` spreads them out
+- A control that is still moving from an earlier step finishes that move first
+- With a VirtualClock a ten-minute sequence runs in milliseconds
+
+File format (TOML shown; .json and .yaml/.yml work the same way):
+
+    name = "Departure"
+    notch_interval = 0.25      # optional, seconds between notches on one control
+    notch_hold = 0.15          # optional, seconds each notch key is held
+
+    [start]                    # assumed positions when the sequence starts
+    TRAINBRAKE = 20
+
+    [[step]]
+    at = 0                     # seconds from the start ...
+    label = "Release brakes"
+    TRAINBRAKE = 0
+    INDBRAKE = 0
+
+    [[step]]
+    after = 2                  # ... or seconds after the previous step finished
+    THROTTLE = 10
+    over = 3                   # spread the notches over 3 seconds
+
+    [[step]]
+    after = 1
+    key = "h"                  # tap a key (optionally with modifier = "shift")
+    hold = 1.0
+
+Usage:
+    python sequence.py driving_sequence.toml            # validate + print the plan
+"""
+
+import json
+import os
+import sys
+from collections import namedtuple
+
+from clock import RealClock, VirtualClock
+
+MAX_STEPS = 20
+NOTCH_INTERVAL = 0.25  # Seconds between notches on the same control
+NOTCH_HOLD = 0.15  # Seconds a notch key is held so the game registers it
+TAP_HOLD = 0.15  # Default hold for `key` steps
+
+# Stepped controls: increase key, decrease key, lowest step (as multiple of -MAX_STEPS)
+STEPPED_CONTROLS = {
+    'THROTTLE': ('-', '=', 0),
+    'TRAINBRAKE': ("'", ';', 0),
+    'INDBRAKE': ('.', ',', 0),
+    'REVERSER': ('[', ']', -1),
+}
+MODIFIERS = ('shift', 'ctrl', 'alt')
+STEP_FIELDS = {'at', 'after', 'label', 'over', 'key', 'modifier', 'hold'}
+
+# One entry of a compiled schedule; action is 'press', 'release' or 'label'
+ScheduledEvent = namedtuple('ScheduledEvent', 'time action key label')
+
+
+class Schedule:
+    """Compiled sequence: events sorted by time plus the positions it should end in"""
+    def __init__(self, name, events, start, final):
+        self.name = name
+        self.events = events
+        self.start = start
+        self.final = final
+
+    @property
+    def duration(self):
+        return self.events[-1].time if self.events else 0.0
+
+
+# ============================================================================
+# LOADING & COMPILING
+# ============================================================================
+
+def load_file(path):
+    """Read a sequence file (.toml, .json, .yaml/.yml) into a dict"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if extension in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML sequences need PyYAML: pip install pyyaml")
+        with open(path, encoding='utf-8') as f:
+            return yaml.safe_load(f)
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_sequence(path, max_steps=MAX_STEPS):
+    """Load and compile a sequence file into a Schedule"""
+    return compile_sequence(load_file(path), max_steps, default_name=os.path.basename(path))
+
+
+def compile_sequence(spec, max_steps=MAX_STEPS, default_name="sequence"):
+    """
+    Compile a sequence dict into an absolute-time Schedule
+
+    Raises:
+        ValueError: Describing the first invalid step
+    """
+    notch_interval = float(spec.get('notch_interval', NOTCH_INTERVAL))
+    notch_hold = float(spec.get('notch_hold', NOTCH_HOLD))
+    if not 0 < notch_hold < notch_interval:
+        raise ValueError("notch_hold must be positive and shorter than notch_interval")
+
+    position = {control: 0 for control in STEPPED_CONTROLS}
+    for control, value in spec.get('start', {}).items():
+        _check_position(control, value, max_steps, "start")
+        position[control] = value
+    start = dict(position)
+
+    events = []  # (time, order, action, key, label)
+    free_at = {control: 0.0 for control in STEPPED_CONTROLS}  # When each control's last move ends
+    previous_end = 0.0
+
+    for index, step in enumerate(spec.get('step', spec.get('steps', []))):
+        where = f"step {index + 1}"
+        unknown = set(step) - STEP_FIELDS - set(STEPPED_CONTROLS)
+        if unknown:
+            raise ValueError(f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+        if ('at' in step) == ('after' in step):
+            raise ValueError(f"{where}: give exactly one of 'at' or 'after'")
+        t = float(step['at']) if 'at' in step else previous_end + float(step['after'])
+        if t < 0:
+            raise ValueError(f"{where}: negative time")
+
+        end = t
+        if 'label' in step:
+            events.append((t, len(events), 'label', None, str(step['label'])))
+
+        for control in STEPPED_CONTROLS:
+            if control not in step:
+                continue
+            target = step[control]
+            _check_position(control, target, max_steps, where)
+            up_key, down_key, _ = STEPPED_CONTROLS[control]
+            notches = abs(target - position[control])
+            key = up_key if target > position[control] else down_key
+            spacing = notch_interval
+            if 'over' in step and notches > 1:
+                spacing = max(notch_interval, float(step['over']) / (notches - 1))
+            first = max(t, free_at[control])
+            for n in range(notches):
+                press_at = first + n * spacing
+                events.append((press_at, len(events), 'press', key, control))
+                events.append((press_at + notch_hold, len(events), 'release', key, control))
+            if notches:
+                free_at[control] = first + (notches - 1) * spacing + notch_interval
+                end = max(end, free_at[control])
+            position[control] = target
+
+        if 'key' in step:
+            modifier = step.get('modifier')
+            if modifier is not None and modifier not in MODIFIERS:
+                raise ValueError(f"{where}: modifier must be one of {MODIFIERS}")
+            hold = float(step.get('hold', TAP_HOLD))
+            key = str(step['key'])
+            if modifier:
+                events.append((t, len(events), 'press', modifier, key))
+            events.append((t, len(events), 'press', key, key))
+            events.append((t + hold, len(events), 'release', key, key))
+            if modifier:
+                events.append((t + hold, len(events), 'release', modifier, key))
+            end = max(end, t + hold)
+
+        previous_end = end
+
+    events.sort(key=lambda e: (e[0], e[1]))
+    schedule = [ScheduledEvent(t, action, key, label) for t, _, action, key, label in events]
+    return Schedule(spec.get('name', default_name), schedule, start, position)
+
+
+def _check_position(control, value, max_steps, where):
+    if control not in STEPPED_CONTROLS:
+        raise ValueError(f"{where}: unknown control {control!r}")
+    lowest = STEPPED_CONTROLS[control][2] * max_steps
+    if not isinstance(value, int) or not lowest <= value <= max_steps:
+        raise ValueError(f"{where}: {control} must be a whole step from {lowest} to {max_steps}, got {value!r}")
+
+
+# ============================================================================
+# EXECUTION
+# ============================================================================
+
+def run_schedule(schedule, keyboard, clock=None, focus_check=None, on_label=None, modifier_keys=None):
+    """
+    Play a schedule against a keyboard backend
+
+    Args:
+        schedule: Compiled Schedule
+        keyboard: Object with press(key) and release(key)
+        clock: RealClock (default) or VirtualClock for fast-forward
+        focus_check: Callable returning False to skip presses (releases always go out)
+        on_label: Callable(label) for step labels (e.g. print)
+        modifier_keys: Dict modifier name → key object (e.g. {'shift': Key.shift})
+
+    Returns:
+        Dict with events sent, presses skipped, and lateness (seconds behind schedule)
+    """
+    clock = clock or RealClock()
+    modifier_keys = modifier_keys or {}
+    held = set()
+    sent = skipped = 0
+    late_total = late_max = 0.0
+
+    start = clock.now()
+    for event in schedule.events:
+        clock.sleep_until(start + event.time)
+        late = clock.now() - start - event.time
+        late_total += late
+        late_max = max(late_max, late)
+
+        if event.action == 'label':
+            if on_label is not None:
+                on_label(event.label)
+            continue
+        key = modifier_keys.get(event.key, event.key)
+        if event.action == 'press':
+            if focus_check is not None and not focus_check():
+                skipped += 1
+                continue
+            keyboard.press(key)
+            held.add(event.key)
+        elif event.key in held:
+            keyboard.release(key)
+            held.discard(event.key)
+        else:
+            continue
+        sent += 1
+
+    return {
+        'events': sent,
+        'skipped': skipped,
+        'duration': clock.now() - start,
+        'late_mean': late_total / len(schedule.events) if schedule.events else 0.0,
+        'late_max': late_max,
+    }
+
+
+def final_positions(schedule, key_events):
+    """
+    Replay recorded key events (e.g. RecordingKeyboard.events) into control positions
+
+    Args:
+        schedule: The Schedule that was played (for the start positions)
+        key_events: Iterable of (time, action, key, ...) tuples
+
+    Returns:
+        Dict control → step
+    """
+    position = dict(schedule.start)
+    by_key = {}
+    for control, (up_key, down_key, _) in STEPPED_CONTROLS.items():
+        by_key[up_key] = (control, 1)
+        by_key[down_key] = (control, -1)
+    for event in key_events:
+        action, key = event[1], event[2]
+        if action == 'press' and key in by_key:
+            control, direction = by_key[key]
+            position[control] += direction
+    return position
+
+
+def validate(schedule):
+    """
+    Fast-forward a schedule on a virtual clock and check it ends where it should
+
+    Returns:
+        List of problems (empty if the sequence is valid)
+    """
+    from key_backends import RecordingKeyboard
+    clock = VirtualClock()
+    keyboard = RecordingKeyboard(clock=clock.now)
+    run_schedule(schedule, keyboard, clock)
+
+    problems = []
+    held = set()
+    for t, action, key, tag in keyboard.events:
+        if action == 'press':
+            if key in held:
+                problems.append(f"{t:.2f}s: '{key}' pressed while already held")
+            held.add(key)
+        else:
+            held.discard(key)
+    if held:
+        problems.append(f"keys still held at the end: {', '.join(sorted(held))}")
+    reached = final_positions(schedule, keyboard.events)
+    for control, expected in schedule.final.items():
+        if reached[control] != expected:
+            problems.append(f"{control} ends at {reached[control]}, expected {expected}")
+    return problems
+
+
+def describe(schedule):
+    """Human-readable plan: labels and notch counts with their times"""
+    lines = [f"{schedule.name}: {len(schedule.events)} events over {schedule.duration:.1f}s"]
+    for event in schedule.events:
+        if event.action == 'label':
+            lines.append(f"  {event.time:7.2f}s  {event.label}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python sequence.py <sequence file>")
+        sys.exit(2)
+    try:
+        compiled = load_sequence(sys.argv[1])
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    print(describe(compiled))
+    issues = validate(compiled)
+    for issue in issues:
+        print(f"✗ {issue}")
+    if issues:
+        sys.exit(1)
+    print(f"✓ Sequence valid, ends at {compiled.final}")
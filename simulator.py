@@ -0,0 +1,320 @@
+"""
+Scenario Simulator for the Railroader Controller
+Generates realistic control panel frames instead of uniform random values:
+
+- Levers move along smooth trajectories (eased ramps) and then stay put
+- ADC noise: gaussian jitter of a few LSB plus rare spikes
+- Buttons are held for a realistic time, switches bounce when flipped
+- Seedable: the same seed and rate always produce the same frame sequence
+- Any output rate, 1 kHz and beyond, for load testing
+
+Scenarios:
+    departure    release brakes, reverser forward, bell, whistle, throttle up in stages
+    braking      throttle off, train brake in stages, independent brake
+    random_walk  a driver nudging random levers to random positions
+    mixed        departure → random_walk cruise → braking, repeated
+    uniform      the old behaviour: every channel random on every frame (key spam stress test)
+
+Usage:
+    python simulator.py --scenario mixed --seed 1 --rate 1000 --duration 60 --out session.frames
+    python simulator.py --scenario departure --rate 100 --udp 127.0.0.1:5005
+"""
+
+import argparse
+import heapq
+import random
+import time
+
+ANALOG_CHANNELS = ['WHISTLE', 'HEADLIGHT', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE']
+DIGITAL_CHANNELS = ['BELL', 'CYLINDER']
+CHANNEL_ORDER = ['WHISTLE', 'BELL', 'HEADLIGHT', 'CYLINDER', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE']
+
+SCENARIOS = ('departure', 'braking', 'random_walk', 'mixed', 'uniform')
+
+# Resting positions (ADC counts)
+REST = {'WHISTLE': 512, 'HEADLIGHT': 512, 'REVERSER': 512, 'THROTTLE': 0, 'TRAINBRAKE': 1023, 'INDBRAKE': 1023}
+
+NOISE_LSB = 1.5  # Gaussian ADC noise (standard deviation, counts)
+SPIKE_PROBABILITY = 0.0005  # Chance per sample of a noise spike
+SPIKE_LSB = 25  # Size of a spike
+BOUNCE_TIME = 0.008  # Seconds a switch contact bounces after flipping
+
+
+def smoothstep(x):
+    """Ease-in/ease-out curve for 0 ≤ x ≤ 1 (a hand moving a lever)"""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    return x * x * (3.0 - 2.0 * x)
+
+
+# ============================================================================
+# CONTROLS
+# ============================================================================
+
+class Lever:
+    """Analog control moving along an eased ramp between resting positions"""
+    def __init__(self, position):
+        self.start = position
+        self.target = position
+        self.t0 = 0.0
+        self.duration = 1e-6
+
+    def move(self, now, target, duration):
+        """Start moving from wherever the lever is now to `target` over `duration` seconds"""
+        self.start = self.position(now)
+        self.target = max(0, min(1023, target))
+        self.t0 = now
+        self.duration = max(duration, 1e-6)
+
+    def position(self, now):
+        return self.start + (self.target - self.start) * smoothstep((now - self.t0) / self.duration)
+
+
+class Switch:
+    """Digital input with contact bounce after each change"""
+    def __init__(self, value=0):
+        self.value = value
+        self.bounce_until = 0.0
+
+    def set(self, now, value, bounce_time):
+        if value != self.value:
+            self.value = value
+            self.bounce_until = now + bounce_time
+
+    def read(self, now, rng):
+        if now < self.bounce_until:
+            return rng.randint(0, 1)
+        return self.value
+
+
+# ============================================================================
+# SIMULATOR
+# ============================================================================
+
+class ScenarioSimulator:
+    """Deterministic frame generator driven by simulated time"""
+    def __init__(self, scenario='mixed', seed=None, rate=1000, noise=NOISE_LSB, bounce_time=BOUNCE_TIME,
+                 clock=time.monotonic):
+        """
+        Args:
+            scenario: One of SCENARIOS
+            seed: RNG seed (None = random)
+            rate: Frames per simulated second
+            noise: ADC noise standard deviation in counts
+            bounce_time: Switch bounce duration in seconds (0 = no bounce)
+            clock: Time source frame_now() follows
+        """
+        if scenario not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {scenario!r}, choose from {SCENARIOS}")
+        self.scenario = scenario
+        self.rng = random.Random(seed)
+        self.rate = rate
+        self.dt = 1.0 / rate
+        self.noise = noise
+        self.bounce_time = bounce_time
+
+        self.now = 0.0
+        self.frame_index = 0
+        self.levers = {channel: Lever(REST[channel]) for channel in ANALOG_CHANNELS}
+        self.switches = {channel: Switch() for channel in DIGITAL_CHANNELS}
+        self._events = []  # Heap of (time, order, callable)
+        self._order = 0
+        self.clock = clock
+        self._wall_start = None
+
+        if scenario != 'uniform':
+            self._schedule(0.0, getattr(self, f"_script_{scenario}"))
+
+    # ---------------------------------------------------------------- events
+
+    def _schedule(self, at, action):
+        heapq.heappush(self._events, (at, self._order, action))
+        self._order += 1
+
+    def move(self, at, channel, target, duration):
+        """Schedule a lever move"""
+        self._schedule(at, lambda: self.levers[channel].move(self.now, target, duration))
+
+    def press(self, at, channel, duration):
+        """Schedule a button press held for `duration` seconds"""
+        self._schedule(at, lambda: self.switches[channel].set(self.now, 1, self.bounce_time))
+        self._schedule(at + duration, lambda: self.switches[channel].set(self.now, 0, self.bounce_time))
+
+    def flip(self, at, channel):
+        """Schedule a toggle switch flip"""
+        self._schedule(at, lambda: self.switches[channel].set(
+            self.now, 1 - self.switches[channel].value, self.bounce_time))
+
+    def pull_whistle(self, at, deflection, duration):
+        """Schedule a whistle pull (deflection > 0 = high, < 0 = low) and release"""
+        self.move(at, 'WHISTLE', 512 + deflection, 0.15)
+        self.move(at + duration, 'WHISTLE', 512, 0.2)
+
+    # --------------------------------------------------------------- scripts
+
+    def _script_departure(self, then=None):
+        """Release brakes, reverser forward, bell + whistle, throttle up in stages"""
+        t, r = self.now, self.rng
+        self.move(t, 'INDBRAKE', 0, r.uniform(1.0, 2.0))
+        self.move(t + 0.5, 'TRAINBRAKE', 0, r.uniform(2.0, 3.5))
+        self.move(t + 2.0, 'REVERSER', 1023, r.uniform(1.0, 2.0))
+        self.flip(t + 3.0, 'CYLINDER')
+        self.press(t + 4.0, 'BELL', r.uniform(0.15, 0.6))
+        self.pull_whistle(t + 5.0, r.choice([-1, 1]) * r.randint(250, 450), r.uniform(0.8, 2.0))
+        self.move(t + 7.0, 'THROTTLE', r.randint(300, 450), r.uniform(2.0, 4.0))
+        self.move(t + 12.0, 'REVERSER', r.randint(750, 850), r.uniform(1.0, 2.0))
+        self.flip(t + 13.0, 'CYLINDER')
+        self.move(t + 15.0, 'THROTTLE', r.randint(800, 1023), r.uniform(3.0, 6.0))
+        self._schedule(t + 25.0, then or self._script_departure)
+
+    def _script_braking(self, then=None):
+        """Throttle off, train brake in stages, independent brake"""
+        t, r = self.now, self.rng
+        self.move(t, 'THROTTLE', 0, r.uniform(1.5, 3.0))
+        self.move(t + 3.0, 'TRAINBRAKE', r.randint(300, 500), r.uniform(1.0, 2.0))
+        self.move(t + 8.0, 'TRAINBRAKE', r.randint(650, 850), r.uniform(1.0, 2.0))
+        self.pull_whistle(t + 9.0, r.randint(250, 450), r.uniform(0.5, 1.0))
+        self.move(t + 14.0, 'INDBRAKE', 1023, r.uniform(1.0, 2.0))
+        self.move(t + 16.0, 'REVERSER', 512, r.uniform(1.0, 2.0))
+        self._schedule(t + 20.0, then or self._script_braking)
+
+    def _script_random_walk(self, until=None, then=None):
+        """Nudge one random lever, press a button now and then, repeat"""
+        t, r = self.now, self.rng
+        if until is not None and t >= until:
+            self._schedule(t, then)
+            return
+        roll = r.random()
+        if roll < 0.08:
+            self.press(t, 'BELL', r.uniform(0.15, 0.6))
+        elif roll < 0.15:
+            self.pull_whistle(t, r.choice([-1, 1]) * r.randint(150, 480), r.uniform(0.3, 2.5))
+        elif roll < 0.18:
+            self.flip(t, 'CYLINDER')
+        else:
+            channel = r.choice(['THROTTLE', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE', 'REVERSER', 'HEADLIGHT'])
+            current = self.levers[channel].position(t)
+            target = current + r.gauss(0, 150)
+            self.move(t, channel, target, r.uniform(0.3, 2.0))
+        self._schedule(t + r.uniform(1.0, 6.0), lambda: self._script_random_walk(until, then))
+
+    def _script_mixed(self):
+        """Departure → cruise → braking → repeat"""
+        start = self.now
+        cruise_until = start + 25.0 + self.rng.uniform(20.0, 60.0)
+        self._script_departure(then=lambda: self._script_random_walk(
+            until=cruise_until, then=lambda: self._script_braking(then=self._script_mixed)))
+
+    # ---------------------------------------------------------------- frames
+
+    def next_frame(self):
+        """Advance one sample period and return the frame"""
+        self.now = self.frame_index * self.dt
+        self.frame_index += 1
+        events = self._events
+        while events and events[0][0] <= self.now:
+            heapq.heappop(events)[2]()
+
+        rng = self.rng
+        if self.scenario == 'uniform':
+            return {
+                'WHISTLE': rng.randint(450, 550),
+                'BELL': rng.choice([0, 0, 0, 1]),
+                'HEADLIGHT': rng.randint(0, 1023),
+                'CYLINDER': rng.choice([0, 1]),
+                'REVERSER': rng.randint(0, 1023),
+                'THROTTLE': rng.randint(0, 1023),
+                'TRAINBRAKE': rng.randint(0, 1023),
+                'INDBRAKE': rng.randint(0, 1023),
+            }
+
+        now = self.now
+        frame = {}
+        for channel in CHANNEL_ORDER:
+            switch = self.switches.get(channel)
+            if switch is not None:
+                frame[channel] = switch.read(now, rng)
+                continue
+            value = self.levers[channel].position(now) + rng.gauss(0.0, self.noise)
+            if rng.random() < SPIKE_PROBABILITY:
+                value += rng.choice((-SPIKE_LSB, SPIKE_LSB))
+            frame[channel] = max(0, min(1023, int(round(value))))
+        return frame
+
+    def frames(self, count):
+        """Generate `count` consecutive frames as (time, frame)"""
+        for _ in range(count):
+            frame = self.next_frame()
+            yield self.now, frame
+
+    def frame_now(self):
+        """
+        Advance simulated time to match the clock's time since the first call
+        and return the newest frame (for polling at a lower rate than `rate`)
+        """
+        if self._wall_start is None:
+            self._wall_start = self.clock()
+            return self.next_frame()
+        due = int((self.clock() - self._wall_start) * self.rate)
+        frame = None
+        while self.frame_index <= due:
+            frame = self.next_frame()
+        return frame
+
+
+def format_frame(frame):
+    """Serial wire format"""
+    return ";".join(f"{channel}:{value}" for channel, value in frame.items())
+
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Railroader scenario simulator")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rate", type=float, default=100, help="Frames per second")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of simulated time")
+    parser.add_argument("--out", help="Write a frame log (replayable with INPUT_SOURCE = 'replay')")
+    parser.add_argument("--udp", metavar="HOST:PORT", help="Send frames over UDP in real time")
+    args = parser.parse_args()
+
+    sim = ScenarioSimulator(args.scenario, args.seed, args.rate)
+    count = int(args.duration * args.rate)
+
+    if args.out:
+        start = time.perf_counter()
+        with open(args.out, 'w', encoding='utf-8') as f:
+            for t, frame in sim.frames(count):
+                f.write(f"{t:.4f} {format_frame(frame)}\n")
+        elapsed = time.perf_counter() - start
+        print(f"✓ Wrote {count} frames to {args.out} ({count / elapsed:,.0f} frames/s generated)")
+        return
+
+    if args.udp:
+        import socket
+        from udp_input import encode_binary
+        host, port = args.udp.rsplit(':', 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        print(f"Sending '{args.scenario}' to {host}:{port} at {args.rate:g} Hz (Ctrl+C to stop)")
+        wall_start = time.perf_counter()
+        try:
+            for i, (t, frame) in enumerate(sim.frames(count)):
+                sock.sendto(encode_binary(i, frame, int(t * 1000)), (host, int(port)))
+                delay = wall_start + t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    for t, frame in sim.frames(count):
+        print(f"{t:.4f} {format_frame(frame)}")
+
+
+if __name__ == "__main__":
+    main()
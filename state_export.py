@@ -0,0 +1,262 @@
+"""
+Live state export for overlays and loggers
+With STATE_EXPORT_FILE set, the controller keeps a small fixed-layout
+snapshot of its state in a memory-mapped file: per channel the raw value,
+the target step and the step we assume the game is in, plus focus and
+connection state. Any process (any language) can map the same file and
+read it - there is no socket, no request and nothing for the control loop
+to wait on.
+
+The control loop rewrites the snapshot only when it changed. A tick that
+changes nothing compares a few dozen bytes and allocates nothing
+(test_allocations.py runs with the export on).
+
+Layout (little-endian, version 1):
+
+    Header   magic "RRST", version (u16), channel count (u16)
+             seq (u64)      odd while the snapshot is being rewritten
+             time (f64)     time.time() of the last change
+             names          channel count × 12 bytes, ASCII, NUL-padded
+    Status   running, focused, connected (u8 each), 1 pad byte
+    Channel  flags (u8: 1 = raw, 2 = target, 4 = assumed present), 3 pad bytes,
+             raw, target, assumed (i32 each; whistle -1 = low, 0 = off, 1 = high)
+
+Readers use the seqlock: read seq, copy status and channels, read seq again,
+and retry if it was odd or changed. seq only grows, across restarts too.
+
+    python state_export.py railroader_state.bin     # prints every change
+"""
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+MAGIC = b"RRST"
+VERSION = 1
+CHANNELS = ('WHISTLE', 'BELL', 'HEADLIGHT', 'CYLINDER', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE')
+# ControlState attribute with the position we assume the game is in (None = not tracked)
+ASSUMED_FIELDS = ('whistle_type', None, 'headlight_zone', 'cylinder_state',
+                  'reverser_step', 'throttle_step', 'train_brake_step', 'ind_brake_step')
+WHISTLE_CODES = {'low': -1, 'off': 0, 'high': 1, None: 0}
+HAS_RAW, HAS_TARGET, HAS_ASSUMED = 1, 2, 4
+
+HEADER = struct.Struct("<4sHH Q d")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+TIME = struct.Struct("<d")
+TIME_OFFSET = 16
+NAME = struct.Struct("12s")
+STATUS = struct.Struct("<BBBx")  # running, focused, connected
+CHANNEL = struct.Struct("<B3x i i i")  # flags, raw, target, assumed
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1  # Range of the channel fields; larger values are clamped
+BODY_OFFSET = HEADER.size + len(CHANNELS) * NAME.size
+BODY_SIZE = STATUS.size + len(CHANNELS) * CHANNEL.size
+SIZE = BODY_OFFSET + BODY_SIZE
+READ_RETRIES = 100  # Seqlock retries before a reader gives up on this read
+
+
+class StateExport:
+    """Writer side (the control loop is the only writer)"""
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        self._seq = 0
+        self._body = bytearray(BODY_SIZE)  # Snapshot being built …
+        self._published = bytearray(BODY_SIZE)  # … and the one readers have
+
+    def open(self):
+        """
+        Create (or reuse) the file and map it
+
+        Returns:
+            True on success
+        """
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+            try:
+                os.ftruncate(fd, SIZE)
+                self.map = mmap.mmap(fd, SIZE)
+            finally:
+                os.close(fd)  # The mapping keeps the file open
+        except OSError as e:
+            print(f"✗ Could not create state export {self.path}: {e}")
+            return False
+        magic, version, _, seq, _ = HEADER.unpack_from(self.map, 0)
+        # Carry on from a previous run's seq so readers never see it go back
+        self._seq = (seq + (seq & 1) if magic == MAGIC and version == VERSION else 0) + 1
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, len(CHANNELS), self._seq, time.time())
+        for i, channel in enumerate(CHANNELS):
+            NAME.pack_into(self.map, HEADER.size + i * NAME.size, channel.encode('ascii'))
+        self.map[BODY_OFFSET:SIZE] = self._published  # Not running until the loop's first publish()
+        self._seq += 1
+        SEQ.pack_into(self.map, SEQ_OFFSET, self._seq)
+        print(f"✓ Exporting live state to {self.path}")
+        return True
+
+    def publish(self, state, connected):
+        """
+        Update the snapshot from a ControlState (called by the control loop every tick)
+
+        Args:
+            state: ControlState
+            connected: Whether the input source is delivering
+
+        Returns:
+            True if the snapshot changed
+        """
+        body = self._body
+        STATUS.pack_into(body, 0, True, state.focused, connected)
+        raw_values = state.raw
+        targets = state.targets
+        # Index loop: a for loop would allocate an iterator every tick
+        i = 0
+        while i < len(CHANNELS):
+            channel = CHANNELS[i]
+            flags = 0
+            raw = raw_values.get(channel)
+            if raw is None:
+                raw = 0
+            else:
+                flags |= HAS_RAW
+            target = targets.get(channel)
+            if target is None:
+                target = 0
+            else:
+                flags |= HAS_TARGET
+                target = WHISTLE_CODES.get(target, target)
+            field = ASSUMED_FIELDS[i]
+            if field is None:
+                assumed = 0
+            else:
+                flags |= HAS_ASSUMED
+                assumed = getattr(state, field)
+                assumed = WHISTLE_CODES.get(assumed, assumed)
+            CHANNEL.pack_into(body, STATUS.size + i * CHANNEL.size, flags,
+                              _int32(raw), _int32(target), _int32(assumed))
+            i += 1
+        if body == self._published:
+            return False
+        self._write(body)
+        return True
+
+    def _write(self, body):
+        self._seq += 1  # Odd: readers retry
+        SEQ.pack_into(self.map, SEQ_OFFSET, self._seq)
+        self.map[BODY_OFFSET:SIZE] = body
+        TIME.pack_into(self.map, TIME_OFFSET, time.time())
+        self._seq += 1
+        SEQ.pack_into(self.map, SEQ_OFFSET, self._seq)
+        self._published[:] = body
+
+    def close(self):
+        """Mark the snapshot as no longer running and unmap it (the file stays for readers)"""
+        if self.map is None:
+            return
+        body = bytearray(self._published)
+        STATUS.pack_into(body, 0, False, False, False)
+        self._write(body)
+        self.map.close()
+        self.map = None
+
+
+def _int32(value):
+    """Clamp to the i32 fields, so an absurd value can't make pack_into raise in the control loop"""
+    if value < INT32_MIN:
+        return INT32_MIN
+    if value > INT32_MAX:
+        return INT32_MAX
+    return value
+
+
+class StateReader:
+    """Reader side, for overlays and loggers written in Python"""
+    def __init__(self, path):
+        """
+        Raises:
+            OSError: The file doesn't exist (the controller isn't exporting)
+            ValueError: The file isn't a version 1 state export
+        """
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), SIZE, access=mmap.ACCESS_READ)
+        magic, version, count, _, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or count != len(CHANNELS):
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} state export")
+
+    def seq(self):
+        """Changes whenever the snapshot does (cheap check before read())"""
+        return SEQ.unpack_from(self.map, SEQ_OFFSET)[0]
+
+    def read(self):
+        """
+        Consistent snapshot
+
+        Returns:
+            Dict with seq, time, running, focused, connected and per channel
+            {'raw', 'target', 'assumed'} (None where absent), or None if the
+            writer kept rewriting it
+        """
+        for _ in range(READ_RETRIES):
+            seq = self.seq()
+            if seq & 1:
+                time.sleep(0)
+                continue
+            changed_at = TIME.unpack_from(self.map, TIME_OFFSET)[0]
+            body = self.map[BODY_OFFSET:SIZE]
+            if self.seq() == seq:
+                return _decode(seq, changed_at, body)
+        return None
+
+    def close(self):
+        self.map.close()
+
+
+def _decode(seq, changed_at, body):
+    running, focused, connected = STATUS.unpack_from(body, 0)
+    channels = {}
+    for i, channel in enumerate(CHANNELS):
+        flags, raw, target, assumed = CHANNEL.unpack_from(body, STATUS.size + i * CHANNEL.size)
+        channels[channel] = {
+            'raw': raw if flags & HAS_RAW else None,
+            'target': target if flags & HAS_TARGET else None,
+            'assumed': assumed if flags & HAS_ASSUMED else None,
+        }
+    return {'seq': seq, 'time': changed_at, 'running': bool(running), 'focused': bool(focused),
+            'connected': bool(connected), 'channels': channels}
+
+
+def main():
+    """Print the exported state on every change (example reader)"""
+    path = sys.argv[1] if len(sys.argv) > 1 else "railroader_state.bin"
+    try:
+        reader = StateReader(path)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}")
+        return 1
+    last = None
+    try:
+        while True:
+            if reader.seq() != last:
+                snapshot = reader.read()
+                if snapshot is not None:
+                    last = snapshot['seq']
+                    status = "focused" if snapshot['focused'] else "paused"
+                    if not snapshot['running']:
+                        status = "stopped"
+                    elif not snapshot['connected']:
+                        status += ", disconnected"
+                    values = " ".join(f"{channel}={values['raw']}→{values['target']}/{values['assumed']}"
+                                      for channel, values in snapshot['channels'].items())
+                    print(f"[{snapshot['seq']}] {status}: {values}")
+            time.sleep(0.02)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Step mode: the Arduino quantizes the levers itself
+Instead of streaming every raw 10-bit sample, the sketch (arduino_example.ino)
+turns each lever into a step number with hysteresis and only sends a line
+when a step changes:
+
+    @THROTTLE:7
+    @BELL:1
+
+The step tables come from the host's compiled config (config.py): every run
+of ADC values that maps to the same table entry becomes one step, so the
+Arduino and the host always agree on where the notches are. The host pushes
+them at connect time with these commands (each answered by "OK" or "ERR ..."):
+
+    T <CHANNEL> <first index> <threshold> ...   Thresholds (ADC value where a step starts), 8 per line
+    H <CHANNEL> <count> <hysteresis>            Number of thresholds and hysteresis in ADC counts
+    M STEPS | M RAW                              Switch mode
+    ?                                            Send every channel's current step again
+
+On the host, a step is turned back into a representative ADC value (the
+middle of the step's range), so the normal handlers see exactly the step the
+Arduino chose.
+"""
+
+ANALOG_CHANNELS = ('WHISTLE', 'HEADLIGHT', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE')
+DIGITAL_CHANNELS = ('BELL', 'CYLINDER')
+MAX_THRESHOLDS = 48  # Per channel; must match MAX_THRESHOLDS in the sketch
+CHUNK = 8  # Thresholds per T line (keeps lines inside the Arduino's 64-byte buffer)
+WHISTLE_LEVELS = 8  # Whistle intensity steps on each side (for whistle_mode = "pulse")
+
+
+def step_runs(values):
+    """
+    Split a lookup table into steps
+
+    Args:
+        values: Table entry per ADC value (0 … 1023)
+
+    Returns:
+        (thresholds, representatives): ADC value where each step after the
+        first starts, and the middle ADC value of every step
+    """
+    thresholds = []
+    representatives = []
+    start = 0
+    for v in range(1, len(values)):
+        if values[v] != values[v - 1]:
+            thresholds.append(v)
+            representatives.append((start + v - 1) // 2)
+            start = v
+    representatives.append((start + len(values) - 1) // 2)
+    return tuple(thresholds), tuple(representatives)
+
+
+def build_step_tables(config):
+    """
+    Step tables for every analog channel
+
+    Args:
+        config: CompiledConfig
+
+    Returns:
+        Dict of channel → (thresholds, representatives)
+
+    Raises:
+        ValueError: A channel has more steps than the Arduino can hold
+    """
+    tables = {}
+    for channel in ANALOG_CHANNELS:
+        if channel == 'WHISTLE':
+            # Direction and a coarse intensity, so pulse mode still works
+            values = tuple((d, min(WHISTLE_LEVELS - 1, int(i * WHISTLE_LEVELS))) if d else (0, 0)
+                           for d, i in zip(config.tables['WHISTLE'], config.tables['WHISTLE_INTENSITY']))
+        else:
+            values = config.tables[channel]
+        thresholds, representatives = step_runs(values)
+        if len(thresholds) > MAX_THRESHOLDS:
+            raise ValueError(f"{channel} has {len(thresholds) + 1} steps, the Arduino holds at most {MAX_THRESHOLDS + 1}")
+        tables[channel] = (thresholds, representatives)
+    return tables
+
+
+def table_commands(tables, hysteresis):
+    """
+    Command lines that load the tables into the Arduino
+
+    Args:
+        tables: From build_step_tables()
+        hysteresis: ADC counts a lever must move past a threshold to change step
+    """
+    lines = []
+    for channel, (thresholds, _) in tables.items():
+        for start in range(0, len(thresholds), CHUNK):
+            chunk = thresholds[start:start + CHUNK]
+            lines.append(f"T {channel} {start} " + " ".join(str(t) for t in chunk))
+        lines.append(f"H {channel} {len(thresholds)} {hysteresis}")
+    return lines
+
+
+class StepDecoder:
+    """Rebuilds a control frame from step events"""
+    def __init__(self, tables):
+        self.tables = tables
+        self.frame = {}
+
+    def feed(self, line):
+        """
+        Apply one line from the Arduino
+
+        Returns:
+            True if the frame changed, False for other lines (acks, raw frames)
+
+        Raises:
+            ValueError: Malformed step event
+        """
+        if not line.startswith('@'):
+            return False
+        channel, _, value = line[1:].partition(':')
+        step = int(value)
+        if channel in self.tables:
+            representatives = self.tables[channel][1]
+            if not 0 <= step < len(representatives):
+                raise ValueError(f"step {step} out of range for {channel}")
+            self.frame[channel] = representatives[step]
+        elif channel in DIGITAL_CHANNELS:
+            self.frame[channel] = step
+        else:
+            raise ValueError(f"unknown channel {channel!r}")
+        return True
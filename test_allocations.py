@@ -0,0 +1,205 @@
+"""
+Allocation test for the control loop's steady state
+Runs thousands of control ticks with the levers standing still (the same
+serial line every tick, no key to send) under tracemalloc and fails if a
+tick allocates anything. Every allocation in the loop is work for the
+garbage collector, and its collections land in the middle of a tick.
+
+Run it after changing the control loop, the handlers, the serial source or
+the metrics:
+
+    python test_allocations.py
+
+Exit status 0 = no per-tick allocations. Otherwise the script lists the
+pieces of the tick that allocate (a focus check, the source, a handler…).
+
+Runs anywhere: keys go to a RecordingKeyboard and the focus check is
+replaced (the real one needs Windows). The live state export is on, written
+to a temporary file, the levers are calibrated with online learning on, and
+motion prediction is on for every notched lever.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import realtime
+import railroader_controller_pynput as controller
+from calibration import CENTERED_CHANNELS, CHANNELS, ChannelRange, Calibrator
+from config import CompiledConfig
+from event_log import INFO
+from input_sources import SerialSource
+from key_backends import RecordingKeyboard
+from state_export import StateExport
+
+TICKS = 5000  # Ticks measured per scenario
+SETTLE_TICKS = 50  # Ticks without a key press before the levers count as "standing still"
+SETTLE_TIMEOUT = 10.0  # Seconds to wait for the handlers to catch up with the levers
+WARMUP_CALLS = 100  # Uncounted calls first (the interpreter specializes new code on its first runs)
+# Calibration the test starts from (noisy pots that don't reach the ends)
+CALIBRATION = {channel: ChannelRange(12, 1010, 505 if channel in CENTERED_CHANNELS else None, 3) for channel in CHANNELS}
+PREDICTION = {'throttle_lead': 0.15, 'train_brake_lead': 0.15, 'ind_brake_lead': 0.15, 'reverser_lead': 0.15}
+
+# Lever positions (each scenario starts from where the previous one left off)
+SCENARIOS = [
+    ("levers parked", b"WHISTLE:512;BELL:0;HEADLIGHT:700;CYLINDER:0;REVERSER:850;THROTTLE:700;TRAINBRAKE:300;INDBRAKE:900\r\n"),
+    ("high whistle held, bell held",
+     b"WHISTLE:950;BELL:1;HEADLIGHT:700;CYLINDER:0;REVERSER:850;THROTTLE:700;TRAINBRAKE:300;INDBRAKE:900\r\n"),
+    ("low whistle held, cylinder cocks open", b"WHISTLE:80;BELL:0;HEADLIGHT:700;CYLINDER:1;REVERSER:850;THROTTLE:700;TRAINBRAKE:300;INDBRAKE:900\r\n"),
+]
+
+
+class SteadySerial:
+    """Serial port that has the same line waiting again on every poll"""
+    def __init__(self, line):
+        self.line = line
+        self.timeout = None
+        self._read = False  # The line was read; the poll's next check finds the buffer empty
+
+    @property
+    def in_waiting(self):
+        if self._read:
+            self._read = False
+            return 0
+        return len(self.line)
+
+    def readline(self):
+        self._read = True
+        return self.line
+
+    def close(self):
+        pass
+
+
+def focused():
+    return True
+
+
+def tick(source):
+    """One control loop iteration, minus the sleep"""
+    controller.control_tick(source, focused)
+    realtime.collect_idle(controller.UPDATE_INTERVAL)
+
+
+def allocating_calls(func, calls):
+    """
+    Number of calls of func() that allocated anything
+
+    Counted with tracemalloc's peak: a call that allocates even a temporary
+    (freed before it returns) raises the peak above where it started, and
+    nothing can be kept (leaked) without being allocated first
+    """
+    count = 0
+    for i in range(WARMUP_CALLS + calls):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        if tracemalloc.get_traced_memory()[1] > before and i >= WARMUP_CALLS:
+            count += 1
+    return count
+
+
+def settle(source):
+    """Tick until no key has been sent or held for a notch for SETTLE_TICKS ticks"""
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    quiet = 0
+    while quiet < SETTLE_TICKS:
+        if time.monotonic() > deadline:
+            raise RuntimeError("the handlers never caught up with the levers")
+        keys = controller.KEYS.value
+        tick(source)
+        # A notch key still down means its handler has more notches to send
+        notch_held = any(release_at is not None for _, release_at, _ in list(controller.held_keys.held.values()))
+        quiet = quiet + 1 if controller.KEYS.value == keys and not notch_held else 0
+        time.sleep(0.002)  # Let the scheduler release the notch holds
+
+
+def observe(frame):
+    """Feed a frame to the calibrator alone"""
+    i = 0
+    while i < len(CHANNELS):
+        controller.calibrator.observe(CHANNELS[i], frame[CHANNELS[i]])
+        i += 1
+
+
+def breakdown(source, frame):
+    """Which parts of the tick allocate"""
+    parts = [
+        ("held_keys.heartbeat", controller.held_keys.heartbeat),
+        ("source.poll", source.poll),
+        ("handle_controls", lambda: controller.handle_controls(frame)),
+        ("realtime.collect_idle", lambda: realtime.collect_idle(controller.UPDATE_INTERVAL)),
+        ("state_export.publish", lambda: controller.state_export.publish(controller.state, source.connected())),
+        ("calibrator.observe", lambda: observe(frame)),
+    ]
+    for channel, name, handler, _ in controller.CONTROL_HANDLERS:
+        parts.append((f"{name} handler", lambda handler=handler, value=frame[channel]: handler(value)))
+    found = []
+    for name, func in parts:
+        count = allocating_calls(func, 1000)
+        if count:
+            found.append(f"{name} ({count}/1000 calls)")
+    return found
+
+
+def run_scenarios(label):
+    """Measure every scenario; returns the number that allocate"""
+    failures = 0
+    for name, line in SCENARIOS:
+        source = SerialSource("test", 9600, None, controller.parse_serial_data, ser=SteadySerial(line))
+        settle(source)
+        allocating = allocating_calls(lambda: tick(source), TICKS)
+        if allocating == 0:
+            print(f"✓ {label}: {name} - {TICKS} ticks, no allocations")
+            continue
+        failures += 1
+        print(f"✗ {label}: {name} - {allocating}/{TICKS} ticks allocated")
+        for part in breakdown(source, source.poll()):
+            print(f"    allocates: {part}")
+    return failures
+
+
+def main():
+    controller.LOG_KEYS = False
+    controller.events.level = INFO  # DEBUG_MODE logging allocates by design
+    controller.set_keyboard_backend(RecordingKeyboard())
+    export_path = os.path.join(tempfile.mkdtemp(), "railroader_state.bin")
+    controller.state_export = StateExport(export_path)
+    if not controller.state_export.open():
+        return 1
+    settings = controller.base_settings()
+    settings['prediction'].update(PREDICTION)
+    controller.calibrator = Calibrator(CALIBRATION)
+    controller.apply_config(controller.calibrated(CompiledConfig(settings)), switch_input=False)
+    controller.calibrator.enabled = True
+
+    print("=" * 70)
+    print("CONTROL LOOP ALLOCATION TEST")
+    print("=" * 70)
+    tracemalloc.start()
+    failures = run_scenarios("default")
+    realtime.enable(priority=False, gc_mode='scheduled')
+    try:
+        failures += run_scenarios("real-time")
+    finally:
+        realtime.disable()
+    tracemalloc.stop()
+
+    controller.whistle.stop()
+    controller.held_keys.release_all('shutdown')
+    controller.scheduler.stop()
+    controller.state_export.close()
+    os.remove(export_path)
+    os.rmdir(os.path.dirname(export_path))
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} scenario(s) allocate per tick")
+        return 1
+    print("✓ Steady-state ticks allocate nothing")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
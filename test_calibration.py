@@ -0,0 +1,221 @@
+"""
+Lever calibration test on a virtual clock
+Drives the control loop with modelled pots - ends that stop short of 0 and
+1023, centered levers resting off 512, seeded noise - while the online
+Calibrator learns from every frame. Checks that range, center and noise
+converge on the model's, that the top notch becomes reachable with the
+lever against its short stop, that spikes and partial sweeps don't count
+as range, that the calibration file round-trips: saved, loaded and
+compiled again it gives the same ranges and the same tables - and that
+switching to the simulator at runtime stops the learning, so nothing
+simulated is learned or saved.
+
+    python test_calibration.py
+
+Exit status 0 = all checks passed.
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+import calibration
+import railroader_controller_pynput as controller
+from calibration import Calibrator
+from clock import VirtualClock
+from config import ADC_MAX, CompiledConfig, lookup
+from event_log import INFO
+from input_sources import SimulationSource
+from key_backends import RecordingKeyboard
+
+SEED = 3
+SECONDS = 25.0
+
+
+class Deadline:
+    """Stands in for the loop's stop_event: set once the virtual clock reaches `at`"""
+    def __init__(self, clock, at):
+        self.clock = clock
+        self.at = at
+
+    def is_set(self):
+        return self.clock.now() >= self.at
+
+
+class Pot:
+    """A lever moved along (time, position) waypoints, read with ±noise counts of jitter"""
+    def __init__(self, waypoints, noise, rng):
+        self.waypoints = waypoints
+        self.noise = noise
+        self.rng = rng
+
+    def read(self, now):
+        position = self.waypoints[-1][1]
+        for (t0, p0), (t1, p1) in zip(self.waypoints, self.waypoints[1:]):
+            if t0 <= now < t1:
+                position = p0 + (p1 - p0) * (now - t0) / (t1 - t0)
+                break
+        return max(0, min(ADC_MAX, round(position) + self.rng.randint(-self.noise, self.noise)))
+
+
+# Channel → (low stop, high stop, rest center or None, noise)
+LEVERS = {
+    'THROTTLE': (14, 1009, None, 2),
+    'WHISTLE': (40, 990, 530, 3),
+    'REVERSER': (25, 1000, 495, 2),
+}
+
+
+def build_panel(rng):
+    low, high, _, noise = LEVERS['THROTTLE']
+    pots = {'THROTTLE': Pot([(0, low), (3, low), (6, high), (9, low), (12, high), (15, low), (18, low), (19, high)],
+                            noise, rng)}
+    for channel in ('WHISTLE', 'REVERSER'):
+        low, high, center, noise = LEVERS[channel]
+        pots[channel] = Pot([(0, center), (3, center), (5, low), (6, low), (9, high), (10, high), (12, center)], noise, rng)
+    for channel in ('HEADLIGHT', 'TRAINBRAKE', 'INDBRAKE'):
+        pots[channel] = Pot([(0, 3)], 1, rng)  # Never moved: nothing to learn about their range
+    return pots
+
+
+def main():
+    controller.LOG_KEYS = False
+    controller.events.level = INFO
+    print("=" * 70)
+    print("LEVER CALIBRATION TEST (virtual clock)")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    # Spikes and partial sweeps (Calibrator alone)
+    rng = random.Random(SEED)
+    calibrator = Calibrator()
+    readings = [500 + rng.randint(-2, 2) for _ in range(100)] + [0] + [500 + rng.randint(-2, 2) for _ in range(100)]
+    for value in readings:
+        calibrator.observe('THROTTLE', value)
+    check(calibrator.low['THROTTLE'] > 400, "A single-frame spike doesn't stretch the range", calibrator.low['THROTTLE'])
+    for guided, end_gap in ((False, calibration.END_GAP), (True, ADC_MAX)):
+        calibrator = Calibrator(end_gap=end_gap)
+        for value in list(range(300, 900, 5)) + list(range(900, 300, -5)):
+            calibrator.observe('THROTTLE', value)
+        entry = calibrator.ranges().get('THROTTLE')
+        if guided:
+            check(entry is not None and entry.min is not None and entry.max is not None and entry.max - entry.min > 580,
+                  "Guided run: any swept range is used", entry)
+        else:
+            check(entry is None or entry.min is None, "Online: a sweep short of both ends isn't taken as the range", entry)
+
+    # Online calibration in the running control loop
+    directory = tempfile.mkdtemp()
+    controller.CALIBRATION_FILE = os.path.join(directory, "railroader_calibration.toml")
+    clock = VirtualClock()
+    controller.set_clock(clock)
+    controller.set_keyboard_backend(RecordingKeyboard(clock=clock.now))
+    controller.state = controller.ControlState()
+    controller.digital_inputs.inputs.clear()
+    settings = {section: dict(values) for section, values in controller.active_config.settings.items()}
+    settings['input'].update(source="serial", serial_mode="raw")  # Learning is off for the simulator
+    uncalibrated = CompiledConfig(settings)
+    controller.apply_config(uncalibrated, switch_input=False)
+    controller.load_calibration()
+    pots = build_panel(random.Random(SEED))
+
+    def frame():
+        now = clock.now()
+        values = {channel: pot.read(now) for channel, pot in pots.items()}
+        values.update(BELL=0, CYLINDER=0)
+        return values
+
+    source = SimulationSource(frame, controller.UPDATE_INTERVAL)
+    compiler = controller.calibration_compiler
+    try:
+        # The compiler's thread isn't started: it is checked between stretches of the loop instead
+        while clock.now() < SECONDS:
+            controller.control_loop(source, Deadline(clock, clock.now() + controller.CALIBRATION_INTERVAL), lambda: True)
+            compiler.check()
+        controller.control_loop(source, Deadline(clock, clock.now() + controller.UPDATE_INTERVAL), lambda: True)
+    finally:
+        controller.whistle.stop()
+        controller.held_keys.release_all('shutdown')
+    learned = controller.calibrator.ranges()
+    compiled = controller.active_config.calibration
+
+    for channel, (low, high, center, noise) in LEVERS.items():
+        entry = learned.get(channel)
+        if entry is None:
+            check(False, f"{channel} calibrated")
+            continue
+        check(entry.min is not None and abs(entry.min - low) <= noise and entry.max is not None and abs(entry.max - high) <= noise,
+              f"{channel} range {entry.min} … {entry.max} (stops at {low} … {high}, ±{noise})")
+        check(entry.noise is not None and noise <= entry.noise <= 2 * noise,
+              f"{channel} noise ±{entry.noise} (jitter ±{noise}: frame-to-frame steps up to {2 * noise})")
+        if center is not None:
+            check(entry.center is not None and abs(entry.center - center) <= noise,
+                  f"{channel} center {entry.center} (rests at {center})")
+    untouched = [channel for channel in ('HEADLIGHT', 'TRAINBRAKE', 'INDBRAKE')
+                 if learned.get(channel) is not None and (learned[channel].min, learned[channel].max) != (None, None)]
+    check(not untouched, "Levers never moved have no range", untouched)
+    check(compiled == learned and compiler.pending is None,
+          "The loop swapped in the tables compiled from what the calibrator learned")
+
+    top = LEVERS['THROTTLE'][1] - LEVERS['THROTTLE'][3]
+    max_steps = controller.MAX_STEPS
+    check(lookup(uncalibrated.tables['THROTTLE'], top) < max_steps <= controller.state.throttle_step,
+          f"Top notch reached with the throttle against its stop at {LEVERS['THROTTLE'][1]} "
+          f"(uncalibrated: notch {lookup(uncalibrated.tables['THROTTLE'], top)})", controller.state.throttle_step)
+
+    # Persistence
+    check(controller.save_calibration(), "Calibration saved")
+    loaded = calibration.load(controller.CALIBRATION_FILE)
+    check(loaded == learned, "Loaded file equals what was learned", loaded)
+    check(not controller.save_calibration(), "Nothing new: the file isn't rewritten")
+    check(Calibrator(loaded).ranges() == loaded, "A calibrator started from the file reports the same ranges")
+    check(CompiledConfig(settings, loaded).tables == controller.active_config.tables
+          and CompiledConfig(settings, loaded).bands == controller.active_config.bands,
+          "Tables compiled from the file are identical")
+
+    # A console "input simulation" switch at runtime stops the learning
+    controller.CALIBRATION_FILE = os.path.join(directory, "switched_calibration.toml")
+    controller.load_calibration()
+    pots = build_panel(random.Random(SEED))
+    panel = SimulationSource(frame, controller.UPDATE_INTERVAL)
+    panel.name = "serial"  # Stands in for the Arduino
+    factory = controller.input_manager.factory
+    controller.input_manager.factory = lambda name: panel if name == "serial" else factory(name)
+    try:
+        controller.input_manager.select("serial")
+        check(controller.calibrator.enabled, "Learning from the panel")
+        check(controller.switch_input_source("simulation"), "Switched to the simulator at runtime")
+        controller.control_loop(None, Deadline(clock, clock.now() + SECONDS), lambda: True)
+        check(controller.input_manager.current.name == "simulation" and not controller.calibrator.enabled,
+              "Simulator in use: learning off")
+        check(controller.calibrator.ranges() == {}, "Nothing learned from the simulated levers",
+              controller.calibrator.ranges())
+        check(not controller.save_calibration() and not os.path.exists(controller.CALIBRATION_FILE),
+              "Nothing saved")
+        controller.switch_input_source("serial")
+        controller.control_loop(None, Deadline(clock, clock.now() + 1.0), lambda: True)
+        check(controller.input_manager.current is panel and controller.calibrator.enabled,
+              "Back on the panel: learning again")
+    finally:
+        controller.input_manager.factory = factory
+        controller.input_manager.close()
+        controller.whistle.stop()
+        controller.held_keys.release_all('shutdown')
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Calibration converges and persists")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+"""
+Settings file test
+Checks that every kind of bad value in railroader_config.toml is rejected
+by name, that limits themselves are accepted, that the shipped file
+changes nothing, and that hot reload applies a good file between ticks of
+the running control loop (on a clock.VirtualClock) while a bad one is
+reported and leaves the previous settings in force. Changed input settings
+reopen the serial port without a second handle on it, and input settings
+that don't open are reported and tried again on the next reload.
+
+    python test_config.py
+
+Exit status 0 = all checks passed.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import railroader_controller_pynput as controller
+from clock import VirtualClock
+from config import CompiledConfig, ConfigWatcher, load_config, merge_settings
+from event_log import INFO
+from input_sources import SimulationSource
+from key_backends import RecordingKeyboard
+
+# (TOML snippet, text the error must contain)
+BAD_SETTINGS = [
+    ("[loop]\nupdate_interval = 0.0", "loop.update_interval must be between"),
+    ("[loop]\nupdate_interval = 5", "loop.update_interval must be between"),
+    ("[loop]\nupdate_interval = 0.3", "loop.update_interval must be between"),
+    ("[input]\nsource = \"bluetooth\"", "input.source must be one of"),
+    ("[input]\nserial_baud = 100", "input.serial_baud must be between"),
+    ("[controls]\nmax_steps = 0", "controls.max_steps must be between"),
+    ("[controls]\nmax_steps = 101", "controls.max_steps must be between"),
+    ("[controls]\nmax_steps = \"20\"", "controls.max_steps must be int"),
+    ("[controls]\nmax_steps = true", "controls.max_steps must be int"),
+    ("[controls]\nwhistle_deadzone = 600", "controls.whistle_deadzone must be between"),
+    ("[controls]\nwhistle_center = -1", "controls.whistle_center must be between"),
+    ("[controls]\nwhistle_mode = \"warble\"", "controls.whistle_mode must be one of"),
+    ("[controls]\nheadlight_positions = 1", "controls.headlight_positions must be between"),
+    ("[digital]\ndebounce = 0.6", "digital.debounce must be between"),
+    ("[keys]\nbell = \"\"", "keys.bell must not be empty"),
+    ("[keys]\nbell = \"space\"", "keys.bell must be a single key"),
+    ("[keys]\nbell = \"hb\"", "keys.bell must be a single key"),
+    ("[keys]\nbell = \"h\"", "is already bound to keys."),
+    ("[keys]\nthrottle_up = \"x\"\nthrottle_down = \"X\"", "is already bound to keys."),
+    ("[calibration]\nnoise_margin = 0.5", "calibration.noise_margin must be between"),
+    ("[prediction]\nmax_ahead = 0", "prediction.max_ahead must be between"),
+    ("[prediction]\nthrottle_lead = 1.5", "prediction.throttle_lead must be between"),
+    ("[logging]\ndebug = 1", "logging.debug must be bool"),
+    ("[controls]\nmax_step = 20", "unknown setting controls.max_step"),
+    ("[cab]\nmax_steps = 20", "unknown section [cab]"),
+    ("controls = 5", "[controls] must be a table"),
+    ("[controls\nmax_steps = 20", "invalid TOML"),
+]
+
+# Limits are inclusive
+GOOD_SETTINGS = [
+    "[loop]\nupdate_interval = 0.001",
+    "[loop]\nupdate_interval = 0.25",
+    "[controls]\nmax_steps = 1\nheadlight_positions = 9\nwhistle_deadzone = 511",
+    "[controls]\nmax_steps = 100\nnotch_hold = 0",
+    "[digital]\ndebounce = 0.5\nbell_repeat_rate = 0",
+    "[prediction]\nmax_ahead = 20\nthrottle_lead = 1",
+]
+
+
+class ExclusivePorts:
+    """Serial ports that, like COM ports on Windows, only one handle can hold at a time"""
+    def __init__(self):
+        self.held = set()
+        self.missing = set()  # Ports that aren't plugged in
+        self.refused_bauds = set()
+
+    def open(self, port, baud):
+        if port in self.held or port in self.missing or baud in self.refused_bauds:
+            return None
+        self.held.add(port)
+        return ExclusivePort(self, port, baud)
+
+
+class ExclusivePort:
+    def __init__(self, ports, port, baud):
+        self.ports = ports
+        self.port = port
+        self.baud = baud
+        self.in_waiting = 0
+        self.timeout = None
+
+    def readline(self):
+        return b""
+
+    def close(self):
+        self.ports.held.discard(self.port)
+
+
+class Deadline:
+    """Stands in for the loop's stop_event: set once the virtual clock reaches `at`"""
+    def __init__(self, clock, at):
+        self.clock = clock
+        self.at = at
+
+    def is_set(self):
+        return self.clock.now() >= self.at
+
+
+def write(path, text, version):
+    """Write the file with its own modification time, as a save in an editor would"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text + "\n")
+    os.utime(path, ns=(version * 10**9, version * 10**9))
+
+
+def main():
+    controller.LOG_KEYS = False
+    controller.events.level = INFO
+    print("=" * 70)
+    print("SETTINGS FILE TEST")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    base = controller.base_settings()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "railroader_config.toml")
+
+    # Validation
+    wrong = []
+    for version, (text, message) in enumerate(BAD_SETTINGS):
+        write(path, text, version + 1)
+        try:
+            load_config(path, base)
+            wrong.append(f"{text!r} accepted")
+        except ValueError as e:
+            if message not in str(e):
+                wrong.append(f"{text!r}: {e}")
+    check(not wrong, f"{len(BAD_SETTINGS)} bad settings rejected by name", "; ".join(wrong))
+    wrong = []
+    for text in GOOD_SETTINGS:
+        write(path, text, 1)
+        try:
+            load_config(path, base)
+        except ValueError as e:
+            wrong.append(f"{text!r}: {e}")
+    check(not wrong, "Values at the limits accepted", "; ".join(wrong))
+    shipped = load_config(controller.CONFIG_FILE, base)
+    check(shipped.settings == merge_settings(base, {}), "The shipped settings file overrides nothing")
+
+    # Hot reload between ticks of the running loop
+    clock = VirtualClock()
+    controller.set_clock(clock)
+    controller.set_keyboard_backend(RecordingKeyboard(clock=clock.now))
+    controller.state = controller.ControlState()
+    controller.apply_config(load_config(controller.CONFIG_FILE, base), switch_input=False)
+    frame = {'WHISTLE': 512, 'BELL': 0, 'HEADLIGHT': 512, 'CYLINDER': 0,
+             'REVERSER': 512, 'THROTTLE': 1023, 'TRAINBRAKE': 0, 'INDBRAKE': 0}
+    source = SimulationSource(lambda: dict(frame), controller.UPDATE_INTERVAL)
+    write(path, "[controls]\nmax_steps = 20", 1)
+    watcher = ConfigWatcher(path, base)
+    controller.config_watcher = watcher
+
+    def run(seconds):
+        controller.control_loop(source, Deadline(clock, clock.now() + seconds), lambda: True)
+
+    try:
+        run(5.0)
+        check(controller.state.throttle_step == 20, "Throttle walked to 20 notches")
+
+        write(path, "[controls]\nmax_steps = 10\n[keys]\nthrottle_up = \"t\"", 2)
+        check(watcher.check(), "Changed file loaded")
+        check(controller.MAX_STEPS == 20, "Nothing applied before the loop's next tick")
+        run(5.0)
+        check(controller.MAX_STEPS == 10 and controller.active_config.keys['throttle_up'] == "t",
+              "Good reload applied between ticks")
+        check(controller.state.throttle_step == 10, "Assumed position kept and walked to the new target",
+              controller.state.throttle_step)
+
+        for version, text in enumerate(("[controls]\nmax_steps = 0", "[controls\nmax_steps = 30"), 3):
+            previous = controller.active_config
+            write(path, text, version)
+            report = io.StringIO()
+            with contextlib.redirect_stdout(report):
+                loaded = watcher.check()
+            check(not loaded and watcher.pending is None and "keeping the previous settings" in report.getvalue(),
+                  f"Bad file rejected and reported: {text.splitlines()[-1]!r}", report.getvalue().strip())
+            run(1.0)
+            check(controller.active_config is previous and controller.MAX_STEPS == 10,
+                  "Previous settings still in force")
+
+        write(path, "[controls]\nmax_steps = 20", 5)
+        watcher.check()
+        run(5.0)
+        check(controller.MAX_STEPS == 20 and controller.state.throttle_step == 20,
+              "Fixed file applied after a bad one")
+    finally:
+        controller.config_watcher = None
+        controller.whistle.stop()
+        controller.held_keys.release_all('shutdown')
+
+    # Input settings reloaded while the serial port is open
+    ports = ExclusivePorts()
+    open_connection = controller.open_serial_connection
+    controller.open_serial_connection = ports.open
+    settings = {section: dict(values) for section, values in controller.active_config.settings.items()}
+
+    def reload(**values):
+        settings['input'] = dict(settings['input'], **values)
+        report = io.StringIO()
+        with contextlib.redirect_stdout(report):
+            controller.apply_config(CompiledConfig(settings))
+            controller.input_manager.poll()  # The loop's next tick takes a switched source
+        return report.getvalue()
+
+    try:
+        settings['input'].update(source="serial", serial_port="COM3", serial_baud=9600, serial_mode="raw")
+        controller.apply_config(CompiledConfig(settings), switch_input=False)
+        check(controller.input_manager.select("serial"), "Serial source open on COM3")
+        first = controller.input_manager.current
+
+        reload(serial_baud=115200)
+        current = controller.input_manager.current
+        check(current is not first and current.ser is not None and current.ser.baud == 115200
+              and first.ser is None and ports.held == {"COM3"},
+              "New baud on the same port: old handle closed first, port reopened")
+
+        ports.missing.add("COM9")
+        before = controller.input_manager.current
+        report = reload(serial_port="COM9")
+        check(controller.input_manager.current is before and controller.SERIAL_PORT == "COM3"
+              and "Could not open" in report, "Port that won't open: reported, previous source and settings kept",
+              report.strip())
+        ports.missing.clear()
+        reload()
+        check(controller.input_manager.current.ser.port == "COM9" and controller.SERIAL_PORT == "COM9"
+              and ports.held == {"COM9"}, "Same file reloaded once the port is there: switched")
+
+        ports.refused_bauds.add(250000)
+        before = controller.input_manager.current
+        report = reload(serial_baud=250000)
+        check(controller.input_manager.current is before and before.ser is not None
+              and controller.SERIAL_BAUD == 115200 and "Could not open" in report,
+              "Baud the port refuses: previous source reopened, settings kept", report.strip())
+    finally:
+        controller.input_manager.close()
+        controller.open_serial_connection = open_connection
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Settings are validated and reloaded safely")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Control loop timeline test on a virtual clock
+Runs the real control loop (handlers, key timing, debouncing, whistle
+pulses, scheduler, watchdog) through SECONDS of a scripted scenario on a
+clock.VirtualClock, twice, and checks that both runs press and release the
+same keys at exactly the same times. Sleeps return at once, so ten minutes
+of driving take a second or two.
+
+    python test_control_timeline.py
+
+Exit status 0 = identical, non-empty key timelines.
+"""
+
+import sys
+import time
+
+import railroader_controller_pynput as controller
+from clock import VirtualClock
+from event_log import INFO
+from input_sources import SimulationSource
+from key_backends import RecordingKeyboard
+from simulator import ScenarioSimulator
+
+SECONDS = 600.0  # Simulated seconds per run
+SCENARIO = 'mixed'
+SEED = 7
+PANEL_RATE = 20  # Frames per second, like the Arduino sketch (the simulator's cost grows with it)
+
+
+class Deadline:
+    """Stands in for the loop's stop_event: set once the virtual clock reaches `at`"""
+    def __init__(self, clock, at):
+        self.clock = clock
+        self.at = at
+
+    def is_set(self):
+        return self.clock.now() >= self.at
+
+
+def focused():
+    return True
+
+
+def run_timeline():
+    """
+    One run from a fresh state
+
+    Returns:
+        (key events, wall-clock seconds taken)
+    """
+    clock = VirtualClock()
+    controller.set_clock(clock)
+    keyboard = RecordingKeyboard(clock=clock.now)
+    controller.set_keyboard_backend(keyboard)
+    controller.state = controller.ControlState()
+    controller.digital_inputs.inputs.clear()
+    controller.configure_digital_inputs(controller.active_config)
+    simulator = ScenarioSimulator(SCENARIO, seed=SEED, rate=PANEL_RATE, clock=clock.now)
+    source = SimulationSource(simulator.frame_now, controller.UPDATE_INTERVAL)
+
+    started = time.perf_counter()
+    controller.held_keys.start_watchdog()
+    try:
+        controller.control_loop(source, Deadline(clock, SECONDS), focused)
+    finally:
+        controller.held_keys.stop_watchdog()
+        controller.whistle.stop()
+        controller.held_keys.release_all('shutdown')
+    return keyboard.events, time.perf_counter() - started
+
+
+def main():
+    controller.LOG_KEYS = False
+    controller.events.level = INFO
+
+    print("=" * 70)
+    print("CONTROL LOOP TIMELINE TEST (virtual clock)")
+    print("=" * 70)
+    first, elapsed = run_timeline()
+    second, _ = run_timeline()
+    print(f"Ran {SECONDS:.0f}s of '{SCENARIO}' in {elapsed:.2f}s ({SECONDS / elapsed:,.0f}× real time)")
+    print(f"Key events: {len(first)} / {len(second)}")
+    print("=" * 70)
+    if not first:
+        print("✗ No keys were sent")
+        return 1
+    for i, (a, b) in enumerate(zip(first, second)):
+        if a != b:
+            print(f"✗ Timelines differ at event {i}: {a} vs {b}")
+            return 1
+    if len(first) != len(second):
+        print("✗ Timelines differ in length")
+        return 1
+    print("✓ Both runs sent the same keys at the same times")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Debounce and edge-detection test on a virtual clock
+Feeds scripted button samples to DigitalInput and checks that the leading
+edge fires on the first sample, contact bounce shorter than `debounce` is
+ignored, a level that changed during the debounce window is picked up
+right after it, and the bell's auto-repeat fires at repeat_delay and then
+every 1/repeat_rate seconds - also through the controller's bell handler,
+down to the key presses.
+
+    python test_digital_inputs.py
+
+Exit status 0 = all checks passed.
+"""
+
+import sys
+
+import railroader_controller_pynput as controller
+from clock import VirtualClock
+from config import CompiledConfig
+from digital_inputs import PRESS, RELEASE, REPEAT, DigitalInput
+from event_log import INFO
+from key_backends import RecordingKeyboard
+
+DEBOUNCE = 0.03
+SAMPLE = 0.005  # Seconds between samples (a 200 Hz panel)
+REPEAT_DELAY = 0.5
+REPEAT_RATE = 4.0
+TOLERANCE = 1e-6
+
+
+def run(digital, clock, samples):
+    """
+    Feed (level, seconds) pairs, one sample every SAMPLE seconds
+
+    Returns:
+        List of (time, event)
+    """
+    fired = []
+    for level, seconds in samples:
+        end = clock.now() + seconds
+        while clock.now() < end - TOLERANCE:
+            for event in digital.update(level):
+                fired.append((round(clock.now(), 6), event))
+            clock.advance(SAMPLE)
+    return fired
+
+
+def bounce(first, seconds):
+    """Contacts chattering between two levels, starting with `first`"""
+    return [(first if i % 2 == 0 else 1 - first, SAMPLE) for i in range(round(seconds / SAMPLE))]
+
+
+def expected_repeats(held):
+    times = []
+    at = REPEAT_DELAY
+    while at < held - TOLERANCE:
+        times.append(round(at, 6))
+        at += 1.0 / REPEAT_RATE
+    return times
+
+
+def on_time(times, expected):
+    """Same count, each within one sample of its expected time (samples only see the clock every SAMPLE)"""
+    return len(times) == len(expected) and all(0 <= a - b < SAMPLE + TOLERANCE for a, b in zip(times, expected))
+
+
+def main():
+    controller.LOG_KEYS = False
+    controller.events.level = INFO
+    print("=" * 70)
+    print("DIGITAL INPUT TEST (virtual clock)")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    # Leading edge, bounce on press and release
+    clock = VirtualClock()
+    button = DigitalInput('BELL', debounce=DEBOUNCE, clock=clock.now)
+    fired = run(button, clock, [(0, 0.1)] + bounce(1, 0.025) + [(1, 0.2)] + bounce(0, 0.025) + [(0, 0.2)])
+    check(fired == [(0.1, PRESS), (0.325, RELEASE)],
+          "Leading edge fires at once; bounce shorter than the debounce is ignored", fired)
+
+    # A level that settled inside the window is taken right after it
+    clock = VirtualClock()
+    button = DigitalInput('BELL', debounce=DEBOUNCE, clock=clock.now)
+    fired = run(button, clock, [(1, 0.01), (0, 0.1)])
+    check(fired == [(0.0, PRESS), (DEBOUNCE, RELEASE)],
+          "A release inside the debounce window is accepted when the window ends", fired)
+
+    # Chatter longer than the debounce is a real change every DEBOUNCE seconds, never faster
+    clock = VirtualClock()
+    button = DigitalInput('BELL', debounce=DEBOUNCE, clock=clock.now)
+    fired = run(button, clock, bounce(1, 0.2))
+    gaps = [round(b[0] - a[0], 6) for a, b in zip(fired, fired[1:])]
+    check(bool(gaps) and min(gaps) >= DEBOUNCE, "Accepted edges are at least the debounce apart", gaps)
+
+    # Repeat timing
+    clock = VirtualClock()
+    button = DigitalInput('BELL', debounce=DEBOUNCE, repeat_delay=REPEAT_DELAY, repeat_rate=REPEAT_RATE, clock=clock.now)
+    fired = run(button, clock, [(1, 1.6), (0, 0.1)])
+    repeats = [at for at, event in fired if event == REPEAT]
+    check(on_time(repeats, expected_repeats(1.6)), f"Repeats at {REPEAT_DELAY}s, then every {1 / REPEAT_RATE}s", repeats)
+    check([event for _, event in fired if event != REPEAT] == [PRESS, RELEASE], "One press and one release around them")
+
+    # Slow frames don't burst
+    clock = VirtualClock()
+    button = DigitalInput('BELL', debounce=DEBOUNCE, repeat_delay=REPEAT_DELAY, repeat_rate=REPEAT_RATE, clock=clock.now)
+    button.update(1)
+    clock.advance(2.0)
+    check(button.update(1) == (REPEAT,), "A frame after a long stall repeats once, not for every missed period")
+
+    # Through the controller: bell key presses
+    clock = VirtualClock()
+    controller.set_clock(clock)
+    keyboard = RecordingKeyboard(clock=clock.now)
+    controller.set_keyboard_backend(keyboard)
+    controller.state = controller.ControlState()
+    controller.digital_inputs.inputs.clear()
+    settings = {section: dict(values) for section, values in controller.active_config.settings.items()}
+    settings['digital'].update(debounce=DEBOUNCE, bell_repeat_delay=REPEAT_DELAY, bell_repeat_rate=REPEAT_RATE)
+    controller.apply_config(CompiledConfig(settings), switch_input=False)
+    controller.configure_digital_inputs(controller.active_config)
+    bell = settings['keys']['bell']
+    start = 0.1
+    for level, seconds in [(0, start)] + bounce(1, 0.025) + [(1, 1.6 - 0.025)] + bounce(0, 0.025) + [(0, 0.5)]:
+        end = clock.now() + seconds
+        while clock.now() < end - TOLERANCE:
+            controller.handle_bell(level)
+            clock.advance(SAMPLE)
+    controller.held_keys.release_all('shutdown')
+    presses = [round(at - start, 6) for at, action, key, _ in keyboard.events if action == 'press' and key == bell]
+    check(on_time(presses, [0.0] + expected_repeats(1.6)), "Bell key: one press, then repeats on time, none on bounce", presses)
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Debouncing and repeat timing behave as configured")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
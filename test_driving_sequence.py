@@ -2,21 +2,29 @@
 Railroader Driving Sequence Test
 Performs a realistic driving sequence instead of random values
 Perfect for testing all controls in a logical order
+
+The sequence lives in a file (SEQUENCE_FILE, format described in sequence.py)
+and is played on a precise timed schedule, so controls can move in parallel.
+
+Usage:
+    python test_driving_sequence.py                 # Drive the game
+    python test_driving_sequence.py --fast          # Validate instantly on a virtual clock (no game needed)
+    python test_driving_sequence.py my_run.toml     # Use another sequence file
 """
 
-from pynput.keyboard import Key, Controller
+import argparse
 import time
 import ctypes
 
+from clock import RealClock
+from sequence import load_sequence, run_schedule, validate, describe
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
 WINDOW_NAME = "Railroader"
-SEQUENCE_DELAY = 2  # Seconds between each step
-LOG_KEYS = True
-
-keyboard = Controller()
+SEQUENCE_FILE = "driving_sequence.toml"
 
 # ============================================================================
 # HELPER FUNCTIONS
@@ -38,70 +46,48 @@ def is_railroader_focused():
     title = get_active_window_title()
     return WINDOW_NAME.lower() in title.lower() if title else False
 
-def press_key(key, hold_duration=0.15):
-    """Press and hold a key"""
-    if not is_railroader_focused():
-        print("  ⚠ Railroader not focused - skipping key press!")
-        return
-    
-    keyboard.press(key)
-    if hold_duration > 0:
-        time.sleep(hold_duration)
-    keyboard.release(key)
-
-def press_hotkey(modifier, key):
-    """Press a key combination"""
-    if not is_railroader_focused():
-        print("  ⚠ Railroader not focused - skipping key press!")
-        return
-    
-    keyboard.press(modifier)
-    keyboard.press(key)
-    keyboard.release(key)
-    keyboard.release(modifier)
-
-def log_step(step_num, description):
+def log_step(description):
     """Log a step in the sequence"""
     print()
     print("=" * 70)
-    print(f"STEP {step_num}: {description}")
+    print(description)
     print("=" * 70)
 
-def press_multiple(key, count, description):
-    """Press a key multiple times"""
-    print(f"  Pressing '{key}' {count} times ({description})...")
-    for i in range(count):
-        press_key(key)
-        time.sleep(0.1)
-    print(f"  ✓ Completed: {description}")
-
 # ============================================================================
 # DRIVING SEQUENCE
 # ============================================================================
 
-def run_driving_sequence():
+def run_fast(schedule):
+    """Play the whole sequence on a virtual clock and check where the controls end up"""
+    started = time.perf_counter()
+    problems = validate(schedule)
+    elapsed = time.perf_counter() - started
+    print(f"Fast-forwarded {schedule.duration:.1f}s of sequence in {elapsed * 1000:.1f}ms")
+    for problem in problems:
+        print(f"  ✗ {problem}")
+    if not problems:
+        print(f"  ✓ All controls end where expected: {schedule.final}")
+
+
+def run_driving_sequence(schedule):
     """Execute a realistic train driving sequence"""
+    from pynput.keyboard import Key, Controller
     
     print()
     print("=" * 70)
     print("RAILROADER DRIVING SEQUENCE TEST")
     print("=" * 70)
     print()
-    print("This will perform a realistic driving sequence:")
-    print("  1. Set all brakes to OFF")
-    print("  2. Reverser to FULL FORWARD")
-    print("  3. Throttle UP gradually")
-    print("  4. Reverser to 50% FORWARD")
-    print("  5. Throttle to OFF")
-    print("  6. Brakes to FULL ON")
+    print(describe(schedule))
     print()
     print("Make sure Railroader is focused!")
     print()
     
     # Countdown
+    clock = RealClock()
     for i in range(5, 0, -1):
         print(f"Starting in {i} seconds... (CLICK IN RAILROADER NOW!)", end='\r')
-        time.sleep(1)
+        clock.sleep(1)
     
     print("                                                        ")
     print()
@@ -112,90 +98,15 @@ def run_driving_sequence():
         return
     
     print("✓ Railroader detected - Starting sequence!")
-    print()
-    time.sleep(1)
-    
-    # STEP 1: Release all brakes
-    log_step(1, "RELEASE ALL BRAKES")
-    print("  Setting train brake to minimum...")
-    press_multiple(';', 20, "Train brake OFF")
-    time.sleep(0.5)
-    print("  Setting independent brake to minimum...")
-    press_multiple(',', 20, "Independent brake OFF")
-    time.sleep(SEQUENCE_DELAY)
-    
-    # STEP 2: Reverser full forward
-    log_step(2, "REVERSER FULL FORWARD")
-    press_multiple('[', 20, "Reverser to full forward")
-    time.sleep(SEQUENCE_DELAY)
-    
-    # STEP 3: Throttle up gradually
-    log_step(3, "THROTTLE UP GRADUALLY")
-    print("  Increasing throttle to 50%...")
-    press_multiple('-', 10, "Throttle to 50%")
-    time.sleep(SEQUENCE_DELAY)
-    
-    print("  Increasing throttle to 100%...")
-    press_multiple('-', 10, "Throttle to 100%")
-    time.sleep(SEQUENCE_DELAY * 2)  # Let it run at full throttle
-    
-    # STEP 4: Reverser to 50%
-    log_step(4, "REVERSER TO 50% FORWARD")
-    press_multiple(']', 10, "Reverser to 50%")
-    time.sleep(SEQUENCE_DELAY)
-    
-    # STEP 5: Throttle off
-    log_step(5, "THROTTLE TO ZERO")
-    press_multiple('=', 20, "Throttle OFF")
-    time.sleep(SEQUENCE_DELAY)
     
-    # STEP 6: Apply brakes
-    log_step(6, "APPLY BRAKES")
-    print("  Applying independent brake...")
-    press_multiple('.', 10, "Independent brake to 50%")
-    time.sleep(1)
-    
-    print("  Applying train brake...")
-    press_multiple("'", 15, "Train brake to 75%")
-    time.sleep(1)
-    
-    print("  Full emergency braking!")
-    press_multiple("'", 5, "Train brake to 100%")
-    press_multiple('.', 10, "Independent brake to 100%")
-    time.sleep(SEQUENCE_DELAY)
-    
-    # BONUS: Test other controls
-    log_step(7, "TEST OTHER CONTROLS")
-    print("  Testing headlight...")
-    press_key('j')
-    time.sleep(0.5)
-    press_key('j')
-    time.sleep(0.5)
-    print("  ✓ Headlight tested")
-    
-    print("  Testing bell...")
-    press_key('b')
-    time.sleep(1)
-    press_key('b')
-    time.sleep(0.5)
-    print("  ✓ Bell tested")
-    
-    print("  Testing whistle low...")
-    press_key('h')
-    time.sleep(1)
-    print("  ✓ Whistle low tested")
-    
-    print("  Testing whistle high...")
-    press_hotkey(Key.shift, 'h')
-    time.sleep(1)
-    print("  ✓ Whistle high tested")
+    def focused():
+        if is_railroader_focused():
+            return True
+        print("  ⚠ Railroader not focused - skipping key press!")
+        return False
     
-    print("  Testing cylinder cocks...")
-    press_key('k')
-    time.sleep(0.5)
-    press_key('k')
-    time.sleep(0.5)
-    print("  ✓ Cylinder cocks tested")
+    report = run_schedule(schedule, Controller(), clock, focus_check=focused,
+                          on_label=log_step, modifier_keys={'shift': Key.shift})
     
     # Completed
     print()
@@ -203,7 +114,8 @@ def run_driving_sequence():
     print("DRIVING SEQUENCE COMPLETE!")
     print("=" * 70)
     print()
-    print("✓ All controls have been tested in a realistic sequence.")
+    print(f"✓ {report['events']} key events sent, {report['skipped']} skipped (not focused)")
+    print(f"✓ Timing: {report['late_mean'] * 1000:.2f}ms late on average, {report['late_max'] * 1000:.2f}ms worst")
     print("✓ If everything worked, your train should now be stopped.")
     print()
 
@@ -212,8 +124,17 @@ def run_driving_sequence():
 # ============================================================================
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play a driving sequence in Railroader")
+    parser.add_argument("sequence", nargs="?", default=SEQUENCE_FILE, help="Sequence file (.toml/.json/.yaml)")
+    parser.add_argument("--fast", action="store_true", help="Validate on a virtual clock instead of driving the game")
+    args = parser.parse_args()
+    
     try:
-        run_driving_sequence()
+        schedule = load_sequence(args.sequence)
+        if args.fast:
+            run_fast(schedule)
+        else:
+            run_driving_sequence(schedule)
     except KeyboardInterrupt:
         print("\n\n⚠ Sequence interrupted by user")
     except Exception as e:
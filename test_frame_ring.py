@@ -0,0 +1,146 @@
+"""
+Shared-memory frame ring test
+A writer and a reader attached to the same small ring. Checks that frames
+come back intact through many laps of the ring, that a reader that falls
+behind gets the newest frame and the right skip count, that a value too
+big for the ring is refused without writing anything, and that a read
+that overlaps a write - the slot half rewritten, or the writer lapping
+the ring mid-copy - is retried instead of returning a torn frame.
+
+    python test_frame_ring.py
+
+Exit status 0 = all checks passed.
+"""
+
+import struct
+import sys
+
+import frame_ring
+from frame_ring import CHANNELS, FrameRing
+
+CAPACITY = 4
+LAPS = 10
+
+
+def frame(n):
+    """Distinct values per frame and channel; BELL missing on odd frames"""
+    values = {channel: n * 10 + i for i, channel in enumerate(CHANNELS) if channel != 'SEQ'}
+    if n % 2:
+        del values['BELL']
+    return values
+
+
+class Interfering:
+    """
+    Stands in for frame_ring.SLOT: the first time the reader copies a slot,
+    `during_copy` runs at that moment (what the writer does while the reader copies)
+    """
+    def __init__(self, slot, during_copy):
+        self.slot = slot
+        self.size = slot.size
+        self.during_copy = during_copy
+        self.copies = 0
+
+    def pack(self, *args):
+        return self.slot.pack(*args)
+
+    def unpack_from(self, buf, offset=0):
+        self.copies += 1
+        if self.copies == 1:
+            return self.during_copy(lambda: self.slot.unpack_from(buf, offset), offset)
+        return self.slot.unpack_from(buf, offset)
+
+
+def main():
+    print("=" * 70)
+    print("FRAME RING TEST")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    writer = FrameRing.create(CAPACITY)
+    reader = FrameRing.attach(writer.name)
+    written = 0
+    try:
+        # Every frame read right after it is written, over many laps
+        wrong = []
+        for _ in range(CAPACITY * LAPS):
+            written += 1
+            writer.write(frame(written))
+            got, skipped = reader.latest()
+            if got != frame(written) or skipped:
+                wrong.append((written, got, skipped))
+        check(not wrong, f"{CAPACITY * LAPS} frames intact through {LAPS} laps of a {CAPACITY}-slot ring", wrong[:2])
+        check(reader.latest() == (None, 0), "Nothing new: (None, 0)")
+
+        # A reader that fell behind more than a lap
+        for _ in range(CAPACITY + 3):
+            written += 1
+            writer.write(frame(written))
+        check(reader.latest() == (frame(written), CAPACITY + 2), "Behind by more than a lap: newest frame, skips counted")
+
+        # Out-of-range value: refused, nothing written
+        try:
+            writer.write({'THROTTLE': 2 ** 31})
+            check(False, "A value over 32 bits is refused")
+        except struct.error:
+            check(True, "A value over 32 bits is refused")
+        check(reader.latest() == (None, 0), "… and nothing was written")
+
+        real_slot = frame_ring.SLOT
+        try:
+            # The writer starts rewriting the slot while the reader copies it
+            written += 1
+            writer.write(frame(written))
+            expected = written
+
+            def half_rewritten(copy, offset):
+                saved = bytes(writer.buf[offset:offset + real_slot.size])
+                frame_ring.SEQ.pack_into(writer.buf, offset, 0)  # As write() does first
+                torn = copy()
+                writer.buf[offset:offset + real_slot.size] = saved  # … and the write completes
+                return torn
+
+            frame_ring.SLOT = Interfering(real_slot, half_rewritten)
+            got = reader.latest()
+            check(got == (frame(expected), 0) and frame_ring.SLOT.copies == 2,
+                  "Slot being rewritten during the copy: read retried", (got, frame_ring.SLOT.copies))
+
+            # The writer laps the ring while the reader copies
+            written += 1
+            writer.write(frame(written))
+            before = reader.last_seq
+
+            def lapped(copy, offset):
+                nonlocal written
+                torn = copy()
+                for _ in range(CAPACITY):
+                    written += 1
+                    writer.write(frame(written))
+                return torn
+
+            frame_ring.SLOT = Interfering(real_slot, lapped)
+            got = reader.latest()
+            check(got == (frame(written), written - before - 1) and frame_ring.SLOT.copies == 2,
+                  "Writer lapped the ring during the copy: newer frame taken instead", got)
+        finally:
+            frame_ring.SLOT = real_slot
+    finally:
+        reader.close()
+        writer.close()
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ The frame ring never hands out a torn or stale frame")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Key audit round-trip test
+Writes a known sequence of key intents, presses and releases through
+KeyAudit on a clock.VirtualClock, reads the log back with the analyzer and
+checks the counts and the latency report - including a wait longer than the
+largest latency bucket, whose quantile must come out as null with the
+overflow counted, never as Infinity in the JSON.
+
+    python test_key_audit.py
+
+Exit status 0 = all checks passed.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import key_audit
+import railroader_controller_pynput as controller
+from clock import VirtualClock
+from key_audit import KeyAudit, LATENCY_BUCKETS
+
+CONTROLS = {'-': 'THROTTLE', '=': 'THROTTLE', 'h': 'WHISTLE'}
+NOTCH_HOLD = 0.15
+
+
+def main():
+    print("=" * 70)
+    print("KEY AUDIT ROUND-TRIP TEST")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    path = os.path.join(tempfile.mkdtemp(), "railroader_keys.bin")
+    clock = VirtualClock()
+    state = controller.ControlState()
+    audit = KeyAudit(path, clock=clock.now)
+    audit.bind(CONTROLS)
+    check(audit.start(), "Log opened")
+    frame = 0
+
+    def at(seconds):
+        clock.advance(seconds - (clock.now() - audit.started_at))
+
+    def notch(key, target, sent):
+        """Throttle intent towards `target`; if sent, the key goes down (see release())"""
+        nonlocal frame
+        frame += 1
+        state.targets['THROTTLE'] = target
+        audit.intent(state, key, NOTCH_HOLD, sent, frame)
+        if sent:
+            audit.press(key, NOTCH_HOLD, frame)
+            state.throttle_step += 1 if key == '-' else -1
+
+    def release(key, pressed_at):
+        audit.release(key, clock.now() - audit.started_at - pressed_at, 'release', frame)
+
+    # Throttle 0 → 3: a notch, two refused while it is held, two more (the last one catches up)
+    at(0.0)
+    notch('-', 3, True)
+    at(0.05)
+    notch('-', 3, False)
+    at(0.1)
+    notch('-', 3, False)
+    at(0.16)
+    release('-', 0.0)  # 10 ms over
+    at(0.2)
+    notch('-', 3, True)
+    at(0.36)
+    release('-', 0.2)  # 10 ms over
+    at(0.4)
+    notch('-', 3, True)
+    at(0.55)
+    release('-', 0.4)
+    # Back one notch 0.6 s later: a reversal
+    at(1.0)
+    notch('=', 2, True)
+    at(1.15)
+    release('=', 1.0)
+    # A notch refused for longer than the largest latency bucket
+    at(3.0)
+    notch('-', 3, False)
+    waited = 3.0 + LATENCY_BUCKETS[-1] + 7.0
+    at(waited)
+    notch('-', 3, True)
+    at(waited + NOTCH_HOLD)
+    release('-', waited)
+    # Whistle held until the watchdog lets go
+    frame += 1
+    state.whistle_type = 'low'
+    state.targets['WHISTLE'] = 'low'
+    audit.intent(state, 'h', None, True, frame)
+    audit.press('h', None, frame)
+    clock.advance(5.0)
+    audit.release('h', 5.0, 'watchdog', frame)
+    audit.stop()
+
+    # A second run appends a session
+    audit = KeyAudit(path, clock=clock.now)
+    audit.bind(CONTROLS)
+    audit.start()
+    audit.intent(state, '=', NOTCH_HOLD, True, 1)
+    audit.press('=', NOTCH_HOLD, 1)
+    clock.advance(NOTCH_HOLD)
+    audit.release('=', NOTCH_HOLD, 'release', 1)
+    audit.stop()
+    check(audit.dropped.value == 0, "No records dropped")
+
+    report = key_audit.analyze(path)
+    throttle = report['controls'].get('THROTTLE', {})
+    whistle = report['controls'].get('WHISTLE', {})
+    check(report['sessions'] == 2 and report['records'] == (1 + 8 + 5 + 5 + 3) + (1 + 3),
+          "Both sessions and every record read back", (report['sessions'], report['records']))
+    check(report['keys'] == 7 and throttle.get('keys') == 6 and whistle.get('keys') == 1,
+          "Keys pressed per control", (report['keys'], throttle.get('keys'), whistle.get('keys')))
+    check(throttle.get('intents') == 9 and throttle.get('refused') == 3,
+          "Throttle intents and refusals", (throttle.get('intents'), throttle.get('refused')))
+    check(throttle.get('reversals') == 1 and throttle.get('max_error') == 3,
+          "One reversal, largest error 3 notches", throttle)
+    check(whistle.get('forced_releases') == 1 and throttle.get('forced_releases') == 0,
+          "Watchdog release counted as forced, on the whistle only", whistle)
+
+    latency = report['latency']
+    wait = latency['key_wait']
+    check(wait['count'] == 2 and wait['p50'] == 0.25 and wait['over'] == 1,
+          "Key wait: 0.15 s in the 0.25 s bucket, one wait over the last bucket", wait)
+    check(wait['p90'] is None and wait['p99'] is None and wait['last_bound'] == LATENCY_BUCKETS[-1],
+          "Overflow quantiles reported as None with the bound they exceeded", wait)
+    catch_up = latency['catch_up']
+    check(catch_up['count'] == 5 and catch_up['p50'] == 0.01 and catch_up['p99'] == 0.5,
+          "Catch-ups: four at once, one after 0.4 s", catch_up)
+    late = latency['release_late']
+    check(late['count'] == 6 and late['over'] == 0 and late['p99'] in (0.01, 0.025),
+          "Hold overrun of the timed holds (10 ms on two of them)", late)
+
+    try:
+        text = json.dumps(report, allow_nan=False)
+        check("Infinity" not in text and "NaN" not in text, "Report is valid JSON without Infinity")
+    except ValueError as e:
+        check(False, "Report is valid JSON without Infinity", e)
+    printed = io.StringIO()
+    with contextlib.redirect_stdout(printed):
+        key_audit.print_report(path, report)
+    check("p90 > " in printed.getvalue(), "Printed report shows the overflow as '> last bound'")
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Key audit logs round-trip through the analyzer")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,7 +32,7 @@ print()
 
 # Test keys
 test_keys = [
-    ('v', 'WHISTLE', 1.0, True),
+    ('h', 'WHISTLE', 1.0, True),
     ('b', 'BELL', 0, False),
     ('j', 'HEADLIGHT UP', 0, False),
     ('-', 'THROTTLE UP', 0, False),
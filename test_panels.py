@@ -0,0 +1,149 @@
+"""
+Multi-panel arbitration test on a virtual clock
+Two panels (cab, brake stand) deliver frames through their real reader
+threads from scripted serial ports; a clock.VirtualClock decides when a
+panel has gone silent. Checks which panel drives each channel under every
+rule, that a channel fails over to the next healthy panel when its panel
+times out or its port breaks, and that it comes back when the panel does.
+
+    python test_panels.py
+
+Exit status 0 = all checks passed.
+"""
+
+import queue
+import sys
+import time
+
+import railroader_controller_pynput as controller
+from clock import VirtualClock
+from event_log import INFO
+from panels import PANEL_TIMEOUT, PanelSet, SerialPanel
+
+DELIVERY_TIMEOUT = 2.0  # Real seconds to wait for a reader thread to take a frame
+
+
+class ScriptedSerial:
+    """Serial port whose lines come from the test; fail() makes the next read raise"""
+    def __init__(self):
+        self.lines = queue.Queue()
+        self.broken = False
+
+    def readline(self):
+        if self.broken:
+            raise OSError("device unplugged")
+        try:
+            return self.lines.get(timeout=0.01)
+        except queue.Empty:
+            return b""
+
+    def close(self):
+        pass
+
+
+class Bench:
+    """Both panels, their ports and the merged view"""
+    def __init__(self, rules):
+        self.clock = VirtualClock(start=100.0)
+        self.ports = {'cab': ScriptedSerial(), 'brakestand': ScriptedSerial()}
+        opened = dict(self.ports)
+
+        def open_connection(port, baud):
+            return opened.pop(port, None)  # Each port opens once: a broken one stays gone
+
+        panels = [SerialPanel(name, name, 9600, open_connection, controller.parse_serial_data, clock=self.clock.now)
+                  for name in ('cab', 'brakestand')]
+        self.panels = {panel.name: panel for panel in panels}
+        self.set = PanelSet(panels, rules, clock=self.clock.now)
+        self.set.start()
+
+    def send(self, name, **values):
+        """Queue one frame on a panel's port and wait until its thread has stored it"""
+        panel = self.panels[name]
+        sequence = panel.sequence
+        self.ports[name].lines.put(";".join(f"{channel}:{value}" for channel, value in values.items()).encode() + b"\n")
+        deadline = time.monotonic() + DELIVERY_TIMEOUT
+        while panel.sequence == sequence and time.monotonic() < deadline:
+            time.sleep(0.001)
+        return panel.sequence != sequence
+
+    def merged(self):
+        self.set._last_sequences = None  # Merge again even if no panel sent anything new
+        return self.set.merged_frame()
+
+    def stop(self):
+        self.set.stop()
+
+
+def main():
+    controller.events.level = INFO
+    print("=" * 70)
+    print("PANEL ARBITRATION TEST (virtual clock)")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    rules = {'TRAINBRAKE': 'brakestand', 'INDBRAKE': 'max', 'WHISTLE': 'min', 'BELL': 'latest'}
+    bench = Bench(rules)
+    try:
+        check(bench.send('cab', THROTTLE=100, TRAINBRAKE=10, INDBRAKE=300, WHISTLE=600, BELL=0)
+              and bench.send('brakestand', THROTTLE=900, TRAINBRAKE=20, INDBRAKE=700, WHISTLE=400, BELL=0),
+              "Both reader threads deliver frames")
+        merged = bench.merged()
+        check(merged is not None and merged['THROTTLE'] == 100, "priority: first panel in PANELS order wins", merged)
+        check(merged['TRAINBRAKE'] == 20, "Owned channel: the owner wins over a higher-priority panel")
+        check(merged['INDBRAKE'] == 700 and merged['WHISTLE'] == 400, "max / min pick the highest / lowest value")
+        check(merged['cab.THROTTLE'] == 100 and merged['brakestand.THROTTLE'] == 900, "Namespaced values kept")
+        check(bench.set.merged_frame() is None, "No new frame: nothing to merge")
+
+        bench.clock.advance(0.1)
+        bench.send('brakestand', BELL=1)
+        check(bench.merged()['BELL'] == 1, "latest: the most recent change wins")
+        bench.clock.advance(0.1)
+        bench.send('cab', THROTTLE=100, TRAINBRAKE=10, INDBRAKE=300, WHISTLE=600, BELL=1)
+        bench.send('cab', THROTTLE=100, TRAINBRAKE=10, INDBRAKE=300, WHISTLE=600, BELL=0)
+        check(bench.merged()['BELL'] == 0, "latest: follows whichever panel changed last")
+
+        # Timeout failover: the cab goes silent, the brake stand keeps sending
+        bench.clock.advance(PANEL_TIMEOUT / 2)
+        bench.send('brakestand', THROTTLE=900, TRAINBRAKE=20, INDBRAKE=700, WHISTLE=400, BELL=0)
+        check(bench.merged()['THROTTLE'] == 100, "Cab still healthy just inside PANEL_TIMEOUT")
+        bench.clock.advance(PANEL_TIMEOUT / 2 + 0.01)
+        bench.send('brakestand', THROTTLE=900, TRAINBRAKE=20, INDBRAKE=700, WHISTLE=400, BELL=0)
+        merged = bench.merged()
+        check(merged['THROTTLE'] == 900 and 'cab.THROTTLE' not in merged,
+              "Silent cab: its channels fail over to the brake stand", merged)
+        bench.send('cab', THROTTLE=150, TRAINBRAKE=10, INDBRAKE=300, WHISTLE=600, BELL=0)
+        check(bench.merged()['THROTTLE'] == 150, "Cab sends again: it drives THROTTLE again")
+
+        # Owner failover: the brake stand's port breaks
+        bench.ports['brakestand'].broken = True
+        deadline = time.monotonic() + DELIVERY_TIMEOUT
+        while bench.panels['brakestand'].connected and time.monotonic() < deadline:
+            time.sleep(0.001)
+        check(not bench.panels['brakestand'].connected, "Broken port: panel disconnected")
+        merged = bench.merged()
+        check(merged['TRAINBRAKE'] == 10, "Owned channel falls back to the next healthy panel", merged)
+        check(bench.panels['brakestand'].reconnects.value >= 1, "Reconnect attempt counted")
+
+        # Nobody healthy
+        bench.clock.advance(PANEL_TIMEOUT + 0.01)
+        check(bench.merged() is None, "No healthy panel: no frame")
+    finally:
+        bench.stop()
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Panels arbitrate and fail over as configured")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
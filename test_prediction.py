@@ -0,0 +1,155 @@
+"""
+Motion prediction test on a virtual clock
+Sweeps the throttle lever through the real control loop at set speeds with
+a long lead and checks the two limits prediction.py promises: a lever
+moving slower than `min_speed` is never led (the keys are exactly those of
+a run without prediction), and a faster one never puts the game more than
+`max_ahead` notches past the lever - then the game walks back to the lever
+when it stops.
+
+    python test_prediction.py
+
+Exit status 0 = all checks passed.
+"""
+
+import sys
+
+import railroader_controller_pynput as controller
+from clock import VirtualClock
+from config import ADC_MAX, CompiledConfig
+from event_log import INFO
+from key_backends import RecordingKeyboard
+from prediction import MotionPredictor
+
+FRAME_INTERVAL = 0.05  # Seconds between panel frames (20 Hz, like the Arduino sketch)
+LEAD = 1.0  # Seconds: long enough that the projection always runs into max_ahead
+MIN_SPEED = 100.0
+SLOW = 60.0  # Counts per second, below MIN_SPEED
+FAST = 200.0  # Counts per second: about 4 notches a second, within what NOTCH_HOLD lets through
+TOP = 600  # The fast sweep turns around mid-range, where overshoot has room to show
+
+
+class Lever:
+    """Source whose THROTTLE follows (time, position) waypoints on the virtual clock"""
+    def __init__(self, clock, waypoints):
+        self.clock = clock
+        self.waypoints = waypoints
+
+    def poll(self):
+        now = self.clock.now()
+        position = self.waypoints[-1][1]
+        for (t0, p0), (t1, p1) in zip(self.waypoints, self.waypoints[1:]):
+            if t0 <= now < t1:
+                position = p0 + (p1 - p0) * (now - t0) / (t1 - t0)
+                break
+        return {'WHISTLE': 512, 'BELL': 0, 'HEADLIGHT': 512, 'CYLINDER': 0,
+                'REVERSER': 512, 'THROTTLE': round(position), 'TRAINBRAKE': 0, 'INDBRAKE': 0}
+
+
+def drive(waypoints, lead, max_ahead, settle=3.0):
+    """
+    Run the control loop along the waypoints (plus `settle` seconds at the last one)
+
+    Returns:
+        (list of (time, target notch, assumed notch) per frame, recorded key events)
+    """
+    clock = VirtualClock()
+    controller.set_clock(clock)
+    keyboard = RecordingKeyboard(clock=clock.now)
+    controller.set_keyboard_backend(keyboard)
+    controller.state = controller.ControlState()
+    controller.digital_inputs.inputs.clear()
+    settings = {section: dict(values) for section, values in controller.active_config.settings.items()}
+    settings['prediction'].update(throttle_lead=lead, max_ahead=max_ahead, min_speed=MIN_SPEED)
+    controller.apply_config(CompiledConfig(settings), switch_input=False)
+    source = Lever(clock, waypoints)
+    ticks = []
+    try:
+        while clock.now() < waypoints[-1][0] + settle:
+            controller.control_tick(source, lambda: True)
+            ticks.append((clock.now(), controller.state.targets['THROTTLE'], controller.state.throttle_step))
+            clock.sleep(FRAME_INTERVAL)
+    finally:
+        controller.whistle.stop()
+        controller.held_keys.release_all('shutdown')
+    return ticks, list(keyboard.events)
+
+
+def past_lever(ticks):
+    """
+    Most notches the game was ever past the lever, in the direction it was
+    last moved (behind the lever doesn't count)
+    """
+    worst = 0
+    direction = 0
+    previous = 0
+    for _, target, assumed in ticks:
+        if assumed != previous:
+            direction = 1 if assumed > previous else -1
+            previous = assumed
+        worst = max(worst, (assumed - target) * direction)
+    return worst
+
+
+def main():
+    controller.LOG_KEYS = False
+    controller.events.level = INFO
+    print("=" * 70)
+    print("MOTION PREDICTION TEST (virtual clock)")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    # The predictor alone
+    clock = VirtualClock()
+    predictor = MotionPredictor(clock.now)
+    projections = []
+    for i in range(20):
+        projections.append(predictor.project('THROTTLE', 100 + round(SLOW * i * FRAME_INTERVAL), LEAD, 0, MIN_SPEED))
+        clock.advance(FRAME_INTERVAL)
+    check(projections == [None] * 20, f"{SLOW:.0f} counts/s: never projected (min_speed {MIN_SPEED:.0f})", projections)
+    predictor.reset()
+    projections = []
+    for i in range(20):
+        projections.append(predictor.project('THROTTLE', 100 + round(FAST * i * FRAME_INTERVAL), LEAD, 0, MIN_SPEED))
+        clock.advance(FRAME_INTERVAL)
+    expected = 100 + round(FAST * 19 * FRAME_INTERVAL) + FAST * LEAD
+    check(projections[0] is None and abs(projections[-1] - expected) <= 1,
+          f"{FAST:.0f} counts/s: projected {LEAD}s ahead", projections[-1])
+
+    # Below min_speed: exactly the keys of a run without prediction
+    sweep = ADC_MAX / SLOW
+    slow = [(0, 0), (1, 0), (1 + sweep, ADC_MAX), (3 + sweep, ADC_MAX), (3 + 2 * sweep, 0)]
+    ticks, keys = drive(slow, LEAD, 2)
+    _, unpredicted = drive(slow, 0.0, 2)
+    check(keys == unpredicted and keys, "Slow lever: same keys at the same times as with prediction off")
+    check(past_lever(ticks) == 0, "Slow lever: the game is never past it", past_lever(ticks))
+
+    # Fast lever: ahead by max_ahead at most, back on the lever once it stops
+    sweep = TOP / FAST
+    fast = [(0, 0), (1, 0), (1 + sweep, TOP), (4 + sweep, TOP), (4 + 2 * sweep, 0)]
+    for max_ahead in (1, 3):
+        ticks, _ = drive(fast, LEAD, max_ahead)
+        worst = past_lever(ticks)
+        check(worst == max_ahead, f"max_ahead {max_ahead}: the game runs {worst} notch(es) past a fast lever, never more")
+        stopped = [(target, assumed) for at, target, assumed in ticks if 3.5 + sweep <= at < 4 + sweep]
+        check(stopped and all(target == assumed for target, assumed in stopped),
+              f"max_ahead {max_ahead}: walked back onto the stopped lever", stopped[:1])
+        check(ticks[-1][1] == ticks[-1][2] == 0, f"max_ahead {max_ahead}: back at notch 0 after the return sweep",
+              ticks[-1])
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Prediction leads only moving levers, by max_ahead at most")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
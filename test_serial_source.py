@@ -0,0 +1,95 @@
+"""
+Serial source drain test
+Queues several frames on a scripted serial port, as a panel sending faster
+than the control loop ticks leaves them in the OS buffer, and checks that
+one poll() returns the newest frame and leaves nothing waiting, that the
+frames it passed over are counted as drops, that a line that doesn't parse
+doesn't hide the good frame before it, that an empty buffer gives None,
+and that wait() drains the same way.
+
+    python test_serial_source.py
+
+Exit status 0 = all checks passed.
+"""
+
+import sys
+
+import railroader_controller_pynput as controller
+from input_sources import DROPS, SerialSource
+
+
+class BufferedSerial:
+    """Serial port over a byte buffer: in_waiting and readline() as in pyserial"""
+    def __init__(self):
+        self.buffer = b""
+        self.timeout = None
+
+    def send(self, *lines):
+        self.buffer += b"".join(line.encode() + b"\r\n" for line in lines)
+
+    @property
+    def in_waiting(self):
+        return len(self.buffer)
+
+    def readline(self):
+        line, newline, self.buffer = self.buffer.partition(b"\n")
+        return line + newline
+
+    def close(self):
+        pass
+
+
+def frame(throttle):
+    return f"WHISTLE:512;BELL:0;HEADLIGHT:512;CYLINDER:0;REVERSER:512;THROTTLE:{throttle};TRAINBRAKE:0;INDBRAKE:0"
+
+
+def main():
+    controller.LOG_KEYS = False
+    print("=" * 70)
+    print("SERIAL SOURCE DRAIN TEST")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    port = BufferedSerial()
+    source = SerialSource("test", 9600, None, controller.parse_serial_data, ser=port)
+    check(source.open() and source.poll() is None, "Nothing waiting: None")
+
+    drops = DROPS.value
+    port.send(*(frame(throttle) for throttle in (100, 200, 300, 400, 500)))
+    got = source.poll()
+    check(got is not None and got['THROTTLE'] == 500, "Five frames waiting: the newest one returned",
+          got and got['THROTTLE'])
+    check(port.in_waiting == 0, "Buffer drained", port.in_waiting)
+    check(DROPS.value - drops == 4, "The four older frames counted as drops", DROPS.value - drops)
+    check(source.poll() is None, "Next poll: nothing new")
+
+    port.send(frame(600), frame(700), "THROTTLE:garbage")
+    got = source.poll()
+    check(got is not None and got['THROTTLE'] == 700 and port.in_waiting == 0,
+          "A bad last line: the newest good frame returned", got and got['THROTTLE'])
+
+    port.send(frame(800))
+    got = source.poll()
+    check(got is not None and got['THROTTLE'] == 800, "A single frame still comes through")
+
+    port.send(frame(900), frame(950), frame(1000))
+    got = source.wait(0.1)
+    check(got is not None and got['THROTTLE'] == 1000 and port.in_waiting == 0,
+          "wait(): the frames right behind the first are taken too", got and got['THROTTLE'])
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Every poll acts on the newest frame")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Live state export round-trip test
+Publishes ControlState snapshots with StateExport and reads them back with
+StateReader from the same file. Checks that every field comes back as
+written, that an unchanged state doesn't rewrite the file, that absurd
+values are clamped instead of raising, that a read which finds seq odd or
+changing - a write in progress - is retried rather than returning a mix of
+two snapshots, and that seq keeps growing across a restart.
+
+    python test_state_export.py
+
+Exit status 0 = all checks passed.
+"""
+
+import os
+import sys
+import tempfile
+
+import railroader_controller_pynput as controller
+import state_export
+from state_export import INT32_MAX, INT32_MIN, SEQ, SEQ_OFFSET, StateExport, StateReader
+
+
+class Interfering(StateReader):
+    """
+    Reader whose seq() calls are counted: before call n, actions[n] runs
+    (what the writer does at that moment of the read)
+    """
+    def __init__(self, path, actions):
+        super().__init__(path)
+        self.actions = actions
+        self.calls = 0
+
+    def seq(self):
+        self.calls += 1
+        action = self.actions.get(self.calls)
+        if action is not None:
+            action()
+        return super().seq()
+
+
+def cab_state(throttle):
+    state = controller.ControlState()
+    state.focused = True
+    state.whistle_type = 'high'
+    state.throttle_step = throttle
+    state.reverser_step = -2
+    state.raw.update(WHISTLE=900, BELL=1, THROTTLE=throttle * 51, REVERSER=100)
+    state.targets.update(WHISTLE='high', THROTTLE=throttle + 1, REVERSER=-2)
+    return state
+
+
+def main():
+    print("=" * 70)
+    print("STATE EXPORT ROUND-TRIP TEST")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text, detail=""):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}" + (f" - {detail}" if detail and not ok else ""))
+        if not ok:
+            failures += 1
+
+    path = os.path.join(tempfile.mkdtemp(), "railroader_state.bin")
+    writer = StateExport(path)
+    check(writer.open(), "Export file created")
+    reader = StateReader(path)
+    try:
+        snapshot = reader.read()
+        check(snapshot is not None and not snapshot['running'] and snapshot['seq'] % 2 == 0,
+              "Before the first publish: not running, seq even", snapshot)
+
+        # Every field round-trips
+        check(writer.publish(cab_state(5), connected=True), "Changed state published")
+        snapshot = reader.read()
+        channels = snapshot['channels']
+        check(snapshot['running'] and snapshot['focused'] and snapshot['connected'], "Status flags read back")
+        check(channels['THROTTLE'] == {'raw': 255, 'target': 6, 'assumed': 5}
+              and channels['REVERSER'] == {'raw': 100, 'target': -2, 'assumed': -2},
+              "Raw, target and assumed read back", channels)
+        check(channels['WHISTLE'] == {'raw': 900, 'target': 1, 'assumed': 1}, "Whistle 'high' exported as 1",
+              channels['WHISTLE'])
+        check(channels['BELL'] == {'raw': 1, 'target': None, 'assumed': None}
+              and channels['TRAINBRAKE'] == {'raw': None, 'target': None, 'assumed': 0},
+              "Absent values read back as None", (channels['BELL'], channels['TRAINBRAKE']))
+        seq = reader.seq()
+        check(not writer.publish(cab_state(5), connected=True) and reader.seq() == seq, "Unchanged state: not rewritten")
+
+        # Out-of-range values are clamped, not raised from the control loop
+        state = cab_state(5)
+        state.raw['THROTTLE'] = 2 ** 40
+        state.raw['REVERSER'] = -2 ** 40
+        try:
+            writer.publish(state, connected=True)
+            channels = reader.read()['channels']
+            check(channels['THROTTLE']['raw'] == INT32_MAX and channels['REVERSER']['raw'] == INT32_MIN,
+                  "Values beyond 32 bits clamped", (channels['THROTTLE'], channels['REVERSER']))
+        except Exception as e:
+            check(False, "Values beyond 32 bits clamped", e)
+
+        # Reads during a write
+        def start_write():
+            SEQ.pack_into(writer.map, SEQ_OFFSET, writer._seq + 1)  # As _write() does first
+
+        # seq odd when the read starts: retried until the write finished
+        odd = Interfering(path, {1: start_write, 3: lambda: writer.publish(cab_state(8), connected=True)})
+        snapshot = odd.read()
+        check(snapshot is not None and snapshot['channels']['THROTTLE']['assumed'] == 8 and snapshot['seq'] % 2 == 0
+              and odd.calls == 4, "seq odd: read retried until the write finished, then the new snapshot",
+              snapshot and (snapshot['channels']['THROTTLE'], odd.calls))
+        odd.close()
+
+        # The writer rewrites the snapshot while the reader copies it
+        changing = Interfering(path, {2: lambda: writer.publish(cab_state(9), connected=True)})
+        snapshot = changing.read()
+        check(snapshot is not None and snapshot['channels']['THROTTLE']['assumed'] == 9 and changing.calls == 4,
+              "seq changed during the copy: read retried, the newer snapshot returned",
+              snapshot and (snapshot['channels']['THROTTLE'], changing.calls))
+        changing.close()
+
+        # A writer that never finishes: the reader gives up instead of returning a torn snapshot
+        seq = writer._seq
+        SEQ.pack_into(writer.map, SEQ_OFFSET, seq + 1)
+        check(reader.read() is None, f"seq stuck odd: None after {state_export.READ_RETRIES} retries")
+        SEQ.pack_into(writer.map, SEQ_OFFSET, seq)
+
+        # Shutdown and restart
+        seq = reader.seq()
+        writer.close()
+        snapshot = reader.read()
+        check(snapshot is not None and not snapshot['running'] and snapshot['seq'] > seq, "Closed: not running")
+        seq = snapshot['seq']
+        writer = StateExport(path)
+        writer.open()
+        writer.publish(cab_state(1), connected=False)
+        snapshot = reader.read()
+        check(snapshot['seq'] > seq and snapshot['seq'] % 2 == 0 and snapshot['running'] and not snapshot['connected'],
+              "Restarted: seq carries on from the previous run", (seq, snapshot['seq']))
+    finally:
+        reader.close()
+        writer.close()
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ Snapshots round-trip and torn reads are retried")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+UDP input source test on the loopback interface
+Sends sequenced datagrams (ASCII and binary) to a UdpSource on 127.0.0.1
+and checks what it accepts: frames in order, stale and reordered packets
+dropped, frames with a value beyond ADC_MAX dropped, sequence numbers
+wrapping at 2^32, lost packets counted, and the panel reported gone (and
+its stream restartable) after STREAM_RESET_TIMEOUT of silence. Arrival
+times come from a manual clock, so the timeout takes no real time.
+
+    python test_udp_source.py
+
+Exit status 0 = all checks passed.
+"""
+
+import socket
+import sys
+
+import railroader_controller_pynput as controller
+from config import ADC_MAX
+from input_sources import UdpSource
+from udp_input import SEQ_MODULO, STREAM_RESET_TIMEOUT, encode_ascii, encode_binary
+
+DELIVERY_TIMEOUT = 1.0  # Real seconds to wait for a datagram on loopback
+
+
+class ManualClock:
+    """Arrival-time clock that only moves when the test says so"""
+    def __init__(self):
+        self.time = 100.0
+
+    def now(self):
+        return self.time
+
+
+class Panel:
+    """Sends frames to the source under test"""
+    def __init__(self, address):
+        self.address = address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, seq, throttle, binary=False):
+        encode = encode_binary if binary else encode_ascii
+        self.sock.sendto(encode(seq, {'THROTTLE': throttle, 'BELL': 0}, 0), self.address)
+
+    def close(self):
+        self.sock.close()
+
+
+def receive(source, timeout=DELIVERY_TIMEOUT):
+    """THROTTLE of the frame the source hands out next, or None if it accepts nothing"""
+    frame = source.wait(timeout)
+    return None if frame is None else frame['THROTTLE']
+
+
+def deliver(panel, source, seq, throttle, binary=False):
+    """Send one frame and return what the source made of it"""
+    panel.send(seq, throttle, binary)
+    return receive(source)
+
+
+def counters(source):
+    stats = source.stats()['udp']
+    return stats['packets'], stats['lost'], stats['stale']
+
+
+def main():
+    controller.events.level = controller.INFO
+    print("=" * 70)
+    print("UDP INPUT SOURCE TEST (loopback)")
+    print("=" * 70)
+    failures = 0
+
+    def check(ok, text):
+        nonlocal failures
+        print(f"{'✓' if ok else '✗'} {text}")
+        if not ok:
+            failures += 1
+
+    clock = ManualClock()
+    source = UdpSource(0, "127.0.0.1", controller.parse_serial_data, clock=clock.now)
+    if not source.open():
+        print("✗ Could not open a UDP socket on 127.0.0.1")
+        return 1
+    panel = Panel(source.udp.address)
+    try:
+        check(not source.connected(), "Not connected before the first frame")
+
+        # In order, ASCII and binary alike
+        packets, lost, stale = counters(source)
+        for seq in range(1, 6):
+            throttle = deliver(panel, source, seq, 100 + seq, binary=seq % 2 == 0)
+            if throttle != 100 + seq:
+                check(False, f"Frame {seq} accepted in order (got {throttle})")
+                break
+        else:
+            check(True, "Frames 1-5 accepted in order (ASCII and binary)")
+        check(counters(source) == (packets + 5, lost, stale), "No loss or stale frames counted")
+        check(source.connected(), "Connected while frames arrive")
+
+        # Stale and reordered packets are dropped
+        packets, lost, stale = counters(source)
+        check(deliver(panel, source, 5, 900) is None, "Duplicate frame dropped")
+        check(deliver(panel, source, 3, 901) is None, "Late frame dropped")
+        check(deliver(panel, source, 7, 107) == 107, "Frame 7 accepted after a gap")
+        check(deliver(panel, source, 6, 906) is None, "Reordered frame 6 dropped")
+        check(counters(source) == (packets + 1, lost + 1, stale + 3),
+              "Three stale frames and one lost frame (6) counted")
+
+        # Loss counter
+        packets, lost, stale = counters(source)
+        check(deliver(panel, source, 10, 110) == 110 and deliver(panel, source, 20, 120) == 120,
+              "Frames after gaps accepted")
+        check(counters(source) == (packets + 2, lost + 11, stale), "11 missing frames counted as lost")
+
+        # Several waiting: the newest wins, the older ones still count as received
+        packets, lost, stale = counters(source)
+        for seq in (21, 22, 23):
+            panel.send(seq, 100 + seq)
+        newest = None
+        while counters(source)[0] < packets + 3:
+            throttle = receive(source)
+            if throttle is None:
+                break
+            newest = throttle
+        check(newest == 123 and counters(source) == (packets + 3, lost, stale), "Newest of several waiting frames used")
+
+        # A value beyond ADC_MAX: the frame is dropped as invalid, binary like ASCII
+        invalid = source.stats()['udp']['invalid']
+        check(deliver(panel, source, 24, ADC_MAX + 1, binary=True) is None, "Binary frame out of range dropped")
+        check(deliver(panel, source, 25, 65535, binary=False) is None, "ASCII frame out of range dropped")
+        check(source.stats()['udp']['invalid'] == invalid + 2, "Both counted as invalid")
+        check(deliver(panel, source, 26, ADC_MAX, binary=True) == ADC_MAX, "ADC_MAX itself accepted")
+
+        # Sequence wraparound at 2^32
+        clock.time += STREAM_RESET_TIMEOUT  # New stream near the top of the range
+        packets, lost, stale = counters(source)
+        wrapped = [deliver(panel, source, seq, value, binary=value % 2 == 0)
+                   for value, seq in enumerate((SEQ_MODULO - 2, SEQ_MODULO - 1, 0, 1))]
+        check(wrapped == [0, 1, 2, 3], "Sequence wraps from 2^32-1 to 0")
+        check(counters(source) == (packets + 4, lost, stale), "Wraparound counted as neither lost nor stale")
+        check(deliver(panel, source, SEQ_MODULO - 1, 999) is None, "Frame from before the wrap dropped")
+
+        # Disconnect timeout
+        clock.time += STREAM_RESET_TIMEOUT - 0.5
+        check(source.connected(), "Still connected just before the timeout")
+        clock.time += 0.5
+        check(not source.connected(), f"Disconnected after {STREAM_RESET_TIMEOUT:.0f}s of silence")
+        # The panel restarted: its sequence begins again below the last one seen
+        check(deliver(panel, source, 0, 501) == 501, "Restarted panel's frame accepted after the timeout")
+        check(source.connected(), "Connected again")
+    finally:
+        panel.close()
+        source.close()
+
+    print("=" * 70)
+    if failures:
+        print(f"✗ {failures} check(s) failed")
+        return 1
+    print("✓ UDP source accepts, drops and counts frames as expected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
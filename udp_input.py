@@ -0,0 +1,306 @@
+"""
+UDP input for network-attached control panels (ESP32, tablet, ...)
+
+Accepts the same channel frames as the serial panel, as one datagram each:
+
+ASCII (same as serial, plus a sequence number and optional sender time in ms):
+    SEQ:42;TS:123456;WHISTLE:512;BELL:0;THROTTLE:200;...
+
+Binary (compact, little-endian):
+    header: b'RR', version (u8), seq (u32), sender time ms (u32), count (u8)
+    then count × (channel id (u8), value (u16, 0 … ADC_MAX)), ids from CHANNEL_IDS
+
+Packets with a sequence number at or below the newest one seen are stale
+or reordered and are discarded. When several packets are waiting, only the
+newest is used (latest wins). Loss and jitter are tracked.
+
+Try it on one machine:
+    python udp_input.py listen              # Terminal 1
+    python udp_input.py send --binary       # Terminal 2
+"""
+
+import argparse
+import random
+import socket
+import struct
+import time
+
+import metrics
+from config import ADC_MAX
+
+DEFAULT_PORT = 5005
+MAGIC = b'RR'
+VERSION = 1
+HEADER = struct.Struct('<2sBIIB')
+CHANNEL = struct.Struct('<BH')
+CHANNEL_IDS = ['WHISTLE', 'BELL', 'HEADLIGHT', 'CYLINDER', 'REVERSER', 'THROTTLE', 'TRAINBRAKE', 'INDBRAKE']
+CHANNEL_NUMBERS = {name: number for number, name in enumerate(CHANNEL_IDS)}
+
+SEQ_MODULO = 2 ** 32
+STREAM_RESET_TIMEOUT = 2.0  # Seconds of silence after which any sequence number starts a new stream
+
+
+# ============================================================================
+# PACKET FORMAT
+# ============================================================================
+
+def encode_binary(seq, data, sender_ms=0):
+    """Build a binary packet from a channel dict"""
+    channels = [(CHANNEL_NUMBERS[name], value) for name, value in data.items() if name in CHANNEL_NUMBERS]
+    packet = HEADER.pack(MAGIC, VERSION, seq % SEQ_MODULO, sender_ms % SEQ_MODULO, len(channels))
+    return packet + b''.join(CHANNEL.pack(number, max(0, min(65535, value))) for number, value in channels)
+
+
+def encode_ascii(seq, data, sender_ms=None):
+    """Build an ASCII packet from a channel dict"""
+    parts = [f"SEQ:{seq % SEQ_MODULO}"]
+    if sender_ms is not None:
+        parts.append(f"TS:{sender_ms % SEQ_MODULO}")
+    parts.extend(f"{name}:{value}" for name, value in data.items())
+    return ";".join(parts).encode('ascii')
+
+
+def decode_packet(packet, parse_ascii):
+    """
+    Decode one datagram
+
+    Args:
+        packet: Raw bytes
+        parse_ascii: Callable(str) → dict or None (the serial frame parser)
+
+    Returns:
+        (seq or None, sender_ms or None, data dict), or None if the packet is invalid
+    """
+    if packet[:2] == MAGIC:
+        if len(packet) < HEADER.size:
+            return None
+        magic, version, seq, sender_ms, count = HEADER.unpack_from(packet)
+        if version != VERSION or len(packet) != HEADER.size + count * CHANNEL.size:
+            return None
+        data = {}
+        for i in range(count):
+            number, value = CHANNEL.unpack_from(packet, HEADER.size + i * CHANNEL.size)
+            if value > ADC_MAX:
+                return None  # Dropped whole, as parse_ascii drops an ASCII frame out of range
+            if number < len(CHANNEL_IDS):
+                data[CHANNEL_IDS[number]] = value
+        return seq, sender_ms, data
+
+    try:
+        text = packet.decode('ascii')
+    except UnicodeDecodeError:
+        return None
+    data = parse_ascii(text)
+    if data is None:
+        return None
+    seq = data.pop('SEQ', None)
+    sender_ms = data.pop('TS', None)
+    return seq, sender_ms, data
+
+
+def seq_newer(seq, last):
+    """True if seq comes after last (serial number arithmetic, wraps at 2^32)"""
+    diff = (seq - last) % SEQ_MODULO
+    return 0 < diff < SEQ_MODULO // 2
+
+
+# ============================================================================
+# RECEIVER
+# ============================================================================
+
+class UdpInput:
+    """Non-blocking UDP frame receiver with stale-packet rejection and loss/jitter stats"""
+    def __init__(self, port=DEFAULT_PORT, bind="0.0.0.0", parse_ascii=None, clock=time.monotonic):
+        """
+        Args:
+            port: UDP port to listen on
+            bind: Address to bind ("0.0.0.0" = all interfaces, "127.0.0.1" = local only)
+            parse_ascii: Parser for ASCII frames (the controller's parse_serial_data)
+            clock: Time source in seconds for arrival times
+        """
+        if parse_ascii is None:
+            raise ValueError("parse_ascii is required")
+        self.parse_ascii = parse_ascii
+        self.clock = clock
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((bind, port))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+
+        self.last_seq = None
+        self.last_packet_time = None  # Arrival of the newest accepted frame
+        self.jitter = 0.0  # Seconds, RFC 3550 style running estimate
+        self._last_transit = None
+        self._last_arrival = None
+        self._mean_interval = None
+
+        self.packets = metrics.counter('udp_packets', "UDP frames received")
+        self.lost = metrics.counter('udp_lost', "UDP frames missing from the sequence")
+        self.stale = metrics.counter('udp_stale', "UDP frames discarded as stale or reordered")
+        self.invalid = metrics.counter('udp_invalid', "UDP datagrams that could not be decoded")
+
+    def close(self):
+        self.sock.close()
+
+    def poll(self):
+        """
+        Drain every waiting datagram and return the newest frame
+
+        Returns:
+            Dict with control values, or None if nothing new arrived
+        """
+        newest = None
+        while True:
+            try:
+                packet = self.sock.recv(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break  # e.g. ICMP port unreachable on Windows
+            frame = self._accept(packet)
+            if frame is not None:
+                newest = frame
+        return newest
+
+    def _accept(self, packet):
+        """Validate ordering, update stats; returns the data dict or None"""
+        decoded = decode_packet(packet, self.parse_ascii)
+        if decoded is None:
+            self.invalid.inc()
+            return None
+        seq, sender_ms, data = decoded
+        now = self.clock()
+
+        if seq is not None:
+            if self.last_seq is not None and now - self.last_packet_time < STREAM_RESET_TIMEOUT:
+                if not seq_newer(seq, self.last_seq):
+                    self.stale.inc()
+                    return None
+                gap = (seq - self.last_seq) % SEQ_MODULO
+                if gap > 1:
+                    self.lost.inc(gap - 1)
+            self.last_seq = seq
+
+        self._update_jitter(now, sender_ms)
+        self.last_packet_time = now
+        self.packets.inc()
+        return data
+
+    def _update_jitter(self, arrival, sender_ms):
+        """
+        RFC 3550 interarrival jitter when the sender supplies timestamps,
+        otherwise deviation of the arrival interval from its running mean
+        """
+        if sender_ms is not None:
+            transit = arrival - sender_ms / 1000.0
+            if self._last_transit is not None:
+                self.jitter += (abs(transit - self._last_transit) - self.jitter) / 16
+            self._last_transit = transit
+        elif self._last_arrival is not None:
+            interval = arrival - self._last_arrival
+            if self._mean_interval is None:
+                self._mean_interval = interval
+            self._mean_interval += (interval - self._mean_interval) / 16
+            self.jitter += (abs(interval - self._mean_interval) - self.jitter) / 16
+        self._last_arrival = arrival
+
+    def silent(self):
+        """True if no frame arrived for STREAM_RESET_TIMEOUT (or none yet)"""
+        return self.last_packet_time is None or self.clock() - self.last_packet_time >= STREAM_RESET_TIMEOUT
+
+    def stats(self):
+        """Dict with packets, lost, stale, invalid, loss ratio and jitter (ms)"""
+        received = self.packets.value
+        lost = self.lost.value
+        return {
+            'packets': received,
+            'lost': lost,
+            'stale': self.stale.value,
+            'invalid': self.invalid.value,
+            'loss': lost / (received + lost) if received + lost else 0.0,
+            'jitter_ms': self.jitter * 1000.0,
+        }
+
+
+# ============================================================================
+# LOOPBACK TEST TOOL
+# ============================================================================
+
+def _simple_parse(text):
+    """Minimal ASCII parser for the standalone tool (same format as the controller)"""
+    try:
+        return {key.strip(): int(value) for key, value in (pair.split(':') for pair in text.strip().split(';'))}
+    except ValueError:
+        return None
+
+
+def run_sender(host, port, rate, binary, drop, shuffle):
+    """Send sweeping test frames, optionally dropping / reordering some"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    interval = 1.0 / rate
+    seq = 0
+    held_back = None
+    start = time.monotonic()
+    print(f"Sending {'binary' if binary else 'ASCII'} frames to {host}:{port} at {rate} Hz (Ctrl+C to stop)")
+    try:
+        while True:
+            elapsed = time.monotonic() - start
+            throttle = int((elapsed * 100) % 1024)
+            data = {'WHISTLE': 512, 'BELL': 0, 'HEADLIGHT': 512, 'CYLINDER': 0, 'REVERSER': 800,
+                    'THROTTLE': throttle, 'TRAINBRAKE': 0, 'INDBRAKE': 0}
+            sender_ms = int(elapsed * 1000)
+            packet = encode_binary(seq, data, sender_ms) if binary else encode_ascii(seq, data, sender_ms)
+            seq += 1
+            if random.random() >= drop:
+                if shuffle and held_back is None and random.random() < shuffle:
+                    held_back = packet  # Send it after the next one
+                else:
+                    sock.sendto(packet, (host, port))
+                    if held_back is not None:
+                        sock.sendto(held_back, (host, port))
+                        held_back = None
+            time.sleep(max(0.0, start + seq * interval - time.monotonic()))
+    except KeyboardInterrupt:
+        print(f"\nSent {seq} frames")
+
+
+def run_listener(port, bind):
+    """Print received frames and stats once per second"""
+    udp = UdpInput(port, bind, _simple_parse)
+    print(f"Listening on {udp.address[0]}:{udp.address[1]} (Ctrl+C to stop)")
+    last_print = time.monotonic()
+    latest = None
+    try:
+        while True:
+            frame = udp.poll()
+            if frame is not None:
+                latest = frame
+            if time.monotonic() - last_print >= 1.0:
+                s = udp.stats()
+                print(f"packets={s['packets']} lost={s['lost']} stale={s['stale']} "
+                      f"loss={s['loss']:.1%} jitter={s['jitter_ms']:.2f}ms latest={latest}")
+                last_print = time.monotonic()
+            time.sleep(0.005)
+    except KeyboardInterrupt:
+        udp.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UDP control panel test tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+    listen = sub.add_parser("listen", help="Receive frames and print stats")
+    listen.add_argument("--port", type=int, default=DEFAULT_PORT)
+    listen.add_argument("--bind", default="127.0.0.1")
+    send = sub.add_parser("send", help="Send test frames")
+    send.add_argument("--host", default="127.0.0.1")
+    send.add_argument("--port", type=int, default=DEFAULT_PORT)
+    send.add_argument("--rate", type=float, default=50)
+    send.add_argument("--binary", action="store_true", help="Use the compact binary format")
+    send.add_argument("--drop", type=float, default=0.0, help="Fraction of packets to drop (0-1)")
+    send.add_argument("--shuffle", type=float, default=0.0, help="Fraction of packets to reorder (0-1)")
+    args = parser.parse_args()
+
+    if args.command == "listen":
+        run_listener(args.port, args.bind)
+    else:
+        run_sender(args.host, args.port, args.rate, args.binary, args.drop, args.shuffle)
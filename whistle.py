@@ -0,0 +1,250 @@
+"""
+Continuous whistle for the Railroader controller
+Keeps the whistle sounding for as long as the lever is pulled instead of
+sending a single tap.
+
+Modes:
+    'tap'    One H / Shift+H tap when the lever leaves the deadzone (old behaviour, handled by the controller)
+    'hold'   Hold H (or Shift+H) down while the lever is out of the deadzone
+    'pulse'  Pulse H at a fixed rate; the fraction of each period the key is
+             down (duty cycle) grows with how far the lever is pulled, from
+             `min_duty` just outside the deadzone to continuous at full pull
+
+Pulses run on the TimerScheduler, never as sleeps in the control loop.
+All presses go through the HeldKeyRegistry, so shutdown, focus loss and the
+watchdog release the whistle like any other key.
+
+The high whistle holds Shift only around its own key-down: each pulse
+presses Shift with H and lifts it once H is up. Keys other controls ask for
+while Shift is down would arrive as Shift+key, so they wait in a queue
+(defer()) and go out as soon as Shift is up - in the gap after the pulse,
+or, for a steady hold, by lifting the whistle for one update.
+"""
+
+import threading
+
+import metrics
+from held_keys import REPRESS_GAP
+
+WHISTLE_MODES = ('tap', 'hold', 'pulse')
+CONTINUOUS_DUTY = 0.95  # Duty cycles above this are played as a steady hold
+
+
+class WhistleDriver:
+    """Drives the whistle key(s) from the lever's pitch and intensity"""
+    def __init__(self, held_keys, scheduler, modifier):
+        """
+        Args:
+            held_keys: HeldKeyRegistry
+            scheduler: TimerScheduler
+            modifier: Key held for the high whistle (Key.shift)
+        """
+        self.held_keys = held_keys
+        self.scheduler = scheduler
+        self.modifier = modifier
+        self.pitch = None  # 'low', 'high' or None
+        self.key = None
+        self.duty = 1.0
+        self.rate = None
+        self.waiting = []  # (key, hold) asked for while the modifier was down, oldest first
+        self._timer = None
+        self._shift_timer = None
+        self._lock = threading.Lock()
+        self.keys = metrics.counter('keys', "Key presses injected")
+
+    def update(self, pitch, intensity, key, mode='hold', rate=5.0, min_duty=0.2):
+        """
+        Called every frame with the lever position
+
+        Args:
+            pitch: 'low', 'high' or None (in deadzone)
+            intensity: 0.0 (edge of deadzone) … 1.0 (fully pulled)
+            key: Whistle key ('h')
+            mode: 'hold' or 'pulse'
+            rate: Pulses per second (pulse mode)
+            min_duty: Duty cycle just outside the deadzone (pulse mode)
+        """
+        # acquire/release rather than `with`: the with statement allocates a
+        # bound __exit__ method, and this runs on every frame
+        self._lock.acquire()
+        try:
+            self._update(pitch, intensity, key, mode, rate, min_duty)
+        finally:
+            self._lock.release()
+
+    def _update(self, pitch, intensity, key, mode, rate, min_duty):
+        if pitch != self.pitch or key != self.key:
+            self._stop()
+            self.pitch, self.key = pitch, key
+        if self.waiting and not self.held_keys.is_held(self.modifier):
+            self._flush()  # Left waiting by a modifier that is up now
+        if pitch is None:
+            return
+
+        intensity = 0.0 if intensity < 0.0 else 1.0 if intensity > 1.0 else intensity
+        duty = min_duty + (1.0 - min_duty) * intensity
+        if mode == 'hold' or duty >= CONTINUOUS_DUTY:
+            self._cancel_timer()
+            entry = self.held_keys.held.get(key)
+            if entry is not None:
+                if entry[1] is None and pitch == 'high' and self.waiting and self._due():
+                    # Lift the whistle so the waiting keys go out without Shift;
+                    # it sounds again on the next update
+                    self._lift()
+                return  # Held, or a pulse is still down (hold once it is released)
+            # (Re)press if it is not down, e.g. after a focus-loss release
+            if self._press(key, None):
+                self.keys.inc()
+            return
+
+        # Pulse mode: a continuous hold left over from full pull ends here
+        entry = self.held_keys.held.get(key)
+        if entry is not None and entry[1] is None:
+            self._lift()
+        self.duty = duty
+        if self._timer is None or rate != self.rate:
+            self._cancel_timer()
+            self.rate = rate
+            self._timer = self.scheduler.call_every(1.0 / rate, self._pulse)
+            self._send_pulse()  # First pulse now, not one period later
+
+    def _press(self, key, hold):
+        """Press the whistle key, with the modifier for the high whistle"""
+        high = self.pitch == 'high'
+        if high and not self.held_keys.is_held(self.modifier):
+            if not self.held_keys.press(self.modifier):
+                return False  # Never play a high whistle without its modifier (it would sound low)
+            self.keys.inc()
+        if self.held_keys.press(key, hold):
+            return True
+        if high:
+            self._lift()
+        return False
+
+    def _lift(self):
+        """Release the whistle key and modifier, then send what waited for them"""
+        if self._shift_timer is not None:
+            self._shift_timer.cancel()
+            self._shift_timer = None
+        if self.key is not None:
+            self.held_keys.release(self.key)
+        self.held_keys.release(self.modifier)
+        if self.waiting:
+            self._flush()
+
+    def _pulse(self):
+        """Scheduler callback: one pulse, `duty` of the period long"""
+        with self._lock:
+            self._send_pulse()
+
+    def _send_pulse(self):
+        if self.pitch is None or self.rate is None:
+            return
+        period = 1.0 / self.rate
+        # Leave the key up long enough between pulses for the game to see the gap
+        hold = min(self.duty * period, period - 2 * REPRESS_GAP)
+        if hold > 0 and self._press(self.key, hold):
+            self.keys.inc()
+            if self.pitch == 'high':
+                # Scheduled after the key's own release, so Shift comes up right behind it
+                self._shift_timer = self.scheduler.call_later(hold, self._shift_up)
+
+    def _shift_up(self):
+        """Scheduler callback: a high pulse is over, lift the modifier for the gap"""
+        with self._lock:
+            self._shift_timer = None
+            if self.key is None or not self.held_keys.is_held(self.key):
+                self._lift()
+
+    # ------------------------------------------------------------ other keys
+
+    def defer(self, key, hold):
+        """
+        Queue a key another control asked for while the whistle holds the modifier
+
+        Args:
+            key: Key to press once the modifier is up
+            hold: As for HeldKeyRegistry.press
+
+        Returns:
+            True if queued; False if the modifier isn't the whistle's or the
+            key is already waiting (nothing queued, ask again later)
+        """
+        with self._lock:
+            if self.pitch != 'high' or not self.held_keys.is_held(self.modifier):
+                return False
+            i = 0
+            while i < len(self.waiting):
+                if self.waiting[i][0] == key:
+                    return False
+                i += 1
+            self.waiting.append((key, hold))
+            return True
+
+    def discard(self, key):
+        """Drop a key from the queue (it was released before it went out)"""
+        with self._lock:
+            self.waiting = [entry for entry in self.waiting if entry[0] != key]
+
+    def tap_shifted(self, key):
+        """
+        Tap `key` under the high whistle's modifier (a Shift+key combination
+        asked for while Shift is down anyway)
+
+        Returns:
+            False if the whistle doesn't hold the modifier or the key isn't ready
+        """
+        with self._lock:
+            if not self.held_keys.is_held(self.modifier) or not self.held_keys.press(key, 0):
+                return False
+            self.keys.inc()
+            return True
+
+    def _due(self):
+        """True if a waiting key could go out now"""
+        i = 0
+        while i < len(self.waiting):
+            if self.held_keys.ready(self.waiting[i][0]):
+                return True
+            i += 1
+        return False
+
+    def _flush(self):
+        """Send the waiting keys, oldest first; a key still down from before keeps waiting"""
+        waiting = self.waiting
+        i = 0
+        while i < len(waiting):
+            key, hold = waiting[i]
+            if self.held_keys.press(key, hold):
+                self.keys.inc()
+                del waiting[i]
+            else:
+                i += 1
+
+    # ------------------------------------------------------------------ stop
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _stop(self):
+        self._cancel_timer()
+        if self.pitch == 'high':
+            self._lift()
+        elif self.key is not None:
+            self.held_keys.release(self.key)
+        self.pitch = None
+
+    def stop(self):
+        """Silence the whistle (lever back in the deadzone, or shutdown)"""
+        with self._lock:
+            self._stop()
+            self._flush()
+            # Anything still waiting can't go out (presses are off after a focus
+            # loss or at shutdown)
+            self.waiting.clear()
+
+    @property
+    def sounding(self):
+        return self.pitch is not None